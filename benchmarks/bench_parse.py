@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import pypdf
+import fitz
+import tabula
+from pdf_parser import parse
+
+def legacy_parse(filename, output_dir):
+    """
+    The original three-pass parse(): pypdf for text, PyMuPDF for images and
+    tabula over every page for tables. Kept here as the baseline.
+    """
+    image_dir = os.path.join(output_dir, "images")
+    os.makedirs(image_dir, exist_ok=True)
+
+    text = ""
+    with open(filename, "rb") as file:
+        pdf_reader = pypdf.PdfReader(file)
+        pages = len(pdf_reader.pages)
+        for page in pdf_reader.pages:
+            text += page.extract_text() + "\n\n"
+    with open(os.path.join(output_dir, "pdf_text.txt"), "w", encoding="utf-8") as file:
+        file.write(text)
+
+    pdf_document = fitz.open(filename)
+    for page_num in range(len(pdf_document)):
+        page = pdf_document[page_num]
+        for img_index, img in enumerate(page.get_images(full=True)):
+            base_image = pdf_document.extract_image(img[0])
+            image_path = os.path.join(image_dir, f"page{page_num+1}_img{img_index+1}.{base_image['ext']}")
+            with open(image_path, "wb") as img_file:
+                img_file.write(base_image["image"])
+
+    try:
+        tables = tabula.read_pdf(filename, pages='all', multiple_tables=True)
+        tables_data = [{"table_id": i + 1, "data": t.to_dict(orient='records')} for i, t in enumerate(tables)]
+        with open(os.path.join(output_dir, "pdf_tables.json"), "w", encoding="utf-8") as f:
+            json.dump(tables_data, f, indent=2, default=str)
+    except Exception as e:
+        print(f"Error extracting tables: {e}")
+    return pages
+
+def run(label, parse_fn, pdfs, repeat):
+    best = None
+    for _ in range(repeat):
+        pages = 0
+        start = time.perf_counter()
+        for pdf in pdfs:
+            output_dir = tempfile.mkdtemp(prefix="bench-")
+            try:
+                pages += parse_fn(pdf, output_dir)
+            finally:
+                shutil.rmtree(output_dir, ignore_errors=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<10} {pages:>6} pages  {best:8.2f}s  {pages / best:8.2f} pages/sec")
+    return pages / best
+
+def main(corpus="./src/pdf_input", repeat=3):
+    pdfs = [os.path.join(corpus, f) for f in sorted(os.listdir(corpus)) if f.endswith(".pdf")]
+    print(f"Benchmarking {len(pdfs)} PDFs from {corpus} (best of {repeat})")
+    # Warm up the JVM so neither side pays its startup cost
+    tabula.read_pdf(pdfs[0], pages=1)
+    legacy = run("legacy", legacy_parse, pdfs, repeat)
+    current = run("parse", lambda pdf, out: parse(pdf, output_dir=out)["pages"], pdfs, repeat)
+    print(f"Speedup: {current / legacy:.2f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare parse() against the original three-pass extraction")
+    parser.add_argument("--corpus", default="./src/pdf_input", help="Directory of sample PDFs")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation, the best is reported")
+    args = parser.parse_args()
+    main(corpus=args.corpus, repeat=args.repeat)
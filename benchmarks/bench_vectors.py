@@ -0,0 +1,138 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+import json
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+import numpy as np
+from tools.quantized_index import QuantizedIndex, normalize
+
+try:
+    import chromadb
+except ImportError:
+    chromadb = None
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+# (imports, timed statement) opening an index and running one query; run in
+# a fresh interpreter so the load isn't served from the building process's caches
+LOAD_SCRIPTS = {
+    "chroma": ("import chromadb",
+               'chromadb.PersistentClient(path=path).get_collection("bench").query('
+               'query_embeddings=[probe.tolist()], n_results=k)'),
+    "quantized": ("from tools.quantized_index import QuantizedIndex",
+                  "QuantizedIndex(path).search(probe, k=k)")
+}
+
+def synthetic_vectors(count, dim, clusters, queries, seed=0):
+    # Clustered unit vectors look more like real embeddings than uniform noise
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    data = normalize(centers[rng.integers(0, clusters, count)] + 0.35 * rng.normal(size=(count, dim)))
+    probes = normalize(data[rng.integers(0, count, queries)] + 0.15 * rng.normal(size=(queries, dim)))
+    return data, probes
+
+def directory_mb(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files) / 1_048_576
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+def run_queries(search, probes):
+    found = []
+    start = time.perf_counter()
+    for probe in probes:
+        found.append(search(probe))
+    elapsed = time.perf_counter() - start
+    return found, len(probes) / elapsed if elapsed else 0.0
+
+def cold_load_seconds(backend, path, probe_file, k):
+    imports, statement = LOAD_SCRIPTS[backend]
+    script = "\n".join([
+        "import sys, time", f"sys.path.append({SRC_DIR!r})", "import numpy as np", imports,
+        f"path, k, probe = {path!r}, {k}, np.load({probe_file!r})",
+        "start = time.perf_counter()", statement, "print(time.perf_counter() - start)"
+    ])
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def bench_chroma(workspace, data, probes, k, probe_file, batch_size=5000):
+    path = os.path.join(workspace, "chroma")
+    start = time.perf_counter()
+    client = chromadb.PersistentClient(path=path)
+    collection = client.create_collection("bench")
+    for i in range(0, len(data), batch_size):
+        collection.add(ids=[str(j) for j in range(i, min(i + batch_size, len(data)))],
+                       embeddings=data[i:i + batch_size].tolist(),
+                       documents=[str(j) for j in range(i, min(i + batch_size, len(data)))])
+    build = time.perf_counter() - start
+    load = cold_load_seconds("chroma", path, probe_file, k)
+
+    found, qps = run_queries(
+        lambda probe: [int(i) for i in collection.query(query_embeddings=[probe.tolist()], n_results=k)["ids"][0]], probes)
+    return {"build_seconds": build, "load_seconds": load, "disk_mb": directory_mb(path), "qps": qps}, found
+
+def bench_quantized(workspace, data, probes, k, quantization, probe_file, batch_size=5000):
+    path = os.path.join(workspace, quantization)
+    start = time.perf_counter()
+    index = QuantizedIndex(path, quantization=quantization)
+    for i in range(0, len(data), batch_size):
+        ids = [str(j) for j in range(i, min(i + batch_size, len(data)))]
+        index.add(ids, data[i:i + batch_size], ids, [{} for _ in ids])
+    index.retrain()
+    build = time.perf_counter() - start
+    load = cold_load_seconds("quantized", path, probe_file, k)
+    index = QuantizedIndex(path)
+
+    results = {"build_seconds": build, "load_seconds": load, "disk_mb": directory_mb(path)}
+    found = {}
+    for rerank in (False, True):
+        found[rerank], results["qps_rerank" if rerank else "qps"] = run_queries(
+            lambda probe: [int(r["content"]) for r in index.search(probe, k=k, rerank=rerank)], probes)
+    return results, found
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare recall@k and QPS of QuantizedIndex against Chroma")
+    parser.add_argument("--vectors", type=int, default=100000, help="Number of vectors indexed")
+    parser.add_argument("--dim", type=int, default=768, help="Vector dimensions (nomic-embed-text uses 768)")
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    data, probes = synthetic_vectors(args.vectors, args.dim, args.clusters, args.queries, seed=args.seed)
+    # Exact nearest neighbours by brute force are the ground truth
+    truth = [np.argsort(-(data @ probe))[:args.k].tolist() for probe in probes]
+
+    workspace = tempfile.mkdtemp(prefix="bench_vectors_")
+    report = {"parameters": {key: value for key, value in vars(args).items() if key != "output"}, "results": {}}
+    try:
+        probe_file = os.path.join(workspace, "probe.npy")
+        np.save(probe_file, probes[0])
+        if chromadb is None:
+            print("chromadb is not installed, only the quantized backends are measured")
+        else:
+            results, found = bench_chroma(workspace, data, probes, args.k, probe_file)
+            results["recall"] = recall(found, truth)
+            report["results"]["chroma"] = results
+        for quantization in ("int8", "pq"):
+            results, found = bench_quantized(workspace, data, probes, args.k, quantization, probe_file)
+            results["recall"] = recall(found[False], truth)
+            results["recall_rerank"] = recall(found[True], truth)
+            report["results"][quantization] = results
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    print(f"{'backend':<8} {'recall@' + str(args.k):>10} {'QPS':>9} {'reranked':>9} {'QPS':>9} {'disk MB':>9} {'load s':>8}")
+    for backend, results in report["results"].items():
+        print(f"{backend:<8} {results['recall']:>10.3f} {results['qps']:>9.1f} "
+              f"{results.get('recall_rerank', float('nan')):>9.3f} {results.get('qps_rerank', float('nan')):>9.1f} "
+              f"{results['disk_mb']:>9.1f} {results['load_seconds']:>8.3f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
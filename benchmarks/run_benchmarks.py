@@ -0,0 +1,248 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import json
+import time
+import random
+import shutil
+import platform
+import resource
+import tempfile
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from synthetic_corpus import generate_corpus, WORDS
+from stand_ins import HashEmbeddings, EchoLLM, SQLitePool
+import pdf_parser
+import ingestion.embedding_cache
+import ingestion.image_describer
+import tools.retrieval
+from tools import tracing
+from tools.tools import similarity_search
+from tools.table_index import TableIndex
+from tools.catalog import format_schema_catalog
+from tools.context_packer import estimate_tokens
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def use_stand_ins(workspace):
+    """
+    Swap the Ollama models and the PostgreSQL pool for local stand-ins so the
+    benchmark runs offline and gives the same numbers for the same code.
+    """
+    ingestion.embedding_cache.OllamaEmbeddings = HashEmbeddings
+    tools.retrieval.OllamaEmbeddings = HashEmbeddings
+    ingestion.image_describer.OllamaLLM = EchoLLM
+    pool = SQLitePool(os.path.join(workspace, "tables.sqlite3"))
+    pdf_parser.get_pool = lambda conn_str, **kwargs: pool
+    tracing.configure(enabled=False)
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def peak_rss_mb():
+    # VmHWM is the peak resident set since it was last reset; ru_maxrss (kilobytes
+    # on Linux, bytes on macOS) is the peak over the whole process
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1_048_576 if sys.platform == "darwin" else 1024)
+
+def reset_peak_rss():
+    # Linux only; elsewhere each stage reports the peak so far
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def measure(stage):
+    """
+    Run a stage and return its result, wall time and peak resident memory in
+    MB. Memory is read from the OS rather than traced, so the timing runs at
+    full speed.
+    """
+    reset_peak_rss()
+    start = time.perf_counter()
+    result = stage()
+    elapsed = time.perf_counter() - start
+    return result, elapsed, peak_rss_mb()
+
+def synthetic_tables(path, tables, rows, seed=0):
+    # Same shape of records parse() writes to pdf_tables.jsonl
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for table_id in range(1, tables + 1):
+            data = [{
+                "Item": rng.choice(WORDS),
+                "Code": f"SKU-{rng.randint(1000, 9999)}",
+                "Quantity": str(rng.randint(1, 500)),
+                "Price": f"${rng.uniform(1, 999):,.2f}",
+                "Shipped": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+            } for _ in range(rows)]
+            f.write(json.dumps({"table_id": table_id, "source": "synthetic.pdf", "page": 1, "bbox": "0,0,0,0",
+                                "context": " ".join(rng.sample(WORDS, 6)), "data": data}) + "\n")
+
+def run(documents=5, pages=20, image_size=256, tables=20, table_rows=500, queries=200, k=5, seed=0):
+    results = {}
+    workspace = tempfile.mkdtemp(prefix="pdf_search_bench_")
+    cwd = os.getcwd()
+    try:
+        # The index_state caches are relative paths, so keep them inside the workspace
+        os.chdir(workspace)
+        use_stand_ins(workspace)
+        persist_directory = os.path.join(workspace, "text_embeddings")
+
+        pdfs, elapsed, peak = measure(lambda: generate_corpus(
+            os.path.join(workspace, "corpus"), documents=documents, pages=pages, seed=seed, image_size=image_size))
+        results["corpus"] = {"documents": len(pdfs), "pages": documents * pages, "seconds": elapsed}
+
+        outputs = []
+        def parse_all():
+            total = 0
+            for pdf in pdfs:
+                output_dir = os.path.join(workspace, "parsed", pdf_parser.document_slug(pdf))
+                total += pdf_parser.parse(pdf, output_dir)["pages"]
+                outputs.append((pdf, output_dir))
+            return total
+        total_pages, elapsed, peak = measure(parse_all)
+        results["parse"] = {"pages": total_pages, "seconds": elapsed,
+                            "pages_per_sec": total_pages / elapsed if elapsed else 0.0, "peak_rss_mb": peak}
+
+        def describe_all():
+            stats = {"described": 0, "reused": 0, "skipped": 0}
+            for _, output_dir in outputs:
+                for key, value in pdf_parser.describe_image(os.path.join(output_dir, "images")).items():
+                    stats[key] += value
+            return stats
+        image_stats, elapsed, peak = measure(describe_all)
+        results["images"] = dict(image_stats, seconds=elapsed, peak_rss_mb=peak)
+
+        def embed_all():
+            chunks = duplicates = 0
+            for pdf, output_dir in outputs:
+                stats = pdf_parser.embeddings(output_dir, persist_directory=persist_directory,
+                                              doc_id=pdf_parser.document_slug(pdf))
+                chunks += stats["chunks"]
+                duplicates += stats["duplicates"]
+            return chunks, duplicates
+        (chunks, duplicates), elapsed, peak = measure(embed_all)
+        results["embed"] = {"chunks": chunks, "duplicates": duplicates, "seconds": elapsed,
+                            "chunks_per_sec": chunks / elapsed if elapsed else 0.0, "peak_rss_mb": peak}
+
+        tables_file = os.path.join(workspace, "pdf_tables.jsonl")
+        synthetic_tables(tables_file, tables, table_rows, seed=seed)
+        created, elapsed, peak = measure(lambda: pdf_parser.tables_to_db(tables_file, doc_id="synthetic"))
+        rows = sum(info["rows"] for info in created.values())
+        results["tables"] = {"tables": len(created), "rows": rows, "seconds": elapsed,
+                             "rows_per_sec": rows / elapsed if elapsed else 0.0, "peak_rss_mb": peak}
+
+        rng = random.Random(seed)
+        questions = [" ".join(rng.sample(WORDS, 3)) if i % 4 else f"SKU-{rng.randint(1000, 9999)}"
+                     for i in range(queries)]
+
+        # Finding candidate tables for a question, and how much smaller their
+        # description is than the whole schema
+        embedder = HashEmbeddings()
+        table_index = TableIndex(os.path.join(workspace, "table_index.sqlite3"))
+        _, index_seconds, _ = measure(lambda: table_index.sync(created, embedder.embed_documents, 0))
+        def lookup_all():
+            latencies = []
+            for question in questions:
+                start = time.perf_counter()
+                table_index.search(embedder.embed_query(question), k=k, names=created)
+                latencies.append((time.perf_counter() - start) * 1000)
+            return latencies
+        latencies, elapsed, peak = measure(lookup_all)
+        top = [name for _, name in table_index.search(embedder.embed_query(questions[0]), k=k)]
+        results["table_lookup"] = {
+            "tables": len(created), "index_seconds": index_seconds, "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95), "peak_rss_mb": peak,
+            "full_schema_tokens": estimate_tokens(format_schema_catalog({"tables": created}, schema="public")),
+            "top_k_tokens": estimate_tokens(format_schema_catalog(
+                {"tables": {name: created[name] for name in top}}, schema="public", details=True, order=top))
+        }
+        for mode in ("vector", "lexical", "hybrid"):
+            def search_all():
+                latencies = []
+                for question in questions:
+                    start = time.perf_counter()
+                    similarity_search(question, persist_directory=persist_directory, k=k, mode=mode)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                return latencies
+            latencies, elapsed, peak = measure(search_all)
+            results[f"query_{mode}"] = {"queries": len(latencies), "p50_ms": percentile(latencies, 50),
+                                        "p95_ms": percentile(latencies, 95), "peak_rss_mb": peak}
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mb"] = maxrss / (1_048_576 if sys.platform == "darwin" else 1024)
+    return results
+
+def compare(previous, current):
+    # Print every numeric metric side by side with the change in percent
+    for stage, metrics in current["results"].items():
+        if not isinstance(metrics, dict):
+            metrics, stage_before = {"value": metrics}, {"value": previous["results"].get(stage)}
+        else:
+            stage_before = previous["results"].get(stage, {})
+        for name, value in metrics.items():
+            before = stage_before.get(name)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            change = f"{(value - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{stage + '.' + name:<28} {before:>12.2f} -> {value:>12.2f}  {change}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ingestion and query benchmarks on a synthetic corpus")
+    parser.add_argument("--documents", type=int, default=5, help="Number of synthetic PDFs")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per PDF")
+    parser.add_argument("--image-size", type=int, default=256, help="Side of the embedded images in pixels")
+    parser.add_argument("--tables", type=int, default=20, help="Number of synthetic tables to load")
+    parser.add_argument("--table-rows", type=int, default=500, help="Rows per synthetic table")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per search mode")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = run(documents=args.documents, pages=args.pages, image_size=args.image_size, tables=args.tables,
+                  table_rows=args.table_rows, queries=args.queries, seed=args.seed)
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key != "compare"},
+        "results": results
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{commit}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results saved to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
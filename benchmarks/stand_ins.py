@@ -0,0 +1,69 @@
+import re
+import math
+import sqlite3
+import hashlib
+from decimal import Decimal
+from contextlib import contextmanager
+import pandas as pd
+from typing import List
+from langchain_core.embeddings import Embeddings
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic local stand-in for OllamaEmbeddings: a hashed bag of words,
+    normalized to unit length, so similar texts still land near each other.
+    """
+
+    def __init__(self, model="nomic-embed-text", dimensions=256, **kwargs):
+        self.model = model
+        self.dimensions = dimensions
+
+    def _embed(self, text):
+        vector = [0.0] * self.dimensions
+        for token in re.findall(r"\w+", text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.dimensions] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+class EchoLLM:
+    """
+    Stand-in for OllamaLLM that answers instantly with a fixed string.
+    """
+
+    def __init__(self, model="llm", **kwargs):
+        self.model = model
+
+    def bind(self, **kwargs):
+        return self
+
+    def invoke(self, prompt, **kwargs):
+        return f"Synthetic description from {self.model}."
+
+class SQLitePool:
+    """
+    Stand-in for tools.db.ConnectionPool backed by an SQLite file, with a
+    "public" schema attached so the PostgreSQL-style names keep working.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # sqlite3 has no native binding for the types infer_column produces
+        sqlite3.register_adapter(Decimal, str)
+        sqlite3.register_adapter(pd.Timestamp, lambda value: value.isoformat())
+
+    @contextmanager
+    def connection(self):
+        conn = sqlite3.connect(self.path)
+        conn.execute(f"ATTACH DATABASE '{self.path}.public' AS public")
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            conn.close()
@@ -0,0 +1,108 @@
+import os
+import random
+import argparse
+import fitz
+
+WORDS = (
+    "invoice shipment warranty pallet supplier quarterly revenue margin discount "
+    "inventory product catalog customer order delivery region forecast contract "
+    "maintenance schedule component assembly voltage tolerance specification"
+).split()
+
+def paragraph(rng, words=80):
+    text = []
+    for _ in range(words):
+        # Sprinkle in part numbers so lexical search has codes to find
+        if rng.random() < 0.03:
+            text.append(f"SKU-{rng.randint(1000, 9999)}")
+        else:
+            text.append(rng.choice(WORDS))
+    sentence = " ".join(text)
+    return sentence[0].upper() + sentence[1:] + "."
+
+def draw_table(page, rng, top, rows, cols=4, width=480, row_height=18):
+    left = 60
+    col_width = width / cols
+    headers = ["Item", "Code", "Quantity", "Price"][:cols]
+    for r in range(rows + 1):
+        y = top + r * row_height
+        page.draw_line((left, y), (left + width, y))
+        for c in range(cols):
+            if r == 0:
+                cell = headers[c]
+            elif c == 0:
+                cell = rng.choice(WORDS)
+            elif c == 1:
+                cell = f"SKU-{rng.randint(1000, 9999)}"
+            elif c == 2:
+                cell = str(rng.randint(1, 500))
+            else:
+                cell = f"{rng.uniform(1, 999):.2f}"
+            page.insert_text((left + c * col_width + 4, y + row_height - 5), cell, fontsize=9)
+    bottom = top + (rows + 1) * row_height
+    page.draw_line((left, bottom), (left + width, bottom))
+    for c in range(cols + 1):
+        x = left + c * col_width
+        page.draw_line((x, top), (x, bottom))
+    return bottom
+
+def image_bytes(rng, size):
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, size, size), False)
+    pixmap.set_rect(pixmap.irect, (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    # A few stripes so the images aren't all perceptually identical
+    for i in range(0, size, max(1, size // 8)):
+        pixmap.set_rect(fitz.IRect(i, 0, i + max(1, size // 16), size), (rng.randint(0, 255), 0, rng.randint(0, 255)))
+    # Low-order noise keeps the stripes but stops PNG from compressing the
+    # image below the describer's size threshold, as photos and scans don't
+    samples = bytes((value & 0xE0) | (noise & 0x1F) for value, noise in zip(pixmap.samples, rng.randbytes(len(pixmap.samples))))
+    return fitz.Pixmap(fitz.csRGB, size, size, samples, False).tobytes("png")
+
+def generate_pdf(path, pages, rng, tables_every=3, images_every=2, image_size=256):
+    """
+    Write one synthetic PDF with text on every page, a ruled table every
+    tables_every pages and an image of image_size pixels every images_every pages.
+    """
+    document = fitz.open()
+    for page_num in range(pages):
+        page = document.new_page()
+        y = 60
+        page.insert_text((60, y), f"Section {page_num + 1}: {rng.choice(WORDS).title()} report", fontsize=14)
+        y += 20
+        # insert_textbox writes nothing at all if the text overflows, so keep it well inside the box
+        box = fitz.Rect(60, y, 540, y + 260)
+        page.insert_textbox(box, "\n\n".join(paragraph(rng, words=50) for _ in range(3)), fontsize=10)
+        y += 270
+        if tables_every and page_num % tables_every == 0:
+            y = draw_table(page, rng, y, rows=rng.randint(4, 10)) + 20
+        if images_every and page_num % images_every == 0 and y < 600:
+            page.insert_image(fitz.Rect(60, y, 60 + 150, y + 150), stream=image_bytes(rng, image_size))
+        # Repeated footer, as real documents have
+        page.insert_text((60, 800), "Confidential - for internal use only", fontsize=8)
+    document.save(path)
+    document.close()
+
+def generate_corpus(output_dir, documents=5, pages=20, seed=0, **kwargs):
+    """
+    Generate a reproducible corpus of synthetic PDFs.
+    
+    Returns:
+        list: Paths of the generated PDFs
+    """
+    rng = random.Random(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(output_dir, f"synthetic_{i + 1:03d}.pdf")
+        generate_pdf(path, pages, rng, **kwargs)
+        paths.append(path)
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF corpus")
+    parser.add_argument("output_dir")
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--image-size", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate_corpus(args.output_dir, documents=args.documents, pages=args.pages, seed=args.seed, image_size=args.image_size)
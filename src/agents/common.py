@@ -0,0 +1,34 @@
+from functools import lru_cache
+from langchain_ollama import OllamaLLM
+from langchain_core.prompts import PromptTemplate
+
+# Vendored copy of the "hwchase17/react" prompt from the LangChain hub so that
+# building an agent needs no network access.
+REACT_TEMPLATE = """Answer the following questions as best you can. You have access to the following tools:
+
+{tools}
+
+Use the following format:
+
+Question: the input question you must answer
+Thought: you should always think about what to do
+Action: the action to take, should be one of [{tool_names}]
+Action Input: the input to the action
+Observation: the result of the action
+... (this Thought/Action/Action Input/Observation can repeat N times)
+Thought: I now know the final answer
+Final Answer: the final answer to the original input question
+
+Begin!
+
+Question: {input}
+Thought:{agent_scratchpad}"""
+
+REACT_PROMPT = PromptTemplate.from_template(REACT_TEMPLATE)
+
+@lru_cache(maxsize=None)
+def get_llm(model="gemma3:27b", **kwargs):
+    """
+    Return a shared OllamaLLM client for a model and settings, creating it on first use.
+    """
+    return OllamaLLM(model=model, **kwargs)
@@ -1,55 +1,61 @@
-from langchain_ollama import OllamaLLM
+from functools import lru_cache
 from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import Tool
 from langchain.agents import AgentExecutor, create_react_agent
-from langchain import hub
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from tools.tools import similarity_search
+from tools.tools import retrieve_context
+from agents.common import REACT_PROMPT, get_llm
+from tools.tracing import traced, tracing_config
 
-def find_context_agent(user_query="",model="gemma3:27b", debug=False):
-    llm = OllamaLLM(
+@lru_cache(maxsize=None)
+def build_find_context_executor(model="gemma3:27b", debug=False):
+    """
+    Build the find_context agent once per model and reuse it for every query.
+    """
+    llm = get_llm(
         model=model,
         #base_url="http://localhost:11434",
         #max_tokens=1024,
         #temperature=0.0
     )
 
-    template = f"""Here is the user query: {user_query}
-    Please find the most relevant information to the user query from the vector store.
-    """
-
-    prompt_template = PromptTemplate(
-        input_variables=["user_query"],
-        template=template,
-    )
-    
     tools_for_agent = [
         Tool(
             name="similarity_search",
-            func=similarity_search,
+            func=retrieve_context,
             description="Search the vector store for the most relevant information to the user query",
         )
     ]
 
-    react_prompt = hub.pull("hwchase17/react")
-
     agent = create_react_agent(
         llm=llm,
         tools=tools_for_agent,
-        prompt=react_prompt,
+        prompt=REACT_PROMPT,
     )
     
-    agent_executor = AgentExecutor(
+    return AgentExecutor(
         agent=agent,
         tools=tools_for_agent,
         verbose=debug,
         handle_parse_errors=True
     )
-    
+
+@traced("agent")
+def find_context_agent(user_query="",model="gemma3:27b", debug=False):
+    template = """Here is the user query: {user_query}
+    Please find the most relevant information to the user query from the vector store.
+    """
+
+    prompt_template = PromptTemplate(
+        input_variables=["user_query"],
+        template=template,
+    )
+
+    agent_executor = build_find_context_executor(model, debug)
     formatted_prompt = prompt_template.format(user_query=user_query)
-    results = agent_executor.invoke({"input": formatted_prompt})
+    results = agent_executor.invoke({"input": formatted_prompt}, config=tracing_config())
     
     if debug:
         print(results["output"])
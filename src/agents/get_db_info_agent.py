@@ -1,37 +1,34 @@
-from langchain_ollama import OllamaLLM
+from functools import lru_cache
 from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import Tool
 from langchain.agents import AgentExecutor, create_react_agent
-from langchain import hub
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from tools.tools import list_tables_and_columns, query_db
+from tools.tools import list_tables_and_columns, query_db, find_tables
+from tools.catalog import load_schema_catalog, format_schema_catalog, schema_name, active_namespace
+from agents.common import REACT_PROMPT, get_llm
+from tools.tracing import traced, annotate, tracing_config
 
-def get_db_info_agent(model="gemma3:27b", debug=False):
-    llm = OllamaLLM(
+@lru_cache(maxsize=None)
+def build_get_db_info_executor(model="gemma3:27b", debug=False):
+    """
+    Build the get_db_info agent once per model and reuse it for every query.
+    """
+    llm = get_llm(
         model=model,
         #base_url="http://localhost:11434",
         #max_tokens=1024,
         #temperature=0.0
 
     )
-    template = """Find information such as database names, schema names, table names, and column names about the database by sending it a query.
-    The database is a Microsoft SQL Server database. Use a query that should work on any Postgresql database.
-
-    ***YOUR QUERIES SHOULD NOT HAVE ANY FORMATTING SUCH AS NEW LINES, SINGLE OR DOUBLE QUOTES TO DENOTE A STRING OR ANYTHING EXCEPT THE QUERY.***
-
-    ***If an error occurs please try again with a different query.
-    ***All queries should be one line.
-    ***Do not assume anything about the database schema except the following:
-    1. There is a databse called table_db
-    2. Inside of table_db there is a schema called public
-    3. Inside of public there are tables. All of the relevant information will be in these tables."""
-    prompt_template = PromptTemplate(
-        template=template,
-    )
 
     tools_for_agent = [
+        Tool(
+            name="find_tables",
+            func=find_tables,
+            description="Find the few tables most relevant to a question, with their columns and sample rows"
+        ),
         Tool(
             name="list_tables_and_columns",
             func=list_tables_and_columns,
@@ -44,27 +41,61 @@ def get_db_info_agent(model="gemma3:27b", debug=False):
         )
     ]
 
-    react_prompt = hub.pull("hwchase17/react")
-
     agent = create_react_agent(
         llm=llm,
         tools=tools_for_agent,
-        prompt=react_prompt,
+        prompt=REACT_PROMPT,
     )
 
-    agent_executor = AgentExecutor(
+    return AgentExecutor(
         agent=agent,
         tools=tools_for_agent,
         verbose=debug
     )
 
+@traced("agent")
+def get_db_info_agent(model="gemma3:27b", debug=False):
+    template = """Find information such as database names, schema names, table names, and column names about the database by sending it a query.
+    The database is a Microsoft SQL Server database. Use a query that should work on any Postgresql database.
+
+    ***YOUR QUERIES SHOULD NOT HAVE ANY FORMATTING SUCH AS NEW LINES, SINGLE OR DOUBLE QUOTES TO DENOTE A STRING OR ANYTHING EXCEPT THE QUERY.***
+
+    ***If an error occurs please try again with a different query.
+    ***All queries should be one line.
+    ***Do not assume anything about the database schema except the following:
+    1. There is a databse called table_db
+    2. Inside of table_db there is a schema called {schema_name}
+    3. Inside of {schema_name} there are tables. All of the relevant information will be in these tables."""
+    prompt_template = PromptTemplate(
+        template=template,
+    )
+
+    agent_executor = build_get_db_info_executor(model, debug)
     results = agent_executor.invoke(
-        {"input": prompt_template.format()}
+        {"input": prompt_template.format(schema_name=schema_name(active_namespace()))},
+        config=tracing_config()
     )
     if debug:
         print(results["output"])
     return results["output"]
 
+@traced("tool")
+def get_db_info(tool_input="", debug=False, k=5):
+    """
+    Describe the database from the schema catalog written by pdf_parser, so no
+    agent loop is needed. Given a question, only the k tables most relevant
+    to it are described (see find_tables); without one every table is.
+    Falls back to get_db_info_agent when there is no catalog for the current
+    ingestion generation.
+    """
+    catalog = load_schema_catalog()
+    annotate(cache_hit=catalog is not None)
+    if catalog is not None:
+        if tool_input.strip():
+            return find_tables(tool_input, k=k)
+        return format_schema_catalog(catalog)
+    return get_db_info_agent(debug=debug)
+
 
 if __name__ == "__main__":
-    print(get_db_info_agent(debug=True))
\ No newline at end of file
+    print(get_db_info_agent(debug=True))
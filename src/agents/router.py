@@ -0,0 +1,149 @@
+import re
+from langchain_core.prompts import PromptTemplate
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.tools import query_db, rank_tables
+from tools.retrieval import get_retrieval_service, HYBRID_DEPTH
+from tools.catalog import load_schema_catalog, format_schema_catalog, schema_name, active_namespace
+from tools.context_packer import pack_context, truncate_to_budget, estimate_tokens
+from tools.answer_cache import is_refusal
+from tools.tracing import span, annotate, tracing_config
+
+SQL_TEMPLATE = """You write PostgreSQL queries for a database called table_db.
+Here are the relevant tables in the {schema_name} schema:
+{schema}
+
+Write one SELECT query that answers this question: {user_query}
+Respond with only the query on a single line, without any formatting or explanation."""
+
+ANSWER_TEMPLATE = """Answer the user's question using only the information below. If the information does not contain the answer, say so.
+
+{evidence}
+
+Question: {user_query}
+Answer:"""
+
+def distance_to_similarity(distance):
+    # Chroma's default metric is squared L2, and Ollama returns unit-length
+    # embeddings, so the distance is 2 - 2 * cosine
+    return 1 - distance / 2
+
+class QueryRouter:
+    """
+    Cheap routing in front of the ReAct agent. The question is embedded once
+    and compared with the table index built from the schema catalog and with
+    the closest chunks in the vector store; when one or both clearly match, retrieval
+    and/or a single generated SQL query are run directly and answered with
+    one LLM call, and only unclear questions go to the full agent. The dense
+    results of that search are fused with BM25 results for the evidence, so
+    exact codes still match without searching the vectors twice, and an
+    answer saying the evidence doesn't contain the answer is handed to the
+    agent too.
+    
+    Args:
+        llm: LLM used for SQL generation and the answer
+        threshold (float): Cosine similarity a source needs to be used
+        margin (float): Sources scoring within this of each other are both used
+        k (int): Number of chunks retrieved on the vector route
+        max_tables (int): Number of catalog tables shown to the SQL writer
+        context_budget (int): Approximate tokens of document context in the answer prompt
+        sql_budget (int): Approximate tokens of query results in the answer prompt
+    """
+
+    def __init__(self, llm, threshold=0.55, margin=0.05, k=5, max_tables=3, context_budget=1500, sql_budget=1000):
+        self.llm = llm
+        self.threshold = threshold
+        self.margin = margin
+        self.k = k
+        self.max_tables = max_tables
+        self.context_budget = context_budget
+        self.sql_budget = sql_budget
+        self.retrieval = get_retrieval_service()
+        self.sql_prompt = PromptTemplate(input_variables=["schema_name", "schema", "user_query"], template=SQL_TEMPLATE)
+        self.answer_prompt = PromptTemplate(input_variables=["evidence", "user_query"], template=ANSWER_TEMPLATE)
+
+    def classify(self, query):
+        """
+        Returns:
+            tuple: (route, details) where route is "vector", "sql", "both" or
+                "agent" and details holds what the chosen route needs
+        """
+        with span("classify", "internal") as current:
+            route, details = self._classify(query)
+            if current is not None:
+                current.set(route=route, sql_score=round(details["sql_score"], 3), vector_score=round(details["vector_score"], 3))
+        return route, details
+
+    def _classify(self, query):
+        catalog = load_schema_catalog()
+        ranked_tables = rank_tables(query, catalog, k=self.max_tables) if catalog else []
+        sql_score = ranked_tables[0][0] if ranked_tables else 0.0
+
+        # Deep enough to be reused as the dense half of the hybrid search in answer()
+        chunks = self.retrieval.search(query, k=self.k * HYBRID_DEPTH)
+        vector_score = distance_to_similarity(chunks[0]["score"]) if chunks else 0.0
+
+        details = {
+            "sql_score": sql_score,
+            "vector_score": vector_score,
+            "chunks": chunks,
+            "tables": [name for score, name in ranked_tables if score >= self.threshold],
+            "catalog": catalog
+        }
+        sql_ok = sql_score >= self.threshold
+        vector_ok = vector_score >= self.threshold
+        if sql_ok and vector_ok and abs(sql_score - vector_score) <= self.margin:
+            return "both", details
+        if sql_ok and sql_score > vector_score:
+            return "sql", details
+        if vector_ok:
+            return "vector", details
+        return "agent", details
+
+    def _run_sql(self, query, details):
+        catalog = details["catalog"]
+        subset = {"tables": {name: catalog["tables"][name] for name in details["tables"]}}
+        schema = schema_name(active_namespace())
+        tables = format_schema_catalog(subset, schema=schema, details=True, order=details["tables"])
+        sql = self.llm.invoke(self.sql_prompt.format(schema_name=schema, schema=tables, user_query=query),
+                              config=tracing_config())
+        # Models like to wrap queries in code fences anyway
+        sql = re.sub(r"^```(?:sql)?|```$", "", sql.strip(), flags=re.IGNORECASE).strip()
+        rows = query_db(sql)
+        if rows.startswith("Query error"):
+            return None
+        return f"Result of the query {sql}:\n{truncate_to_budget(rows, self.sql_budget)}"
+
+    def answer(self, query):
+        """
+        Answer a question on a fast route.
+        
+        Returns:
+            tuple: (route, answer) where answer is None if the question has to
+                go to the full agent
+        """
+        route, details = self.classify(query)
+        if route == "agent":
+            return route, None
+
+        evidence = []
+        if route in ("vector", "both"):
+            chunks = self.retrieval.search(query, k=self.k, mode="hybrid", vector_results=details["chunks"])
+            packed = pack_context(chunks, token_budget=self.context_budget)
+            annotate(context_tokens=packed["tokens"], merged=packed["merged"], duplicates=packed["duplicates"])
+            evidence.append("Context from the documents:\n" + packed["text"])
+        if route in ("sql", "both"):
+            sql_evidence = self._run_sql(query, details)
+            if sql_evidence is None and route == "sql":
+                return "agent", None
+            if sql_evidence is not None:
+                evidence.append(sql_evidence)
+
+        prompt = self.answer_prompt.format(evidence="\n\n".join(evidence), user_query=query)
+        annotate(answer_prompt_tokens=estimate_tokens(prompt))
+        output = self.llm.invoke(prompt, config=tracing_config())
+        if is_refusal(output):
+            annotate(refused=True)
+            return "agent", None
+        return route, output
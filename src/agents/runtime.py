@@ -0,0 +1,258 @@
+import time
+import asyncio
+import contextvars
+from collections import defaultdict
+from functools import lru_cache
+from langchain_core.prompts import PromptTemplate
+from langchain_core.tools import Tool
+from langchain.agents import AgentExecutor, create_react_agent
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agents.common import REACT_PROMPT, get_llm
+from agents.get_db_info_agent import get_db_info, build_get_db_info_executor
+from agents.find_context_agent import find_context_agent, build_find_context_executor
+from agents.send_query_agent import send_query_agent, build_send_query_executor
+from agents.router import QueryRouter
+from tools.retrieval import get_retrieval_service
+from tools.answer_cache import AnswerCache
+from tools.catalog import schema_name, active_namespace
+from tools.tracing import span, annotate, format_trace, tracing_config
+
+MAIN_TEMPLATE = """
+    You are a helpful assistant what will use the tools provided to answer the user's question.
+
+    Here is the user's question: {user_query}
+
+    The information will either be found from the context provided or from the database.
+    You can get the context by using the "find_context_agent" tool.
+    You can get the database information by using the "get_db_info_agent" tool with the user's question as input.
+    You can send a query to the database by using the "send_query_agent" tool.
+    Please search all possible sources for the information.
+    Use the database information to write an accurate query.
+     ***YOUR QUERIES SHOULD NOT HAVE ANY FORMATTING SUCH AS NEW LINES, SINGLE OR DOUBLE QUOTES TO DENOTE A STRING OR ANYTHING EXCEPT THE QUERY.***
+
+    ***If an error occurs please try again with a different query.
+    ***All queries should be one line.
+    ***If you need more than one line use multiple queries.
+    ***Do not assume anything about the database except the following:
+    1. There is a databse called table_db
+    2. Inside of table_db there is a schema called {schema_name}
+    3. Inside of {schema_name} there are tables. All of the relevant information will be in these tables
+    """
+
+PARALLEL_TEMPLATE = """
+    You are a helpful assistant answering the user's question.
+
+    Here is the user's question: {user_query}
+
+    Here is the context found in the documents:
+    {context}
+
+    Here is the information about the database:
+    {db_info}
+
+    If the context answers the question, answer from it.
+    Otherwise send a query to the database by using the "send_query_agent" tool, using the database information to write an accurate query.
+     ***YOUR QUERIES SHOULD NOT HAVE ANY FORMATTING SUCH AS NEW LINES, SINGLE OR DOUBLE QUOTES TO DENOTE A STRING OR ANYTHING EXCEPT THE QUERY.***
+
+    ***If an error occurs please try again with a different query.
+    ***All queries should be one line.
+    ***If you need more than one line use multiple queries.
+    """
+
+# Database information gathered for the question being answered, so the
+# send_query_agent tool doesn't look it up a second time
+_current_db_info = contextvars.ContextVar("current_db_info", default="")
+
+def _send_query_with_db_info(user_query=""):
+    return send_query_agent(user_query=user_query, db_info=_current_db_info.get())
+
+class AgentRuntime:
+    """
+    Builds the LLM clients, tools and agents once and answers any number of
+    questions with them, so each question only pays for its own agent run.
+    
+    With use_router, questions first go through QueryRouter, which answers
+    simple document or database lookups directly and leaves the rest to the
+    agent. Latencies are recorded per route.
+    
+    With parallel, questions the router can't handle skip the top-level ReAct
+    loop: context retrieval and database introspection run concurrently and
+    their results are handed to a single answering agent, so a question takes
+    about as long as the slower branch rather than the sum of both.
+    
+    With use_cache, answers are kept in an AnswerCache, so repeated and
+    near-duplicate questions are answered without running anything until the
+    next ingestion or clear changes the corpus.
+    
+    Args:
+        model (str): Ollama model used by the agents
+        debug (bool): Print agent steps and timings
+        use_router (bool): Try the fast routes before the agent
+        parallel (bool): Gather context and database information concurrently
+        use_cache (bool): Answer repeated questions from the answer cache
+    """
+
+    def __init__(self, model="gemma3:27b", debug=False, use_router=True, parallel=False, use_cache=True):
+        start = time.perf_counter()
+        self.debug = debug
+        self.llm = get_llm(
+            model=model,
+            base_url="http://localhost:11434",
+            max_tokens=1024,
+            temperature=0.0
+        )
+
+        self.prompt_template = PromptTemplate(
+            input_variables=["user_query", "schema_name"],
+            template=MAIN_TEMPLATE,
+        )
+
+        tools_for_agent = [
+            Tool(
+                name="find_context_agent",
+                func=find_context_agent,
+                description="Find the context from a vector store for the user's question"
+            ),
+            Tool(
+                name="get_db_info_agent",
+                func=get_db_info,
+                description="Get information about the database tables relevant to the input question: columns, types, row counts, sample rows and the PDF page each table came from"
+            ),
+            Tool(
+                name="send_query_agent",
+                func=send_query_agent,
+                description="Send a query to the database"
+            )
+        ]
+
+        agent = create_react_agent(
+            llm=self.llm,
+            tools=tools_for_agent,
+            prompt=REACT_PROMPT,
+        )
+
+        self.agent_executor = AgentExecutor(
+            agent=agent,
+            tools=tools_for_agent,
+            verbose=debug,
+            handle_parse_errors=True
+        )
+
+        self.parallel = parallel
+        self.parallel_prompt_template = PromptTemplate(
+            input_variables=["user_query", "context", "db_info"],
+            template=PARALLEL_TEMPLATE,
+        )
+        parallel_tools = [
+            Tool(
+                name="send_query_agent",
+                func=_send_query_with_db_info,
+                description="Send a query to the database"
+            )
+        ]
+        self.parallel_executor = AgentExecutor(
+            agent=create_react_agent(llm=self.llm, tools=parallel_tools, prompt=REACT_PROMPT),
+            tools=parallel_tools,
+            verbose=debug,
+            handle_parse_errors=True
+        )
+
+        # Build the nested agents now, with the same arguments the tools call
+        # them with, so the first question doesn't pay for them either
+        build_find_context_executor("gemma3:27b", False)
+        build_get_db_info_executor("gemma3:27b", False)
+        build_send_query_executor("gemma3:27b", False)
+
+        self.router = QueryRouter(self.llm) if use_router else None
+        self.answer_cache = AnswerCache(get_retrieval_service().embed_query) if use_cache else None
+
+        self.startup_seconds = time.perf_counter() - start
+        self.query_seconds = []
+        self.route_seconds = defaultdict(list)
+
+    def answer(self, query, check_cache=True):
+        """
+        Answer a question through the cache, the router or the agents.
+
+        Args:
+            query (str): The user's question
+            check_cache (bool): Look the question up in the answer cache; callers
+                that already missed it pass False. The answer is stored either way.
+
+        Returns:
+            str: The answer
+        """
+        start = time.perf_counter()
+        with span("answer", "query", question_chars=len(query)) as root:
+            route, output = "agent", None
+            if self.answer_cache is not None and check_cache:
+                output = self.answer_cache.lookup(query)
+                if output is not None:
+                    route = "cache"
+
+            if output is None and self.router is not None:
+                try:
+                    route, output = self.router.answer(query)
+                except Exception as e:
+                    if self.debug:
+                        print(f"Router failed, falling back to the agent: {e}")
+                    route, output = "agent", None
+
+            if output is None and self.parallel:
+                route = "parallel"
+                output = asyncio.run(self.aanswer_parallel(query))
+            elif output is None:
+                formatted_prompt = self.prompt_template.format(user_query=query,
+                                                              schema_name=schema_name(active_namespace()))
+                with span("main_agent", "agent"):
+                    results = self.agent_executor.invoke({"input": formatted_prompt}, config=tracing_config())
+                output = results["output"]
+
+            if self.answer_cache is not None and route != "cache":
+                self.answer_cache.store(query, output)
+            annotate(route=route, cache_hit=route == "cache")
+            if root is not None:
+                # Total prompt tokens Ollama reported across every LLM call for this question
+                root.set(prompt_tokens=sum(item.attributes.get("prompt_tokens", 0)
+                                           for _, item in root.walk() if item.kind == "llm"))
+
+        elapsed = time.perf_counter() - start
+        self.query_seconds.append(elapsed)
+        self.route_seconds[route].append(elapsed)
+
+        if self.debug:
+            prompt_tokens = root.attributes.get("prompt_tokens") if root is not None else None
+            print(f"Startup: {self.startup_seconds:.2f}s, query: {elapsed:.2f}s via the {route} route"
+                  + (f", {prompt_tokens} prompt tokens" if prompt_tokens is not None else ""))
+            if root is not None:
+                print(format_trace(root))
+        return output
+
+    async def aanswer_parallel(self, query):
+        """
+        Fetch context from the vector store and describe the database at the
+        same time, then answer from both.
+        """
+        start = time.perf_counter()
+        context, db_info = await asyncio.gather(
+            asyncio.to_thread(find_context_agent, query),
+            asyncio.to_thread(get_db_info, query)
+        )
+        if self.debug:
+            print(f"Context and database information gathered in {time.perf_counter() - start:.2f}s")
+
+        _current_db_info.set(db_info)
+        formatted_prompt = self.parallel_prompt_template.format(user_query=query, context=context, db_info=db_info)
+        # to_thread copies the current context, so the tool sees db_info
+        with span("answer_agent", "agent"):
+            results = await asyncio.to_thread(self.parallel_executor.invoke, {"input": formatted_prompt}, config=tracing_config())
+        return results["output"]
+
+@lru_cache(maxsize=None)
+def get_runtime(model="gemma3:27b", debug=False, parallel=False):
+    """
+    Return the process-wide AgentRuntime, building it on first use.
+    """
+    return AgentRuntime(model=model, debug=debug, parallel=parallel)
@@ -1,42 +1,27 @@
-from langchain_ollama import OllamaLLM
+from functools import lru_cache
 from langchain_core.prompts import PromptTemplate
 from langchain_core.tools import Tool
 from langchain.agents import AgentExecutor, create_react_agent
-from langchain import hub
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from tools.tools import query_db
-from agents.get_db_info_agent import get_db_info_agent
+from tools.catalog import schema_name, active_namespace
+from agents.get_db_info_agent import get_db_info
+from agents.common import REACT_PROMPT, get_llm
+from tools.tracing import traced, tracing_config
 
-def send_query_agent(user_query="",model="gemma3:27b", db_info="", debug=False):
-    llm = OllamaLLM(
+@lru_cache(maxsize=None)
+def build_send_query_executor(model="gemma3:27b", debug=False):
+    """
+    Build the send_query agent once per model and reuse it for every query.
+    """
+    llm = get_llm(
         model=model,
         #base_url="http://localhost:11434",
         #max_tokens=1024,
         #temperature=0.0
     )
-    template = f"""Here is what the user wants: {user_query}. 
-    Here is some information about the database you should reference to complete the users request: {db_info}
-    Please accomplish the task by sending a query to the database.
-
-    The database is a Microsoft SQL Server database.
-    Use a query that should work on any Microsoft SQL Server database.
-
-    ***YOUR QUERIES SHOULD NOT HAVE ANY FORMATTING SUCH AS NEW LINES, SINGLE OR DOUBLE QUOTES TO DENOTE A STRING OR ANYTHING EXCEPT THE QUERY.***
-
-    ***If an error occurs please try again with a different query.
-    ***All queries should be one line.
-    ***If you need more than one line use multiple queries.
-    ***Do not assume anything about the database except the following:
-    1. There is a databse called table_db
-    2. Inside of table_db there is a schema called public
-    3. Inside of public there are tables. All of the relevant information will be in these tables."""
-
-    prompt_template = PromptTemplate(
-        input_variables=["user_query","db_info"],
-        template=template,
-    )
 
     tools_for_agent = [
         Tool(
@@ -46,23 +31,51 @@ def send_query_agent(user_query="",model="gemma3:27b", db_info="", debug=False):
         )
     ]
 
-    react_prompt = hub.pull("hwchase17/react")
-
     agent = create_react_agent(
         llm=llm,
         tools=tools_for_agent,
-        prompt=react_prompt,
+        prompt=REACT_PROMPT,
     )
     
-    agent_executor = AgentExecutor(
+    return AgentExecutor(
         agent=agent,
         tools=tools_for_agent,
         verbose=debug,
         handle_parse_errors=True
     )
-    
-    formatted_prompt = prompt_template.format(user_query=user_query, db_info=db_info)
-    results = agent_executor.invoke({"input": formatted_prompt})
+
+@traced("agent")
+def send_query_agent(user_query="",model="gemma3:27b", db_info="", debug=False):
+    # Read the schema from the ingestion catalog when the caller didn't provide it
+    if not db_info:
+        db_info = get_db_info(user_query, debug=debug)
+
+    template = """Here is what the user wants: {user_query}. 
+    Here is some information about the database you should reference to complete the users request: {db_info}
+    Please accomplish the task by sending a query to the database.
+
+    The database is a Microsoft SQL Server database.
+    Use a query that should work on any Microsoft SQL Server database.
+
+    ***YOUR QUERIES SHOULD NOT HAVE ANY FORMATTING SUCH AS NEW LINES, SINGLE OR DOUBLE QUOTES TO DENOTE A STRING OR ANYTHING EXCEPT THE QUERY.***
+
+    ***If an error occurs please try again with a different query.
+    ***All queries should be one line.
+    ***If you need more than one line use multiple queries.
+    ***Do not assume anything about the database except the following:
+    1. There is a databse called table_db
+    2. Inside of table_db there is a schema called {schema_name}
+    3. Inside of {schema_name} there are tables. All of the relevant information will be in these tables."""
+
+    prompt_template = PromptTemplate(
+        input_variables=["user_query","db_info","schema_name"],
+        template=template,
+    )
+
+    agent_executor = build_send_query_executor(model, debug)
+    formatted_prompt = prompt_template.format(user_query=user_query, db_info=db_info,
+                                              schema_name=schema_name(active_namespace()))
+    results = agent_executor.invoke({"input": formatted_prompt}, config=tracing_config())
 
     if debug:
         print(results["output"])
@@ -70,5 +83,5 @@ def send_query_agent(user_query="",model="gemma3:27b", db_info="", debug=False):
 
 
 if __name__ == "__main__":
-    db_info = get_db_info_agent(debug=True)
-    print(send_query_agent(user_query="how many rows are in each table?", db_info=db_info, debug=True))
\ No newline at end of file
+    db_info = get_db_info(debug=True)
+    print(send_query_agent(user_query="how many rows are in each table?", db_info=db_info, debug=True))
@@ -1,7 +1,49 @@
-import pyodbc
 import shutil
 import os
+import argparse
 from langchain_chroma import Chroma
+from tools.db import get_pool
+from tools.catalog import (bump_generation, active_namespace, validate_namespace, collection_name, schema_name,
+                           lexical_index_file, quantized_index_dir, manifest_path, schema_catalog_path, dedup_path,
+                           table_index_path)
+
+def clean_schema(schema, dsn="PostgresDSN"):
+    """
+    Drops every table in a schema in a single statement.
+    
+    A namespace's own schema is dropped outright; the public schema is kept and
+    all of its tables are dropped together instead.
+    
+    Args:
+        schema (str): Schema to clear
+        dsn (str): The data source name for PostgreSQL connection
+    """
+    # Borrow a pooled connection to the PostgreSQL database
+    with get_pool(f"DSN={dsn}").connection() as conn:
+        cursor = conn.cursor()
+        
+        try:
+            if schema != "public":
+                cursor.execute(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE')
+                print(f"Dropped schema: {schema}")
+            else:
+                cursor.execute("""
+                    SELECT table_name
+                    FROM information_schema.tables
+                    WHERE table_schema = 'public'
+                    AND table_type = 'BASE TABLE'
+                """)
+                tables = [table for (table,) in cursor.fetchall()]
+                if tables:
+                    cursor.execute("DROP TABLE IF EXISTS " + ", ".join(f'public."{table}"' for table in tables) + " CASCADE")
+                print(f"Dropped {len(tables)} tables in public schema.")
+            
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error occurred: {e}")
+        finally:
+            cursor.close()
 
 def clean_public_schema(dsn="PostgresDSN"):
     """
@@ -10,39 +52,24 @@ def clean_public_schema(dsn="PostgresDSN"):
     Args:
         dsn (str): The data source name for PostgreSQL connection
     """
-    # Connect to PostgreSQL database
-    conn = pyodbc.connect(f"DSN={dsn}")
-    cursor = conn.cursor()
-    
-    try:
-        # Find all tables in the public schema
-        cursor.execute("""
-            SELECT table_name
-            FROM information_schema.tables
-            WHERE table_schema = 'public'
-            AND table_type = 'BASE TABLE'
-        """)
-        
-        tables = cursor.fetchall()
-        
-        # Drop each table
-        for (table,) in tables:
-            print(f"Dropping table: public.{table}")
-            cursor.execute(f'DROP TABLE IF EXISTS public."{table}" CASCADE;')
-        
-        conn.commit()
-        print(f"All tables in public schema dropped successfully.")
-    except Exception as e:
-        conn.rollback()
-        print(f"Error occurred: {e}")
-    finally:
-        cursor.close()
-        conn.close()
+    clean_schema("public", dsn)
 
-def clear():
+def clear(namespace=None, dsn="PostgresDSN"):
+    """
+    Delete everything ingested into a namespace: its Chroma collection, BM25
+    index, quantized vector index, PostgreSQL schema, manifest and schema
+    catalog. Each store is dropped whole, so the cost doesn't grow with the
+    size of the corpus.
+    
+    Args:
+        namespace (str): Namespace to clear, defaults to the active one
+        dsn (str): The data source name for PostgreSQL connection
+    """
     base_dir = os.path.dirname(__file__)
     output_dir = os.path.join(base_dir, "parser_output")
     persist_directory = "./text_embeddings"
+    namespace = validate_namespace(namespace or active_namespace())
+    print(f"Clearing namespace {namespace}")
 
     # Delete parser_output folder
     if os.path.exists(output_dir):
@@ -51,35 +78,52 @@ def clear():
     else:
         print(f"{output_dir} not found.")
 
-    # Clear Chroma vector store
-    if not os.path.exists(persist_directory):
-        print(f"Vector database directory {persist_directory} does not exist.")
-        return
-
-    print(f"Connecting to Chroma database at {persist_directory}...")
-    vectorstore = Chroma(persist_directory=persist_directory)
+    # Forget what was ingested so the next pdf_parser run starts from scratch,
+    # and drop the catalog built from the old corpus
+    for path in (manifest_path(namespace), schema_catalog_path(namespace), dedup_path(namespace),
+                 table_index_path(namespace)):
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"Deleted: {path}")
 
-    count_before = vectorstore._collection.count()
-    print(f"Current number of vectors: {count_before}")
+    # Anything cached from the live index is stale from here on; the
+    # generation is bumped again once everything is dropped, so nothing
+    # answered from the half-deleted stores in between stays cached
+    live = namespace == active_namespace()
+    if live:
+        bump_generation()
 
-    if count_before == 0:
-        print("Database is already empty.")
-        return
+    # Delete the BM25 index kept next to the vectors
+    lexical_index_path = os.path.join(persist_directory, lexical_index_file(namespace))
+    if os.path.exists(lexical_index_path):
+        os.remove(lexical_index_path)
+        print(f"Deleted: {lexical_index_path}")
 
-    all_ids = vectorstore._collection.get()["ids"]
-    print("Deleting all vectors...")
-    vectorstore.delete(ids=all_ids)
+    # Delete the quantized vector index if the namespace used one
+    quantized_path = os.path.join(persist_directory, quantized_index_dir(namespace))
+    if os.path.exists(quantized_path):
+        shutil.rmtree(quantized_path)
+        print(f"Deleted: {quantized_path}")
 
-    count_after = vectorstore._collection.count()
-    print(f"Vectors after deletion: {count_after}")
+    clean_schema(schema_name(namespace), dsn)
 
-    if count_after == 0:
-        print("Database successfully cleared.")
+    # Drop the Chroma collection
+    if not os.path.exists(persist_directory):
+        print(f"Vector database directory {persist_directory} does not exist.")
     else:
-        print(f"Warning: {count_after} vectors remain in the database.")
+        print(f"Connecting to Chroma database at {persist_directory}...")
+        vectorstore = Chroma(persist_directory=persist_directory, collection_name=collection_name(namespace))
+        print(f"Dropping collection {collection_name(namespace)} ({vectorstore._collection.count()} vectors)...")
+        vectorstore.delete_collection()
+        print("Database successfully cleared.")
+
+    if live:
+        print(f"Ingestion generation is now {bump_generation()}")
 
 
 
 if __name__ == "__main__":
-    clean_public_schema()
-    clear()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Delete everything ingested into a namespace")
+    parser.add_argument("--namespace", default=None, help="Namespace to clear, defaults to the active one")
+    args = parser.parse_args()
+    clear(args.namespace)
@@ -0,0 +1,106 @@
+from collections import Counter
+from langchain.docstore.document import Document
+
+def body_font_size(blocks):
+    """
+    The font size most of a page's text is set in, weighted by characters.
+    Returns 0 for blocks extracted without font information.
+    """
+    sizes = Counter()
+    for block in blocks:
+        if len(block) >= 8 and block[6]:
+            sizes[block[6]] += block[5] - block[4]
+    return sizes.most_common(1)[0][0] if sizes else 0.0
+
+def is_heading(text, size, bold, body_size, heading_ratio=1.15, max_chars=150):
+    """
+    A block is a heading if it is short and either set noticeably larger
+    than the body text, or a single bold line.
+    """
+    text = text.strip()
+    if not text or not body_size or len(text) > max_chars:
+        return False
+    if size >= body_size * heading_ratio:
+        return True
+    return bold and "\n" not in text and size >= body_size
+
+def page_sections(text, blocks, heading=None, margin_ratio=0.9):
+    """
+    Split a page into sections that each start at a heading block. Running
+    headers and footers (a first or last block set smaller than the body)
+    become sections of their own so they can be recognised as repeats.
+
+    Args:
+        text (str): The page text
+        blocks (list): The page's text blocks from the extractor
+        heading (str): Heading in force at the top of the page, carried over
+            from the previous page
+        margin_ratio (float): Font size relative to the body below which a
+            first or last block counts as a running header or footer
+
+    Returns:
+        list: (heading, start, end, is_margin) character spans covering the page text
+    """
+    body_size = body_font_size(blocks)
+    sized = [block for block in blocks if len(block) >= 8]
+    margins = {
+        block[4] for block in (sized[:1] + sized[-1:])
+        if len(sized) > 1 and body_size and block[6] < body_size * margin_ratio
+    }
+    sections = []
+    start = 0
+    for block in sized:
+        block_start, block_end, size, bold = block[4], block[5], block[6], block[7]
+        if block_start in margins:
+            if block_start > start:
+                sections.append((heading, start, block_start, False))
+            sections.append((None, block_start, block_end, True))
+            start = block_end
+            continue
+        if not is_heading(text[block_start:block_end], size, bold, body_size):
+            continue
+        if block_start > start:
+            sections.append((heading, start, block_start, False))
+        heading = text[block_start:block_end].strip()
+        start = block_start
+    if start < len(text):
+        sections.append((heading, start, len(text), False))
+    return sections
+
+def layout_chunks(text, blocks, text_splitter, chunk_size, heading=None, min_chars=200):
+    """
+    Chunk one page along its heading structure.
+
+    Sections no longer than chunk_size become one chunk each, with short
+    neighbouring sections combined up to chunk_size; longer sections are
+    split further with text_splitter. Chunks never cross a section boundary
+    they don't have to, never cross the page, and running headers and
+    footers are always chunks of their own.
+
+    Returns:
+        tuple: (chunks as (content, start_index, heading), heading in force
+            at the end of the page)
+    """
+    sections = page_sections(text, blocks, heading)
+    merged = []
+    for section in sections:
+        if merged and not section[3] and not merged[-1][3]:
+            last_heading, last_start, last_end, _ = merged[-1]
+            combined = section[2] - last_start
+            if (last_end - last_start < min_chars or section[2] - section[1] < min_chars) and combined <= chunk_size:
+                merged[-1] = (last_heading or section[0], last_start, section[2], False)
+                continue
+        merged.append(section)
+
+    chunks = []
+    for section_heading, start, end, _ in merged:
+        section_text = text[start:end]
+        if not section_text.strip():
+            continue
+        if len(section_text) <= chunk_size:
+            chunks.append((section_text, start, section_heading))
+            continue
+        for piece in text_splitter.split_documents([Document(page_content=section_text)]):
+            chunks.append((piece.page_content, start + piece.metadata["start_index"], section_heading))
+    body = [section for section in sections if not section[3]]
+    return chunks, (body[-1][0] if body else heading)
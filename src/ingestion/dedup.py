@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+from tools.lexical_index import matches_filter, filter_doc_ids
+
+BANDS = 4
+BAND_BITS = 16
+
+def simhash(text, size=3):
+    """
+    64-bit SimHash over word shingles: texts that share most of their
+    shingles get fingerprints a few bits apart. Returned as a signed 64-bit
+    integer so SQLite can store it.
+    """
+    words = re.findall(r"\w+", text.lower())
+    shingles = [" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))]
+    weights = [0] * 64
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    fingerprint = sum(1 << bit for bit in range(64) if weights[bit] > 0)
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+def code_signature(text):
+    """
+    Hash of the tokens in a text that hold digits (prices, quantities, SKUs,
+    dates) in order. SimHash barely moves when one of them changes, so two
+    chunks only count as duplicates when these match exactly.
+    """
+    codes = [token for token in re.findall(r"[a-z0-9]+(?:[-_./,:][a-z0-9]+)*", text.lower())
+             if any(c.isdigit() for c in token)]
+    return hashlib.blake2b(" ".join(codes).encode("utf-8"), digest_size=8).hexdigest()
+
+def bands(fingerprint):
+    unsigned = fingerprint & ((1 << 64) - 1)
+    return [unsigned >> (band * BAND_BITS) & ((1 << BAND_BITS) - 1) for band in range(BANDS)]
+
+def hamming(a, b):
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+class ChunkDeduper:
+    """
+    Corpus-wide register of the chunks in a namespace, used to collapse
+    near-duplicates (repeated headers, footers, disclaimers, copies of the
+    same section) into one vector.
+
+    The first chunk with a given SimHash becomes the representative that is
+    embedded and stored; later chunks within max_distance bits whose numbers
+    and codes are exactly the same (see code_signature) are recorded as extra
+    references to it instead, so chunks that differ in a price or SKU are
+    always kept. Any two fingerprints that close share at least one of the
+    16-bit bands exactly, so candidates are found with an indexed lookup.
+    Additions are staged and only written by commit(), after the vectors
+    they refer to have been stored.
+
+    Args:
+        path (str): SQLite file the register is kept in
+        max_distance (int): Largest Hamming distance counted as a duplicate, below BANDS
+        check_same_thread (bool): Passed to sqlite3.connect; False for a handle
+            shared by threads that serialize their calls
+        readonly (bool): Open an existing register for find() only; additions
+            are kept in memory and never committed
+    """
+
+    def __init__(self, path, max_distance=3, check_same_thread=True, readonly=False):
+        self.path = path
+        self.max_distance = max_distance
+        self._pending_representatives = []
+        self._pending_references = []
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=60, check_same_thread=check_same_thread)
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=check_same_thread)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS representatives (
+                chunk_id TEXT PRIMARY KEY,
+                simhash INTEGER NOT NULL,
+                {", ".join(f"band{band} INTEGER NOT NULL" for band in range(BANDS))},
+                codes TEXT
+            )
+        """)
+        if "codes" not in [row[1] for row in self.conn.execute("PRAGMA table_info(representatives)")]:
+            # Registers from before code signatures never match, so nothing more is collapsed into them
+            self.conn.execute("ALTER TABLE representatives ADD COLUMN codes TEXT")
+        for band in range(BANDS):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS representatives_band{band} ON representatives (band{band})")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS refs (chunk_id TEXT NOT NULL, doc_id TEXT, metadata TEXT NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS refs_chunk ON refs (chunk_id)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS refs_doc ON refs (doc_id)")
+        self.conn.commit()
+
+    def find(self, text):
+        """
+        Returns:
+            tuple: (chunk_id of a near-duplicate representative or None, the
+                text's signature to pass to add_representative)
+        """
+        fingerprint = simhash(text)
+        codes = code_signature(text)
+        for chunk_id, (other, other_codes) in self._pending_representatives:
+            if other_codes == codes and hamming(fingerprint, other) <= self.max_distance:
+                return chunk_id, (fingerprint, codes)
+        rows = self.conn.execute(
+            "SELECT chunk_id, simhash FROM representatives WHERE codes = ? AND ("
+            + " OR ".join(f"band{band} = ?" for band in range(BANDS)) + ")",
+            [codes] + bands(fingerprint)
+        ).fetchall()
+        for chunk_id, other in rows:
+            if hamming(fingerprint, other) <= self.max_distance:
+                return chunk_id, (fingerprint, codes)
+        return None, (fingerprint, codes)
+
+    def add_representative(self, chunk_id, signature, metadata):
+        self._pending_representatives.append((chunk_id, signature))
+        self._pending_references.append((chunk_id, metadata))
+
+    def add_reference(self, chunk_id, metadata):
+        self._pending_references.append((chunk_id, metadata))
+
+    def commit(self):
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO representatives VALUES (?, ?, {', '.join(['?'] * BANDS)}, ?)",
+                [(chunk_id, fingerprint, *bands(fingerprint), codes)
+                 for chunk_id, (fingerprint, codes) in self._pending_representatives]
+            )
+            self.conn.executemany(
+                "INSERT INTO refs (chunk_id, doc_id, metadata) VALUES (?, ?, ?)",
+                [(chunk_id, metadata.get("doc_id"), json.dumps(metadata)) for chunk_id, metadata in self._pending_references]
+            )
+        self.discard()
+
+    def discard(self):
+        self._pending_representatives = []
+        self._pending_references = []
+
+    def references(self, chunk_ids):
+        """
+        Returns:
+            dict: chunk_id mapped to the metadata of every chunk it stands for
+        """
+        chunk_ids = list(chunk_ids)
+        if not chunk_ids:
+            return {}
+        found = {}
+        placeholders = ", ".join(["?"] * len(chunk_ids))
+        for chunk_id, metadata in self.conn.execute(
+            f"SELECT chunk_id, metadata FROM refs WHERE chunk_id IN ({placeholders}) ORDER BY rowid", chunk_ids
+        ):
+            found.setdefault(chunk_id, []).append(json.loads(metadata))
+        return found
+
+    def matching_chunks(self, metadata_filter):
+        """
+        The representatives standing in for a chunk whose own metadata matches
+        a filter, so a search scoped to a document or page also finds the
+        chunks collapsed into another document's vector.
+        
+        Only filters that pin the doc_id are looked up, through the indexed
+        column; anything else would decode the whole register on every search.
+        
+        Returns:
+            list: chunk_ids, empty when the filter doesn't pin a doc_id
+        """
+        doc_ids = filter_doc_ids(metadata_filter)
+        if doc_ids is None:
+            return []
+        placeholders = ", ".join(["?"] * len(doc_ids))
+        rows = self.conn.execute(f"SELECT chunk_id, metadata FROM refs WHERE doc_id IN ({placeholders})", doc_ids)
+        return sorted({chunk_id for chunk_id, metadata in rows if matches_filter(json.loads(metadata), metadata_filter)})
+
+    def remove_document(self, doc_id, pages=None):
+        """
+        Drop a document's references, or with pages only those from these
+        page numbers. A representative that came from a dropped chunk but
+        still stands for other chunks is handed to one of them rather than
+        deleted.
+
+        Returns:
+            list: (chunk_id, metadata) for each representative whose stored
+                vector should now carry the metadata of its new owner
+        """
+        promotions = []
+        with self.conn:
+            dropped = {}
+            for rowid, chunk_id, metadata in self.conn.execute(
+                "SELECT rowid, chunk_id, metadata FROM refs WHERE doc_id = ?", (doc_id,)
+            ).fetchall():
+                if pages is None or json.loads(metadata).get("page") in pages:
+                    dropped[rowid] = chunk_id
+            # The first reference of a chunk is the one its stored vector was made from
+            owners = {chunk_id: self.conn.execute(
+                "SELECT rowid FROM refs WHERE chunk_id = ? ORDER BY rowid LIMIT 1", (chunk_id,)
+            ).fetchone()[0] for chunk_id in set(dropped.values())}
+            self.conn.executemany("DELETE FROM refs WHERE rowid = ?", [(rowid,) for rowid in dropped])
+            for chunk_id in sorted(owners):
+                remaining = self.conn.execute(
+                    "SELECT metadata FROM refs WHERE chunk_id = ? ORDER BY rowid LIMIT 1", (chunk_id,)
+                ).fetchone()
+                if remaining is None:
+                    self.conn.execute("DELETE FROM representatives WHERE chunk_id = ?", (chunk_id,))
+                elif owners[chunk_id] in dropped:
+                    promotions.append((chunk_id, {**json.loads(remaining[0]), "chunk_id": chunk_id}))
+        return promotions
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,122 @@
+import os
+import time
+import sqlite3
+import hashlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+from tools.tracing import span
+
+EMBEDDING_CACHE_PATH = "./index_state/embedding_cache.sqlite3"
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding model that batches document embeddings, sends several batches to
+    the embedding server at once and keeps every vector in an on-disk cache
+    keyed by (model name, text hash), so identical chunks are only embedded once.
+    
+    Args:
+        model (str): Ollama embedding model name
+        cache_path (str): SQLite file the vectors are cached in
+        batch_size (int): Number of texts per embedding request
+        max_concurrency (int): Number of batches in flight at once
+        max_entries (int): Cache size; least recently used vectors are evicted past it
+    """
+
+    def __init__(self, model="nomic-embed-text", cache_path=EMBEDDING_CACHE_PATH, batch_size=32,
+                 max_concurrency=4, max_entries=500_000):
+        self.model = model
+        self.embedder = OllamaEmbeddings(model=model)
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        # Several ingestion workers may share the cache file
+        self.conn = sqlite3.connect(cache_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.conn.commit()
+        # Kept up to date as vectors are added, so a write doesn't scan the table to
+        # count it; other workers' writes are only seen when it runs over max_entries
+        self._count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _lookup(self, hashes):
+        found = {}
+        # Stay well under SQLite's bound parameter limit
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i:i + 500]
+            placeholders = ", ".join(["?"] * len(batch))
+            rows = self.conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                [self.model, *batch]
+            ).fetchall()
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        return found
+
+    def _store(self, vectors, touched):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(self.model, key, array("f", vector).tobytes(), now) for key, vector in vectors.items()]
+            )
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                [(now, self.model, key) for key in touched]
+            )
+            self._count += len(vectors)
+            if self._count > self.max_entries:
+                self._count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._count > self.max_entries:
+                    self.conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (self._count - self.max_entries,)
+                    )
+                    self._count = self.max_entries
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        hashes = [text_hash(text) for text in texts]
+        unique = dict(zip(hashes, texts))
+        cached = self._lookup(list(unique))
+
+        missing = [(key, text) for key, text in unique.items() if key not in cached]
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+
+        batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+        computed = {}
+        if batches:
+            with span(self.model, "embedding", texts=len(missing), batches=len(batches), cache_hits=len(texts) - len(missing)), \
+                    ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                results = pool.map(lambda batch: self.embedder.embed_documents([text for _, text in batch]), batches)
+                for batch, vectors in zip(batches, results):
+                    for (key, _), vector in zip(batch, vectors):
+                        computed[key] = vector
+
+        self._store(computed, list(cached))
+        cached.update(computed)
+        return [cached[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embedder.embed_query(text)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,217 @@
+import fitz
+import tabula
+import pandas as pd
+from ingestion.manifest import page_digest
+
+def format_bbox(bbox):
+    """
+    Format a bounding box as an "x0,y0,x1,y1" string in PDF points, which is
+    how boxes are stored in vector metadata and table provenance.
+    """
+    return ",".join(f"{v:.1f}" for v in bbox)
+
+def union_bbox(boxes):
+    boxes = list(boxes)
+    if not boxes:
+        return None
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes)
+    )
+
+def page_text_blocks(page):
+    """
+    Build the page text from its text blocks, remembering where each block
+    sits on the page and how it is set, so chunking can find headings.
+    
+    Returns:
+        tuple: (text, blocks) where blocks is a list of
+            (x0, y0, x1, y1, start, end, font_size, bold) giving each block's
+            bounding box, character span in text, largest font size and
+            whether all of its text is bold
+    """
+    parts = []
+    blocks = []
+    offset = 0
+    # TEXTFLAGS_TEXT leaves image blocks out of the dict
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        lines = []
+        sizes = []
+        bold = True
+        for line in block.get("lines", []):
+            lines.append("".join(span["text"] for span in line["spans"]))
+            for span in line["spans"]:
+                if span["text"].strip():
+                    sizes.append(span["size"])
+                    # Bit 4 of the span flags marks a bold font
+                    bold = bold and bool(span["flags"] & 16)
+        if not lines:
+            continue
+        # Same layout as get_text("blocks"): one line per row, ending with a newline
+        block_text = "\n".join(lines) + "\n"
+        x0, y0, x1, y1 = block["bbox"]
+        blocks.append((x0, y0, x1, y1, offset, offset + len(block_text),
+                       round(max(sizes), 1) if sizes else 0.0, bold and bool(sizes)))
+        parts.append(block_text)
+        offset += len(block_text)
+    return "".join(parts), blocks
+
+def read_tables(filename, pages):
+    """
+    Run tabula once over several pages, keeping the page and position of
+    every table it finds. Each call starts a JVM and loads the whole PDF, so
+    pages are batched rather than read one at a time.
+    
+    Args:
+        filename (str): Path to the PDF file
+        pages (list): 1-based page numbers
+    
+    Returns:
+        dict: Page number mapped to one dict per table with its DataFrame and bounding box
+    """
+    tables = {}
+    for table in tabula.read_pdf(filename, pages=list(pages), multiple_tables=True, output_format="json"):
+        page_num = table.get("page_number")
+        if page_num is None:
+            if len(pages) != 1:
+                # Without page numbers in the output, tables can't be placed; read page by page
+                for single in pages:
+                    tables.update(read_tables(filename, [single]))
+                return tables
+            page_num = pages[0]
+        rows = [[cell.get("text", "") for cell in row] for row in table.get("data", [])]
+        if len(rows) < 2:
+            continue
+        # Like tabula's DataFrame output, the first row becomes the header
+        columns = []
+        for i, name in enumerate(rows[0]):
+            name = name.strip() or f"column_{i+1}"
+            while name in columns:
+                name = f"{name}_{i+1}"
+            columns.append(name)
+        width = len(columns)
+        frame = pd.DataFrame([(row + [""] * width)[:width] for row in rows[1:]], columns=columns)
+        bbox = (table["left"], table["top"], table["left"] + table["width"], table["top"] + table["height"])
+        tables.setdefault(page_num, []).append({"frame": frame, "bbox": bbox})
+    return tables
+
+def looks_like_table(page, min_rules=4, min_cells=6, min_aligned_rows=3, column_gap=15):
+    """
+    Cheap check for whether a page is worth sending to tabula.
+    
+    A page qualifies if its rules cross into a grid (at least two horizontal
+    and two vertical ones), it has enough rectangles to be the cells of one,
+    or enough text rows split into three or more widely spaced columns to be
+    a borderless table. A few boxes or divider lines alone don't count.
+    
+    Args:
+        page (fitz.Page): The page to inspect
+        min_rules (int): Number of horizontal and vertical rules together that suggest a grid
+        min_cells (int): Number of rectangles that suggest a grid of cells
+        min_aligned_rows (int): Number of multi-column text rows that suggest a table
+        column_gap (float): Horizontal gap in points that separates two columns
+        
+    Returns:
+        bool: Whether the page probably contains a table
+    """
+    horizontal = vertical = cells = 0
+    for drawing in page.get_drawings():
+        for item in drawing["items"]:
+            if item[0] == "re":
+                cells += 1
+            elif item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.y - end.y) < 1:
+                    horizontal += 1
+                elif abs(start.x - end.x) < 1:
+                    vertical += 1
+        if cells >= min_cells or (horizontal >= 2 and vertical >= 2 and horizontal + vertical >= min_rules):
+            return True
+
+    rows = {}
+    for x0, y0, x1, y1, *_ in page.get_text("words"):
+        rows.setdefault(round(y0), []).append((x0, x1))
+    aligned_rows = 0
+    for words in rows.values():
+        words.sort()
+        columns = 1 + sum(1 for prev, cur in zip(words, words[1:]) if cur[0] - prev[1] > column_gap)
+        if columns >= 3:
+            aligned_rows += 1
+            if aligned_rows >= min_aligned_rows:
+                return True
+    return False
+
+def text_around(text, blocks, bbox, max_chars=400, above=2, below=1):
+    """
+    The text just above and below a box on the page, such as a table's title
+    and caption, nearest blocks first up to about max_chars and returned in
+    reading order.
+    """
+    if bbox is None:
+        return ""
+    nearest = sorted((b for b in blocks if b[3] <= bbox[1]), key=lambda b: bbox[1] - b[3])[:above] + \
+        sorted((b for b in blocks if b[1] >= bbox[3]), key=lambda b: b[1] - bbox[3])[:below]
+    picked = []
+    size = 0
+    for block in nearest:
+        block_text = " ".join(text[block[4]:block[5]].split())
+        if not block_text or size + len(block_text) > max_chars:
+            continue
+        picked.append((block[4], block_text))
+        size += len(block_text)
+    return " ".join(block_text for _, block_text in sorted(picked))
+
+def iter_pages(filename, extract_tables=True, table_window=32):
+    """
+    Walk a PDF once, yielding everything extracted from each page as soon as
+    the page is done.
+    
+    Pages that look like they hold tables are sent to tabula together, one
+    call per table_window pages, before the pages of that window are yielded.
+    
+    Args:
+        filename (str): Path to the PDF file
+        extract_tables (bool): Run tabula on pages that look like they hold tables
+        table_window (int): Number of pages whose table candidates share one tabula call
+        
+    Yields:
+        dict: The page number (1-based), page count, text with its text blocks,
+            content hash, images as (name, bytes, ext, bbox) tuples and tables
+            as dicts of DataFrame and bbox
+    """
+    with fitz.open(filename) as pdf_document:
+        page_count = len(pdf_document)
+        window_tables = {}
+        for page_index, page in enumerate(pdf_document):
+            page_num = page_index + 1
+            if extract_tables and page_index % table_window == 0:
+                candidates = [
+                    index + 1 for index in range(page_index, min(page_index + table_window, page_count))
+                    if looks_like_table(pdf_document[index])
+                ]
+                window_tables = {}
+                if candidates:
+                    try:
+                        window_tables = read_tables(filename, candidates)
+                    except Exception as e:
+                        print(f"Error extracting tables from pages {candidates[0]}-{candidates[-1]}: {e}")
+
+            images = []
+            for img_index, img in enumerate(page.get_images(full=True)):
+                base_image = pdf_document.extract_image(img[0])
+                rects = page.get_image_rects(img[0])
+                bbox = tuple(rects[0]) if rects else tuple(page.rect)
+                images.append((f"page{page_num}_img{img_index+1}", base_image["image"], base_image["ext"], bbox))
+
+            text, blocks = page_text_blocks(page)
+            yield {
+                "page": page_num,
+                "page_count": page_count,
+                "text": text,
+                "blocks": blocks,
+                "hash": page_digest(pdf_document, page),
+                "images": images,
+                "tables": window_tables.get(page_num, [])
+            }
@@ -0,0 +1,218 @@
+import io
+import os
+import base64
+import sqlite3
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from langchain_ollama import OllamaLLM
+from ingestion.dedup import BANDS, bands, hamming
+
+DESCRIPTION_CACHE_PATH = "./index_state/image_descriptions.sqlite3"
+DESCRIBE_PROMPT = "Concisely describe the image. If there is any text in the image, include it as one line in the description."
+
+def difference_hash(image, size=8):
+    """
+    64-bit perceptual hash: each bit says whether a pixel is brighter than its
+    right-hand neighbour in a tiny grayscale copy. Re-encoded, rescaled or
+    slightly recompressed copies of a figure hash to the same or nearby values.
+    """
+    small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def fine_hash(image, size=16):
+    """
+    256-bit difference hash as hex. Two images only share a description when
+    this and their dimensions match exactly, so a chart or slide built on the
+    same template with different numbers in it is described on its own.
+    """
+    small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            value = (value << 1) | (pixels[row * (size + 1) + col] > pixels[row * (size + 1) + col + 1])
+    return f"{value:0{size * size // 4}x}"
+
+class ImageDescriber:
+    """
+    Describes images with the vision model while avoiding as many calls to it
+    as possible: tiny images (icons, bullets, rules) are skipped, identical
+    images and re-encoded copies (same size and fine_hash, found through
+    nearby perceptual hashes) are described once, descriptions are cached on disk
+    across runs and documents, and large images are downsampled before being
+    sent.
+    
+    Args:
+        model (str): Ollama vision model name
+        cache_path (str): SQLite file the descriptions are cached in
+        min_side (int): Images narrower or shorter than this many pixels are skipped
+        min_bytes (int): Images smaller than this many bytes are skipped
+        max_side (int): Images are downsampled so neither side exceeds this
+        max_concurrency (int): Number of vision requests in flight at once
+        max_distance (int): Perceptual hashes this close are checked with fine_hash, below BANDS
+    """
+
+    def __init__(self, model="llava:13b", cache_path=DESCRIPTION_CACHE_PATH, min_side=64, min_bytes=2048,
+                 max_side=1024, max_concurrency=4, max_distance=3):
+        self.model = model
+        self.vision_model = OllamaLLM(model=model)
+        self.min_side = min_side
+        self.min_bytes = min_bytes
+        self.max_side = max_side
+        self.max_concurrency = max_concurrency
+        self.max_distance = max_distance
+        # described counts vision requests, reused counts images served from the cache or a duplicate
+        self.stats = {"described": 0, "reused": 0, "skipped": 0}
+
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        # Several ingestion workers may share the cache file
+        self.conn = sqlite3.connect(cache_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS descriptions (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                phash INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                {", ".join(f"band{band} INTEGER" for band in range(BANDS))},
+                width INTEGER,
+                height INTEGER,
+                fine_hash TEXT,
+                PRIMARY KEY (model, content_hash)
+            )
+        """)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(descriptions)")]
+        if "band0" not in columns:
+            # Caches from before the banded lookup get their bands filled in from the stored hashes
+            for band in range(BANDS):
+                self.conn.execute(f"ALTER TABLE descriptions ADD COLUMN band{band} INTEGER")
+            self.conn.executemany(
+                f"UPDATE descriptions SET {', '.join(f'band{band} = ?' for band in range(BANDS))} WHERE rowid = ?",
+                [(*bands(phash), rowid) for rowid, phash in self.conn.execute("SELECT rowid, phash FROM descriptions").fetchall()]
+            )
+        if "fine_hash" not in columns:
+            # Older entries are still reused for identical files, never for near matches
+            for column in ("width INTEGER", "height INTEGER", "fine_hash TEXT"):
+                self.conn.execute(f"ALTER TABLE descriptions ADD COLUMN {column}")
+        for band in range(BANDS):
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS descriptions_band{band} ON descriptions (model, band{band})")
+        self.conn.commit()
+
+    def _same_image(self, a, b):
+        return (a["image"].size == b["image"].size and a["fine_hash"] == b["fine_hash"]
+                and hamming(a["phash"], b["phash"]) <= self.max_distance)
+
+    def _cached(self, content_hash, group):
+        row = self.conn.execute(
+            "SELECT description FROM descriptions WHERE model = ? AND content_hash = ?",
+            (self.model, content_hash)
+        ).fetchone()
+        if row:
+            return row[0]
+        # Hashes fewer than BANDS bits apart share at least one band exactly
+        for other, width, height, other_fine, description in self.conn.execute(
+            "SELECT phash, width, height, fine_hash, description FROM descriptions WHERE model = ? AND fine_hash = ? AND ("
+            + " OR ".join(f"band{band} = ?" for band in range(BANDS)) + ")",
+            [self.model, group["fine_hash"]] + bands(group["phash"])
+        ):
+            if (width, height) == group["image"].size and hamming(group["phash"], other) <= self.max_distance:
+                return description
+        return None
+
+    def _encode(self, image, image_bytes):
+        if max(image.size) <= self.max_side:
+            return base64.b64encode(image_bytes).decode("utf-8")
+        image = image.copy()
+        image.thumbnail((self.max_side, self.max_side))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+    def _describe(self, image_base64):
+        vision_model_context = self.vision_model.bind(images=[image_base64])
+        return vision_model_context.invoke(DESCRIBE_PROMPT)
+
+    def describe(self, image_paths):
+        """
+        Describe a list of image files.
+        
+        Args:
+            image_paths (list): Paths to the image files
+            
+        Returns:
+            dict: Image path mapped to its description; skipped images are left out
+        """
+        groups = {}
+        for path in image_paths:
+            with open(path, "rb") as image_file:
+                image_bytes = image_file.read()
+            try:
+                image = Image.open(io.BytesIO(image_bytes))
+                image.load()
+            except Exception as e:
+                print(f"Skipping unreadable image {path}: {e}")
+                self.stats["skipped"] += 1
+                continue
+            if len(image_bytes) < self.min_bytes or min(image.size) < self.min_side:
+                self.stats["skipped"] += 1
+                continue
+            content_hash = hashlib.sha256(image_bytes).hexdigest()
+            group = groups.setdefault(content_hash, {"paths": [], "image": image, "bytes": image_bytes})
+            group["paths"].append(path)
+
+        descriptions = {}
+        to_describe = []
+        for content_hash, group in groups.items():
+            group["phash"] = difference_hash(group["image"])
+            group["fine_hash"] = fine_hash(group["image"])
+            cached = self._cached(content_hash, group)
+            if cached is not None:
+                for path in group["paths"]:
+                    descriptions[path] = cached
+            else:
+                to_describe.append((content_hash, group))
+
+        # Re-encoded copies within this batch only need one request as well
+        unique = []
+        for content_hash, group in to_describe:
+            for _, leader in unique:
+                if self._same_image(group, leader):
+                    leader.setdefault("followers", []).append((content_hash, group))
+                    break
+            else:
+                unique.append((content_hash, group))
+
+        rows = []
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            results = pool.map(lambda item: self._describe(self._encode(item[1]["image"], item[1]["bytes"])), unique)
+            for (content_hash, group), description in zip(unique, results):
+                for member_hash, member in [(content_hash, group)] + group.get("followers", []):
+                    rows.append((self.model, member_hash, member["phash"], description, *bands(member["phash"]),
+                                 *member["image"].size, member["fine_hash"]))
+                    for path in member["paths"]:
+                        descriptions[path] = description
+        self.stats["described"] += len(unique)
+        self.stats["reused"] += len(descriptions) - len(unique)
+
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO descriptions (model, content_hash, phash, description, "
+                f"{', '.join(f'band{band}' for band in range(BANDS))}, width, height, fine_hash) "
+                f"VALUES (?, ?, ?, ?, {', '.join(['?'] * BANDS)}, ?, ?, ?)",
+                rows
+            )
+        return descriptions
+
+    def close(self):
+        self.conn.close()
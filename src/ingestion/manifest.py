@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+import fitz
+
+MANIFEST_PATH = "./index_state/ingest_manifest.json"
+
+def file_sha256(path, block_size=1 << 20):
+    """
+    Hash the raw bytes of a file.
+    
+    Args:
+        path (str): Path to the file
+        block_size (int): Number of bytes read at a time
+        
+    Returns:
+        str: Hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def page_hashes(path):
+    """
+    Hash each page of a PDF from its content stream and embedded images so
+    that edits can be traced to the pages they touch.
+    
+    Args:
+        path (str): Path to the PDF file
+        
+    Returns:
+        list: One hex digest per page, in page order
+    """
+    with fitz.open(path) as pdf_document:
+        return [page_digest(pdf_document, page) for page in pdf_document]
+
+def page_digest(pdf_document, page):
+    digest = hashlib.sha256(page.read_contents())
+    for img in page.get_images(full=True):
+        digest.update(pdf_document.xref_stream_raw(img[0]) or b"")
+    return digest.hexdigest()
+
+def load_manifest(path=MANIFEST_PATH):
+    """
+    Load the ingestion manifest, returning an empty one if it does not exist yet.
+    
+    The manifest maps the sha256 of every ingested PDF to what was produced
+    from it: the document id used for its vectors, its page hashes and the
+    tables it created.
+    """
+    if not os.path.exists(path):
+        return {"documents": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    # Write to a temp file first so an interrupted run never leaves a truncated manifest
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def plan_ingestion(manifest, pdf_paths):
+    """
+    Compare the PDFs on disk against the manifest.
+    
+    Args:
+        manifest (dict): Manifest returned by load_manifest
+        pdf_paths (list): Paths of the PDFs currently in the input directory
+        
+    Returns:
+        tuple: (to_ingest, unchanged, removed) where to_ingest is a list of
+            (path, sha256) pairs, unchanged is a list of paths and removed is
+            a list of (sha256, entry) pairs for documents that are gone or
+            have been replaced by a new version
+    """
+    documents = manifest.get("documents", {})
+    current = {}
+    for pdf_path in pdf_paths:
+        current[file_sha256(pdf_path)] = pdf_path
+
+    to_ingest = [(path, sha) for sha, path in current.items() if sha not in documents]
+    unchanged = [path for sha, path in current.items() if sha in documents]
+    removed = [(sha, entry) for sha, entry in documents.items() if sha not in current]
+    return to_ingest, unchanged, removed
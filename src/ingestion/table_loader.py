@@ -0,0 +1,179 @@
+import io
+import re
+import csv
+from decimal import Decimal
+import pandas as pd
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+# Values tabula produces for blank cells
+NULL_VALUES = {"", "nan", "none", "null", "n/a", "-"}
+BOOLEAN_VALUES = {"true": True, "false": False, "yes": True, "no": False}
+# Stray currency symbols and percent signs around numbers
+NUMBER_NOISE = re.compile(r"[$€£¥%]")
+NUMBER = re.compile(r"^[-+]?(\d+(\.\d*)?|\.\d+)$")
+# Commas only count as thousands separators in groups of three: "1,5" or
+# "2,75" may be decimal commas and are kept as text
+THOUSANDS = re.compile(r"^[-+]?\d{1,3}(,\d{3})+(\.\d+)?$")
+# ISO dates with an optional time, or day/month/year with one separator
+# throughout; dotted dates need a four digit year so "1.2.3" stays text
+DATE_PATTERNS = [
+    re.compile(r"^\d{4}-\d{1,2}-\d{1,2}([ T]\d{1,2}:\d{2}(:\d{2})?)?$"),
+    re.compile(r"^\d{4}/\d{1,2}/\d{1,2}$"),
+    re.compile(r"^\d{1,2}([/-])\d{1,2}\1(\d{2}|\d{4})$"),
+    re.compile(r"^\d{1,2}\.\d{1,2}\.\d{4}$")
+]
+
+# BIGINT's range; wider integers would make the INSERT or COPY fail
+BIGINT_MIN, BIGINT_MAX = -2**63, 2**63 - 1
+
+def clean_value(value):
+    if value is None:
+        return None
+    text = str(value).strip()
+    return None if text.lower() in NULL_VALUES else text
+
+def number_text(value):
+    """
+    The digits of a cell that holds a number, or None if it doesn't hold
+    one unambiguously.
+    """
+    text = NUMBER_NOISE.sub("", value).strip()
+    if "," in text:
+        if not THOUSANDS.match(text):
+            return None
+        text = text.replace(",", "")
+    return text if NUMBER.match(text) else None
+
+def is_date(value):
+    return any(pattern.match(value) for pattern in DATE_PATTERNS)
+
+def infer_column(values):
+    """
+    Pick a PostgreSQL type for a column of extracted cells and convert the
+    cells to match it.
+    
+    Integers with leading zeros (part numbers, zip codes) stay TEXT so nothing
+    is lost, and any column with a value that doesn't fit falls back to TEXT,
+    including numbers with decimal commas or embedded spaces. Integers past
+    BIGINT's range make the column NUMERIC, or TEXT when they are bare digit
+    strings such as account or invoice numbers.
+    
+    Args:
+        values (list): The column's cell values
+        
+    Returns:
+        tuple: (sql_type, converted values with None for blanks)
+    """
+    cleaned = [clean_value(v) for v in values]
+    present = [v for v in cleaned if v is not None]
+    if not present:
+        return "TEXT", cleaned
+
+    if all(v.lower() in BOOLEAN_VALUES for v in present):
+        return "BOOLEAN", [None if v is None else BOOLEAN_VALUES[v.lower()] for v in cleaned]
+
+    stripped = [None if v is None else number_text(v) for v in cleaned]
+    if all(s is not None for v, s in zip(cleaned, stripped) if v is not None):
+        leading_zero = any(len(v) > 1 and v.startswith("0") and not v.startswith("0.") for v in present)
+        if not leading_zero:
+            if all(re.fullmatch(r"-?\d+", v) for v in stripped if v is not None):
+                integers = [None if v is None else int(v) for v in stripped]
+                if all(BIGINT_MIN <= i <= BIGINT_MAX for i in integers if i is not None):
+                    return "BIGINT", integers
+                if all(v.isdigit() for v in present):
+                    # Identifiers this long are never summed, so keep them exactly as written
+                    return "TEXT", cleaned
+            return "NUMERIC", [None if v is None else Decimal(v) for v in stripped]
+
+    if all(is_date(v) for v in present):
+        # Dotted dates are written day first
+        dayfirst = all(DATE_PATTERNS[-1].match(v) for v in present)
+        dates = pd.to_datetime(pd.Series(present), errors="coerce", format="mixed", dayfirst=dayfirst)
+        if not dates.isna().any():
+            parsed = iter(dates)
+            converted = [None if v is None else next(parsed) for v in cleaned]
+            if all(d.hour == 0 and d.minute == 0 and d.second == 0 for d in dates):
+                return "DATE", [None if d is None else d.date() for d in converted]
+            return "TIMESTAMP", [None if d is None else d.to_pydatetime() for d in converted]
+
+    return "TEXT", cleaned
+
+def safe_column_names(columns):
+    names = []
+    for i, col in enumerate(columns):
+        name = str(col).replace(" ", "_").replace('"', "") or f"column_{i+1}"
+        while name in names:
+            name = f"{name}_{i+1}"
+        names.append(name)
+    return names
+
+def load_table(conn, schema, table_name, df, batch_size=1000, before_commit=None):
+    """
+    Replace a table with the contents of a DataFrame in a single transaction.
+    
+    The table is created with types inferred from the data, then filled with
+    COPY when conn is a psycopg2 connection, or with batched multi-row
+    INSERTs through pyodbc otherwise. On any error the transaction is rolled
+    back and the error re-raised.
+    
+    Args:
+        conn: psycopg2 or pyodbc connection
+        schema (str): Target schema
+        table_name (str): Target table
+        df (pd.DataFrame): Rows to load
+        batch_size (int): Rows per INSERT statement on the pyodbc path
+        before_commit (callable): Called with the cursor and parameter placeholder
+            to run extra statements in the same transaction
+            
+    Returns:
+        dict: Column names mapped to their inferred types
+    """
+    use_copy = psycopg2 is not None and isinstance(conn, psycopg2.extensions.connection)
+    placeholder = "%s" if use_copy else "?"
+    names = safe_column_names(df.columns)
+    typed = [infer_column(df[col].tolist()) for col in df.columns]
+    rows = list(zip(*[values for _, values in typed]))
+    target = f'"{schema}"."{table_name}"'
+    column_list = ", ".join(f'"{name}"' for name in names)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {target}")
+        cursor.execute(f"CREATE TABLE {target} (" + ", ".join(
+            f'"{name}" {sql_type}' for name, (sql_type, _) in zip(names, typed)
+        ) + ")")
+
+        if use_copy:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                # Unquoted empty fields are NULL in COPY's csv format
+                writer.writerow(["" if v is None else v for v in row])
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {target} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        elif rows:
+            # PostgreSQL caps a statement at 65535 bound parameters
+            step = max(1, min(batch_size, 65535 // len(names)))
+            row_sql = "(" + ", ".join([placeholder] * len(names)) + ")"
+            for i in range(0, len(rows), step):
+                batch = rows[i:i + step]
+                cursor.execute(
+                    f"INSERT INTO {target} ({column_list}) VALUES " + ", ".join([row_sql] * len(batch)),
+                    [v for row in batch for v in row]
+                )
+
+        if before_commit is not None:
+            before_commit(cursor, placeholder)
+        # Fresh planner statistics keep the row estimates in list_tables_and_columns accurate
+        cursor.execute(f"ANALYZE {target}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return {name: sql_type for name, (sql_type, _) in zip(names, typed)}
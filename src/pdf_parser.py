@@ -2,204 +2,888 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
 import json
-import pypdf
-import fitz
-import tabula
 import pandas as pd
-import pyodbc
 from pathlib import Path
-from langchain_ollama import OllamaLLM
-from langchain_ollama import OllamaEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain.docstore.document import Document
 from langchain_core.messages import HumanMessage
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from PIL import Image
-import base64
 import shutil
+import re
+import uuid
+import hashlib
+import time
+import tempfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from ingestion.embedding_cache import CachedEmbeddings
+from ingestion.image_describer import ImageDescriber
+from ingestion.chunker import layout_chunks
+from ingestion.dedup import ChunkDeduper
+from ingestion.manifest import load_manifest, save_manifest, plan_ingestion, page_hashes
+from tools.db import get_pool
+from tools.lexical_index import LexicalIndex
+from tools.catalog import (bump_generation, current_generation, load_schema_catalog, write_schema_catalog,
+                           DEFAULT_NAMESPACE, active_namespace, activate_namespace, validate_namespace,
+                           collection_name, schema_name, lexical_index_file, quantized_index_dir, manifest_path,
+                           schema_catalog_path, dedup_path, table_index_path)
+from tools.quantized_index import QuantizedIndex
+from tools.table_index import TableIndex
+from tools import tracing
+from ingestion.table_loader import load_table, psycopg2
+from ingestion.extractor import iter_pages, format_bbox, union_bbox, text_around
 
-def parse(filename):
+def parse(filename, output_dir="./src/parser_output"):
     """
     Parse a PDF file to extract text, images, and tables.
     
     Args:
         filename (str): Path to the PDF file
+        output_dir (str): Directory the extracted files are written to
         
     Returns:
-        dict: Paths to the extracted files
+        dict: Paths to the extracted files, the page count and per-page hashes
     """
     # Create output directories if they don't exist
-    output_dir = "./src/parser_output"
     image_dir = os.path.join(output_dir, "images")
     os.makedirs(image_dir, exist_ok=True)
     
     result = {
-        "text_file": os.path.join(output_dir, "pdf_text.txt"),
-        "tables_file": os.path.join(output_dir, "pdf_tables.json"),
-        "images_dir": image_dir
+        "pages_file": os.path.join(output_dir, "pdf_pages.jsonl"),
+        "tables_file": os.path.join(output_dir, "pdf_tables.jsonl"),
+        "images_dir": image_dir,
+        "images_file": os.path.join(output_dir, "images.json"),
+        "pages": 0,
+        "page_hashes": []
     }
     
-    # Extract text using pypdf
-    text = ""
-    with open(filename, "rb") as file:
-        pdf_reader = pypdf.PdfReader(file)
-        print(f"Processing {filename}: {len(pdf_reader.pages)} pages")
+    source = os.path.basename(filename)
+    pages_file = open(result["pages_file"], "w", encoding="utf-8")
+    tables_file = open(result["tables_file"], "w", encoding="utf-8")
+    image_count = 0
+    images_data = {}
+    table_count = 0
+    candidate_pages = 0
+
+    # One pass over the document; each page is written out as soon as it is extracted
+    try:
+        for page in iter_pages(filename):
+            if page["page"] == 1:
+                print(f"Processing {filename}: {page['page_count']} pages")
+            result["pages"] = page["page_count"]
+            result["page_hashes"].append(page["hash"])
+
+            # One JSON line per page keeps the text tied to its page and block positions
+            pages_file.write(json.dumps({
+                "source": source,
+                "page": page["page"],
+                "text": page["text"],
+                "blocks": page["blocks"]
+            }) + "\n")
+
+            for name, image_bytes, image_ext, bbox in page["images"]:
+                image_name = f"{name}.{image_ext}"
+                with open(os.path.join(image_dir, image_name), "wb") as img_file:
+                    img_file.write(image_bytes)
+                    image_count += 1
+                images_data[image_name] = {"source": source, "page": page["page"], "bbox": format_bbox(bbox)}
+
+            if page["tables"]:
+                candidate_pages += 1
+            for table in page["tables"]:
+                # Convert DataFrame to dict, one JSON line per table
+                table_count += 1
+                tables_file.write(json.dumps({
+                    "table_id": table_count,
+                    "source": source,
+                    "page": page["page"],
+                    "bbox": format_bbox(table["bbox"]),
+                    # Titles and captions say what a table is about better than its headers
+                    "context": text_around(page["text"], page["blocks"], table["bbox"]),
+                    "data": table["frame"].to_dict(orient='records')
+                }, default=str) + "\n")
+    finally:
+        pages_file.close()
+        tables_file.close()
+
+    print(f"Text extracted to {result['pages_file']}")
+
+    with open(result["images_file"], "w", encoding="utf-8") as f:
+        json.dump(images_data, f, indent=2)
+    print(f"{image_count} images extracted to {image_dir}")
+
+    print(f"{table_count} tables from {candidate_pages} pages extracted to {result['tables_file']}")
         
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n\n"
-    
-    # Save the extracted text
-    with open(result["text_file"], "w", encoding="utf-8") as file:
-        file.write(text)
-    print(f"Text extracted to {result['text_file']}")
+    return result
+
+def describe_image(folder_path, output_file=None, min_side=64, min_bytes=2048, max_side=1024, max_concurrency=4,
+                   window_size=32):
+    """
+    Describe the extracted images with the vision model.
     
-    # Extract images using PyMuPDF
-    pdf_document = fitz.open(filename)
-    image_count = 0
+    Icons and other tiny images are skipped, and images already described in
+    any earlier document or run (or a re-encoded copy of one) reuse the cached
+    description, see ingestion.image_describer.
     
-    for page_num in range(len(pdf_document)):
-        page = pdf_document[page_num]
-        image_list = page.get_images(full=True)
+    Args:
+        folder_path (str): Folder holding the extracted images
+        output_file (str): JSON lines file the descriptions are written to,
+            defaults to descriptions.jsonl next to the images folder
+        min_side (int): Images narrower or shorter than this many pixels are skipped
+        min_bytes (int): Images smaller than this many bytes are skipped
+        max_side (int): Larger images are downsampled to this size before encoding
+        max_concurrency (int): Number of vision requests in flight at once
+        window_size (int): Number of images decoded and described at a time
         
-        for img_index, img in enumerate(image_list):
-            xref = img[0]
-            base_image = pdf_document.extract_image(xref)
-            image_bytes = base_image["image"]
-            image_ext = base_image["ext"]
-            image_path = os.path.join(image_dir, f"page{page_num+1}_img{img_index+1}.{image_ext}")
-            
-            with open(image_path, "wb") as img_file:
-                img_file.write(image_bytes)
-                image_count += 1
+    Returns:
+        dict: Counts of images described, reused and skipped
+    """
+    parent_dir = os.path.dirname(os.path.normpath(folder_path))
+    if output_file is None:
+        output_file = os.path.join(parent_dir, "descriptions.jsonl")
+
+    # Page and position of each image, as recorded by parse()
+    images_file = os.path.join(parent_dir, "images.json")
+    provenance = {}
+    if os.path.exists(images_file):
+        with open(images_file, "r", encoding="utf-8") as f:
+            provenance = json.load(f)
+
+    describer = ImageDescriber(min_side=min_side, min_bytes=min_bytes, max_side=max_side, max_concurrency=max_concurrency)
+    image_paths = [os.path.join(folder_path, image_path) for image_path in sorted(os.listdir(folder_path))]
+
+    # Only window_size decoded images are held at once; duplicates across
+    # windows are still caught by the description cache
+    try:
+        with open(output_file, "w", encoding="utf-8") as f:
+            for i in range(0, len(image_paths), window_size):
+                window = image_paths[i:i + window_size]
+                descriptions = describer.describe(window)
+                for image_full_path in window:
+                    if image_full_path not in descriptions:
+                        continue
+                    image_path = os.path.basename(image_full_path)
+                    result = {"image": image_path, "description": descriptions[image_full_path], **provenance.get(image_path, {})}
+                    f.write(json.dumps(result) + "\n")
+    finally:
+        describer.close()
+    return describer.stats
+
+def iter_chunks(folder_path, text_splitter, doc_id=None, chunk_size=1000, pages=None):
+    """
+    Lazily read the page text and image descriptions in a folder and yield
+    them as chunks, one page at a time. With pages, only the chunks from
+    these page numbers are yielded.
     
-    print(f"{image_count} images extracted to {image_dir}")
+    Text is chunked along the layout: each page on its own, split at headings
+    (see ingestion.chunker), with long sections split further by text_splitter.
+    
+    Every chunk's metadata records where it came from: source (PDF file name),
+    doc_id, page, bbox ("x0,y0,x1,y1" in PDF points), kind ("text" or
+    "image") and for text its start_index within the page and the heading
+    it falls under, so searches can be filtered down to a document or page.
+    """
+    base_metadata = {"doc_id": doc_id} if doc_id else {}
+    
+    pages_file = os.path.join(folder_path, "pdf_pages.jsonl")
+    if os.path.exists(pages_file):
+        heading = None
+        with open(pages_file, "r", encoding="utf-8") as f:
+            for line in f:
+                page = json.loads(line)
+                if not page["text"].strip():
+                    continue
+                metadata = {**base_metadata, "source": page["source"], "page": page["page"], "kind": "text"}
+                chunks, heading = layout_chunks(page["text"], page["blocks"], text_splitter, chunk_size, heading)
+                # Skipped pages are still chunked so the heading carried onto the next page is the same
+                if pages is not None and page["page"] not in pages:
+                    continue
+                for content, start, section_heading in chunks:
+                    # start_index stays in the metadata so neighbouring chunks can be merged at query time
+                    chunk_metadata = {**metadata, "start_index": start}
+                    if section_heading:
+                        chunk_metadata["heading"] = section_heading
+                    # The chunk's box covers every text block it overlaps
+                    end = start + len(content)
+                    bbox = union_bbox(block[:4] for block in page["blocks"] if block[4] < end and block[5] > start)
+                    if bbox:
+                        chunk_metadata["bbox"] = format_bbox(bbox)
+                    yield Document(page_content=content, metadata=chunk_metadata)
+
+    descriptions_file = os.path.join(folder_path, "descriptions.jsonl")
+    if os.path.exists(descriptions_file):
+        with open(descriptions_file, "r", encoding="utf-8") as f:
+            for line in f:
+                description = json.loads(line)
+                if pages is not None and description.get("page") not in pages:
+                    continue
+                metadata = {**base_metadata, "kind": "image", "image": description["image"]}
+                for key in ("source", "page", "bbox"):
+                    if key in description:
+                        metadata[key] = description[key]
+                yield Document(page_content=description["description"], metadata=metadata)
+
+def embedding_texts(docs):
+    # Chunks are embedded under their heading so a split section keeps its context
+    return [
+        f"{doc.metadata['heading']}\n{doc.page_content}"
+        if doc.metadata.get("heading") and not doc.page_content.startswith(doc.metadata["heading"])
+        else doc.page_content
+        for doc in docs
+    ]
+
+def write_chunks(docs, vectors, deduper, stats, store, persist_directory="text_embeddings",
+                 namespace=DEFAULT_NAMESPACE, vector_backend="chroma"):
+    """
+    Collapse near-duplicates into the chunks already registered and write the
+    rest to the vector store and BM25 index.
     
-    # Extract tables using tabula
+    Args:
+        docs (list): Chunks to store
+        vectors (callable): Given the chunks left after dedup, returns their vectors
+        deduper (ChunkDeduper): Register of the namespace's chunks, or None
+        stats (dict): "chunks" and "duplicates" counts to add to
+        store (dict): Holds the Chroma store between calls
+    """
+    ids = []
+    unique = []
+    for doc in docs:
+        chunk_id = str(uuid.uuid4())
+        if deduper is not None:
+            match, signature = deduper.find(doc.page_content)
+            if match is not None:
+                deduper.add_reference(match, doc.metadata)
+                stats["duplicates"] += 1
+                continue
+            doc.metadata["chunk_id"] = chunk_id
+            deduper.add_representative(chunk_id, signature, doc.metadata)
+        ids.append(chunk_id)
+        unique.append(doc)
+
     try:
-        tables = tabula.read_pdf(filename, pages='all', multiple_tables=True)
-        tables_data = []
-        
-        for i, table in enumerate(tables):
-            # Convert DataFrame to dict
-            table_dict = table.to_dict(orient='records')
-            tables_data.append({
-                "table_id": i + 1,
-                "data": table_dict
-            })
-        
-        # Save tables to JSON
-        with open(result["tables_file"], "w", encoding="utf-8") as f:
-            json.dump(tables_data, f, indent=2, default=str)
-        
-        print(f"{len(tables)} tables extracted to {result['tables_file']}")
-    except Exception as e:
-        print(f"Error extracting tables: {e}")
-        
-    return result
+        if unique:
+            embedded = vectors(unique)
+            texts = [doc.page_content for doc in unique]
+            metadatas = [doc.metadata for doc in unique]
+            if vector_backend != "chroma":
+                QuantizedIndex(os.path.join(persist_directory, quantized_index_dir(namespace)),
+                               quantization=vector_backend).add(ids, embedded, texts, metadatas)
+            else:
+                if "db" not in store:
+                    store["db"] = Chroma(persist_directory=persist_directory, collection_name=collection_name(namespace))
+                store["db"]._collection.add(
+                    ids=ids,
+                    embeddings=embedded,
+                    documents=texts,
+                    metadatas=metadatas
+                )
+            # Same chunks and ids go into the BM25 index for hybrid search
+            LexicalIndex(persist_directory, file_name=lexical_index_file(namespace)).add(ids, texts, metadatas)
+        if deduper is not None:
+            # Only record the chunks once the vectors they point at exist
+            deduper.commit()
+    except Exception:
+        if deduper is not None:
+            deduper.discard()
+        raise
+    stats["chunks"] += len(unique)
 
-def describe_image(folder_path):
-    vision_model = OllamaLLM(model="llava:13b")
-    results = []
-    for image_path in os.listdir(folder_path):
-        image_full_path = os.path.join(folder_path, image_path)
-
-        # Read raw file bytes and encode them directly
-        with open(image_full_path, "rb") as image_file:
-            image_bytes = image_file.read()
-            image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-        # Pass base64-encoded image file content
-        vision_model_context = vision_model.bind(images=[image_base64])
-        response = vision_model_context.invoke("Concisely describe the image. If there is any text in the image, include it as one line in the description.")
-        results.append(response)
-    f = open("./src/parser_output/descriptions.txt", "w")
-    for result in results:
-        f.write(result + "\n")
-    f.close()
-
-def embeddings(folder_path, persist_directory="text_embeddings", chunk_size=1000, chunk_overlap=200):
+def embeddings(folder_path, persist_directory="text_embeddings", chunk_size=1000, chunk_overlap=200, doc_id=None,
+               batch_size=32, max_concurrency=4, window_size=256, namespace=DEFAULT_NAMESPACE, vector_backend="chroma",
+               dedup=True, pages=None, spool_file=None):
+    """
+    Chunk the page text and image descriptions in a folder, embed the chunks
+    and add them to the vector store.
+    
+    Chunks are streamed through in windows of window_size: each window is
+    embedded and written before the next one is read, so memory use does not
+    grow with the length of the document.
+    
+    With dedup, a chunk that nearly duplicates one already stored anywhere in
+    the namespace, with the same numbers and codes (see ingestion.dedup), is
+    not embedded again; it is recorded
+    as another reference to the stored chunk, whose metadata carries a
+    chunk_id to look the references up by.
+    
+    With spool_file, nothing is written to the namespace: chunks are
+    appended to the file, one JSON line each, for store_spooled() to write
+    from a single process. With dedup, chunks that nearly duplicate one in
+    the register as it stands (opened read-only) or an earlier chunk of the
+    document are spooled without a vector, so they are not embedded either.
+    
+    Args:
+        folder_path (str): Folder holding pdf_pages.jsonl and descriptions.jsonl
+        persist_directory (str): Chroma persist directory
+        chunk_size (int): Maximum characters per chunk
+        chunk_overlap (int): Characters shared by consecutive chunks
+        doc_id (str): Document id stored in each chunk's metadata
+        batch_size (int): Number of chunks per embedding request
+        max_concurrency (int): Number of embedding requests in flight at once
+        window_size (int): Number of chunks embedded and written at a time
+        namespace (str): Namespace whose collection and BM25 index are written to
+        vector_backend (str): "chroma", or "int8" / "pq" for a memory-mapped QuantizedIndex
+        dedup (bool): Collapse near-duplicate chunks across the namespace into one vector
+        pages (collection): Only embed the chunks from these page numbers
+        spool_file (str): Write the embedded chunks to this file instead of the namespace
+        
+    Returns:
+        dict: Chunk count, near-duplicates collapsed and embedding cache hits/misses
+    """
     # Initialize the embedding model
-    embedding_model = OllamaEmbeddings(model="nomic-embed-text")
+    embedding_model = CachedEmbeddings(model="nomic-embed-text", batch_size=batch_size, max_concurrency=max_concurrency)
     
     # Initialize text splitter for chunking
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
         length_function=len,
+        add_start_index=True,
     )
+
+    stats = {"chunks": 0, "duplicates": 0, "cache_hits": 0, "cache_misses": 0}
+    store = {}
+    deduper = None
+    if dedup and spool_file is None:
+        deduper = ChunkDeduper(dedup_path(namespace))
+    elif dedup and os.path.exists(dedup_path(namespace)):
+        deduper = ChunkDeduper(dedup_path(namespace), readonly=True)
+    spool = open(spool_file, "w", encoding="utf-8") if spool_file is not None else None
+
+    def flush(window):
+        if spool is None:
+            write_chunks(window, lambda unique: embedding_model.embed_documents(embedding_texts(unique)), deduper,
+                         stats, store, persist_directory=persist_directory, namespace=namespace,
+                         vector_backend=vector_backend)
+            return
+        unique = []
+        for doc in window:
+            if deduper is not None:
+                match, signature = deduper.find(doc.page_content)
+                if match is not None:
+                    continue
+                # Only kept in memory, so later chunks of this document match it
+                deduper.add_representative(str(uuid.uuid4()), signature, {})
+            unique.append(doc)
+        vectors = dict(zip(map(id, unique), embedding_model.embed_documents(embedding_texts(unique)))) if unique else {}
+        for doc in window:
+            spool.write(json.dumps({"text": doc.page_content, "metadata": doc.metadata,
+                                    "vector": vectors.get(id(doc))}) + "\n")
+        stats["chunks"] += len(unique)
+        stats["duplicates"] += len(window) - len(unique)
+
+    try:
+        window = []
+        for chunk in iter_chunks(folder_path, text_splitter, doc_id=doc_id, chunk_size=chunk_size, pages=pages):
+            window.append(chunk)
+            if len(window) >= window_size:
+                flush(window)
+                window = []
+        if window:
+            flush(window)
+    finally:
+        stats["cache_hits"] = embedding_model.hits
+        stats["cache_misses"] = embedding_model.misses
+        embedding_model.close()
+        if deduper is not None:
+            deduper.close()
+        if spool is not None:
+            spool.close()
+    return stats
+
+def store_spooled(spool_file, persist_directory="text_embeddings", window_size=256, namespace=DEFAULT_NAMESPACE,
+                  vector_backend="chroma", dedup=True):
+    """
+    Write the chunks an ingestion worker embedded into spool_file (see
+    embeddings()) to the namespace. Chroma, the BM25 index, the quantized
+    index and the dedup register are not safe to write from several
+    processes, so only the parent process calls this.
     
-    all_docs = []
-    
-    # Process each text file
-    for filename in os.listdir(folder_path):
-        if filename.endswith(".txt"):
-            file_path = os.path.join(folder_path, filename)
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                doc = Document(page_content=content, metadata={"source": filename})
-                chunks = text_splitter.split_documents([doc])
-                all_docs.extend(chunks)
+    Dedup is decided again here against the register as it is now. A chunk
+    the worker took for a duplicate, and so didn't embed, is embedded here
+    if it no longer matches anything.
     
-    db = Chroma.from_documents(all_docs, embedding_model, persist_directory=persist_directory)
+    Returns:
+        dict: Chunk count and near-duplicates collapsed
+    """
+    stats = {"chunks": 0, "duplicates": 0}
+    store = {}
+    deduper = ChunkDeduper(dedup_path(namespace)) if dedup else None
+    embedder = {}
+
+    def flush(window):
+        vectors = {id(doc): vector for doc, vector in window}
+
+        def vectors_for(unique):
+            missing = [doc for doc in unique if vectors[id(doc)] is None]
+            if missing:
+                if "model" not in embedder:
+                    embedder["model"] = CachedEmbeddings(model="nomic-embed-text")
+                for doc, vector in zip(missing, embedder["model"].embed_documents(embedding_texts(missing))):
+                    vectors[id(doc)] = vector
+            return [vectors[id(doc)] for doc in unique]
 
-def tables_to_db(json_path, dsn="PostgresDSN", schema="public"):
-    # Connect to your PostgreSQL database via DSN
-    conn = pyodbc.connect(f"DSN={dsn}")
+        write_chunks([doc for doc, _ in window], vectors_for, deduper, stats, store,
+                     persist_directory=persist_directory, namespace=namespace, vector_backend=vector_backend)
+
+    try:
+        window = []
+        with open(spool_file, "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                window.append((Document(page_content=chunk["text"], metadata=chunk["metadata"]), chunk["vector"]))
+                if len(window) >= window_size:
+                    flush(window)
+                    window = []
+        if window:
+            flush(window)
+    finally:
+        if deduper is not None:
+            deduper.close()
+        if "model" in embedder:
+            embedder["model"].close()
+    return stats
+
+# Records which document, page and region every extracted table came from
+TABLE_SOURCES = "table_sources"
+
+def ensure_table_sources(conn, schema="public"):
     cursor = conn.cursor()
+    try:
+        if schema != "public":
+            cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{schema}"')
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS "{schema}"."{TABLE_SOURCES}" (
+                table_name TEXT PRIMARY KEY,
+                doc_id TEXT,
+                source TEXT,
+                page INTEGER,
+                bbox TEXT
+            )
+        """)
+        conn.commit()
+    except Exception:
+        # Another worker created it at the same moment
+        conn.rollback()
+    finally:
+        cursor.close()
 
-    # Load JSON
+def iter_tables(json_path):
+    # Tables are stored one per line so only one is in memory at a time
     with open(json_path, "r", encoding="utf-8") as f:
-        tables = json.load(f)
+        for line in f:
+            yield json.loads(line)
 
-    for table in tables:
-        table_id = table.get("table_id")
-        data = table.get("data")
+def sample_rows(df, rows=3, max_chars=40):
+    # A few rows as short strings, enough to tell what the columns hold
+    return [[str(value)[:max_chars] for value in row] for row in df.head(rows).itertuples(index=False)]
 
-        if not data:
-            print(f"Skipping empty table {table_id}")
-            continue
+def tables_to_db(json_path, dsn="PostgresDSN", schema="public", table_prefix="table", doc_id=None,
+                 copy_conninfo=None, batch_size=1000):
+    """
+    Load the extracted tables into PostgreSQL, one transaction per table.
+    
+    Column types are inferred from the data. Rows are streamed in with COPY
+    when psycopg2 is installed and copy_conninfo is given, otherwise with
+    batched multi-row INSERTs over the pooled ODBC connection.
+    
+    Args:
+        json_path (str): JSON lines tables file written by parse()
+        dsn (str): The data source name for PostgreSQL connection
+        schema (str): Schema the tables are created in
+        table_prefix (str): Tables are named {table_prefix}_{table_id}
+        doc_id (str): Document id recorded in table_sources
+        copy_conninfo (str): libpq connection string for the COPY path,
+            e.g. "host=localhost dbname=table_db user=admin password=admin"
+        batch_size (int): Rows per INSERT statement on the ODBC path
+        
+    Returns:
+        dict: Each created table mapped to its column types, row count,
+            origin, a few sample rows and the text around it on the page
+    """
+    created = {}
+    use_copy = copy_conninfo is not None and psycopg2 is not None
+    if copy_conninfo is not None and psycopg2 is None:
+        print("psycopg2 is not installed, loading tables with batched INSERTs instead of COPY")
 
-        df = pd.DataFrame(data)
-        table_name = f"table_{table_id}"
+    # Borrow a pooled connection to your PostgreSQL database via DSN
+    with get_pool(f"DSN={dsn}").connection() as odbc_conn:
+        ensure_table_sources(odbc_conn, schema)
+        conn = psycopg2.connect(copy_conninfo) if use_copy else odbc_conn
+        try:
+            for table in iter_tables(json_path):
+                table_id = table.get("table_id")
+                data = table.get("data")
 
-        # Build CREATE TABLE SQL
-        create_stmt = f'CREATE TABLE "{schema}"."{table_name}" ('
-        for col in df.columns:
-            safe_col = col.replace(" ", "_")  # sanitize column names
-            create_stmt += f'"{safe_col}" TEXT, '
-        create_stmt = create_stmt.rstrip(", ") + ")"
+                if not data:
+                    print(f"Skipping empty table {table_id}")
+                    continue
 
-        try:
-            cursor.execute(f'DROP TABLE IF EXISTS "{schema}"."{table_name}"')
-            cursor.execute(create_stmt)
-            print(f"Created table: {schema}.{table_name}")
-        except Exception as e:
-            print(f"Error creating table {table_name}: {e}")
-            continue
-
-        # Insert rows
-        for _, row in df.iterrows():
-            columns = ", ".join([f'"{col.replace(" ", "_")}"' for col in df.columns])
-            placeholders = ", ".join(["?"] * len(df.columns))
-            values = tuple(row)
-            insert_sql = f'INSERT INTO "{schema}"."{table_name}" ({columns}) VALUES ({placeholders})'
-            cursor.execute(insert_sql, values)
-
-    conn.commit()
-    conn.close()
+                df = pd.DataFrame(data)
+                table_name = f"{table_prefix}_{table_id}"
+
+                def record_source(cursor, placeholder):
+                    cursor.execute(f'DELETE FROM "{schema}"."{TABLE_SOURCES}" WHERE table_name = {placeholder}', (table_name,))
+                    cursor.execute(
+                        f'INSERT INTO "{schema}"."{TABLE_SOURCES}" (table_name, doc_id, source, page, bbox) '
+                        f'VALUES ({", ".join([placeholder] * 5)})',
+                        (table_name, doc_id, table.get("source"), table.get("page"), table.get("bbox"))
+                    )
+
+                try:
+                    column_types = load_table(conn, schema, table_name, df, batch_size=batch_size, before_commit=record_source)
+                except Exception as e:
+                    print(f"Error loading table {table_name}: {e}")
+                    continue
+                created[table_name] = {
+                    "columns": column_types,
+                    "rows": len(df),
+                    "doc_id": doc_id,
+                    "source": table.get("source"),
+                    "page": table.get("page"),
+                    "sample": sample_rows(df),
+                    "context": table.get("context", "")
+                }
+                print(f"Loaded table: {schema}.{table_name} ({len(df)} rows, {', '.join(f'{c} {t}' for c, t in column_types.items())})")
+        finally:
+            if use_copy:
+                conn.close()
     print("All tables loaded successfully.")
-    print("All tables inserted.")
+    return created
+
+def document_slug(pdf_path):
+    """
+    Build a table-name-safe identifier for a PDF so that documents ingested
+    side by side never write to the same tables.
+    
+    The readable part is cut short and can be the same for different files
+    ("Q1 Report.pdf" and "q1-report.pdf"), so a hash of the file name is
+    appended to keep the identifier unique.
+    """
+    name = os.path.basename(pdf_path)
+    stem = Path(name).stem.lower()
+    slug = re.sub(r"[^a-z0-9]+", "_", stem).strip("_")[:31].strip("_") or "doc"
+    # 40 characters leaves room for the "_table_N" suffix inside PostgreSQL's 63 char limit
+    return f"{slug}_{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}"
+
+def document_ids(manifest):
+    """
+    Map each PDF in the manifest to the document id it was ingested under, so
+    a changed file keeps its id. Ids shared by several files (from before ids
+    were made unique) are left out so those files get fresh ones.
+    """
+    owners = {}
+    for entry in manifest["documents"].values():
+        owners.setdefault(entry["doc_id"], set()).add(os.path.basename(entry["pdf"]))
+    return {
+        os.path.basename(entry["pdf"]): entry["doc_id"]
+        for entry in manifest["documents"].values() if len(owners[entry["doc_id"]]) == 1
+    }
+
+def ingest_pdf(pdf_path, scratch_root="./src/parser_output", persist_directory="text_embeddings", dsn="PostgresDSN",
+               namespace=DEFAULT_NAMESPACE, vector_backend="chroma", doc_id=None, copy_conninfo=None, pages=None,
+               spool_file=None):
+    """
+    Run the full ingestion pipeline for a single PDF inside its own scratch directory.
+    
+    Args:
+        pdf_path (str): Path to the PDF file
+        scratch_root (str): Parent directory for the per-document scratch areas
+        persist_directory (str): Chroma persist directory
+        dsn (str): The data source name for PostgreSQL connection
+        namespace (str): Namespace the vectors and tables are written to
+        vector_backend (str): "chroma", "int8" or "pq", see embeddings()
+        doc_id (str): Id the document's vectors and tables are stored under,
+            defaults to document_slug(pdf_path)
+        copy_conninfo (str): libpq connection string to load tables with COPY, see tables_to_db()
+        pages (collection): Only embed these page numbers, the rest of the
+            document's vectors being unchanged; its tables are loaded in full
+        spool_file (str): Spool the embedded chunks to this file for the
+            parent process to store, see store_spooled()
+        
+    Returns:
+        dict: Page, chunk and table details for the document
+    """
+    os.makedirs(scratch_root, exist_ok=True)
+    slug = doc_id or document_slug(pdf_path)
+    output_dir = tempfile.mkdtemp(prefix=f"{slug}-", dir=scratch_root)
+    try:
+        result = parse(pdf_path, output_dir=output_dir)
+        image_stats = describe_image(result["images_dir"])
+        embedding_stats = embeddings(output_dir, persist_directory=persist_directory, doc_id=slug, namespace=namespace,
+                                     vector_backend=vector_backend, pages=pages, spool_file=spool_file)
+        tables = {}
+        if os.path.exists(result["tables_file"]):
+            tables = tables_to_db(result["tables_file"], dsn=dsn, schema=schema_name(namespace),
+                                  table_prefix=f"{slug}_table", doc_id=slug, copy_conninfo=copy_conninfo)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return {
+        "pdf": pdf_path,
+        "doc_id": slug,
+        "pages": result["pages"],
+        "page_hashes": result["page_hashes"],
+        "chunks": embedding_stats["chunks"],
+        "duplicates": embedding_stats["duplicates"],
+        "cache_hits": embedding_stats["cache_hits"],
+        "cache_misses": embedding_stats["cache_misses"],
+        "images": image_stats,
+        "tables": tables
+    }
+
+def remove_document(entry, persist_directory="text_embeddings", dsn="PostgresDSN", namespace=DEFAULT_NAMESPACE,
+                    pages=None):
+    """
+    Delete the vectors and tables that were produced from a document.
+    
+    Args:
+        entry (dict): The document's manifest entry
+        persist_directory (str): Chroma persist directory
+        dsn (str): The data source name for PostgreSQL connection
+        namespace (str): Namespace the document was ingested into
+        pages (collection): Only delete the vectors from these page numbers.
+            The tables are dropped either way
+    """
+    if pages is None:
+        print(f"Removing stale document: {entry['pdf']}")
+    else:
+        print(f"Removing {len(pages)} changed pages of {entry['pdf']}")
+    schema = schema_name(namespace)
+    if os.path.exists(persist_directory) and (pages is None or pages):
+        lexical_index = LexicalIndex(persist_directory, file_name=lexical_index_file(namespace))
+        quantized_index = QuantizedIndex(os.path.join(persist_directory, quantized_index_dir(namespace)))
+        # Opening Chroma for a quantized namespace would create an empty collection in it
+        vectorstore = None if quantized_index.exists() else Chroma(persist_directory=persist_directory,
+                                                                   collection_name=collection_name(namespace))
+
+        # Chunks this document shares with others are handed over to one of them instead of deleted
+        if os.path.exists(dedup_path(namespace)):
+            deduper = ChunkDeduper(dedup_path(namespace))
+            try:
+                promotions = deduper.remove_document(entry["doc_id"], pages=pages)
+            finally:
+                deduper.close()
+            if promotions:
+                ids = [chunk_id for chunk_id, _ in promotions]
+                metadatas = [metadata for _, metadata in promotions]
+                if vectorstore is None:
+                    quantized_index.update_metadata(ids, metadatas)
+                else:
+                    vectorstore._collection.update(ids=ids, metadatas=metadatas)
+                lexical_index.update_metadata(ids, metadatas)
+
+        if vectorstore is None:
+            quantized_index.delete_document(entry["doc_id"], pages=pages)
+        elif pages is None:
+            vectorstore._collection.delete(where={"doc_id": entry["doc_id"]})
+        else:
+            vectorstore._collection.delete(where={"$and": [{"doc_id": entry["doc_id"]}, {"page": {"$in": sorted(pages)}}]})
+        lexical_index.delete_document(entry["doc_id"], pages=pages)
+
+    if entry.get("tables"):
+        with get_pool(f"DSN={dsn}").connection() as conn:
+            cursor = conn.cursor()
+            for table_name in entry["tables"]:
+                cursor.execute(f'DROP TABLE IF EXISTS "{schema}"."{table_name}"')
+            cursor.execute(f'DELETE FROM "{schema}"."{TABLE_SOURCES}" WHERE doc_id = ?', entry["doc_id"])
+            conn.commit()
+            cursor.close()
+
+def main(pdf_input_directory="./src/pdf_input", workers=1, max_pending=None, scratch_root="./src/parser_output",
+         force=False, namespace=None, activate=False, vector_backend="chroma", copy_conninfo=None):
+    """
+    Ingest every PDF in the input directory.
+    
+    Args:
+        pdf_input_directory (str): Directory containing the PDFs
+        workers (int): Number of worker processes, 1 runs everything in-process
+        max_pending (int): Maximum number of documents queued or in flight at once,
+            defaults to twice the worker count
+        scratch_root (str): Parent directory for the per-document scratch areas
+        force (bool): Re-ingest every PDF even if it is unchanged since the last run
+        namespace (str): Namespace to ingest into, defaults to the active one.
+            Building into a fresh namespace leaves the live index untouched
+        activate (bool): Make the namespace the active one once ingestion succeeds
+        vector_backend (str): "chroma", or "int8" / "pq" to store vectors in a
+            compact memory-mapped QuantizedIndex. Keep one backend per namespace
+        copy_conninfo (str): libpq connection string; when set (and psycopg2 is
+            installed) tables are streamed in with COPY instead of INSERTs
+    """
+    # Traces are for questions; forked workers inherit this too
+    tracing.configure(enabled=False)
 
-def main(pdf_input_directory="./src/pdf_input"):
     #find all pdfs in the input directory
-    pdfs = [f for f in os.listdir(pdf_input_directory) if f.endswith(".pdf")]
-    for pdf in pdfs:
-        parse(os.path.join(pdf_input_directory, pdf))
-        describe_image("./src/parser_output/images")
-        embeddings("./src/parser_output")
-        tables_to_db("./src/parser_output/pdf_tables.json")
-        shutil.rmtree("./src/parser_output")
+    all_pdfs = [os.path.join(pdf_input_directory, f) for f in sorted(os.listdir(pdf_input_directory)) if f.endswith(".pdf")]
+    start = time.perf_counter()
+    completed = []
+    failed = []
+
+    namespace = validate_namespace(namespace or active_namespace())
+    # Only changes to the live index invalidate what queries have cached
+    live = namespace == active_namespace()
+    manifest_file = manifest_path(namespace)
+    catalog_file = schema_catalog_path(namespace)
+    print(f"Ingesting into namespace {namespace}{' (active)' if live else ''}")
+
+    manifest = load_manifest(manifest_file)
+    # Taken before removals so a changed file is re-ingested under its old id
+    known_ids = document_ids(manifest)
+    if force:
+        # Drop everything ingested before so the forced run doesn't duplicate it
+        for sha, entry in list(manifest["documents"].items()):
+            remove_document(entry, namespace=namespace)
+            del manifest["documents"][sha]
+    to_ingest, unchanged, removed = plan_ingestion(manifest, all_pdfs)
+    print(f"{len(to_ingest)} new or changed, {len(unchanged)} unchanged, {len(removed)} removed")
+    if live and (to_ingest or removed):
+        # Invalidate the schema catalog while the database is being changed
+        bump_generation()
+
+    hashes = {pdf: sha for pdf, sha in to_ingest}
+    pdfs = [pdf for pdf, _ in to_ingest]
+    doc_ids = {pdf: known_ids.get(os.path.basename(pdf)) or document_slug(pdf) for pdf in pdfs}
+
+    # A changed file keeps the vectors of its unchanged pages; only the pages whose hash moved are re-embedded
+    changed = {doc_ids[pdf]: pdf for pdf in pdfs if os.path.basename(pdf) in known_ids}
+    changed_pages = {}
+    for sha, entry in removed:
+        pdf = changed.get(entry["doc_id"])
+        if pdf is not None and entry.get("page_hashes"):
+            old, new = entry["page_hashes"], page_hashes(pdf)
+            changed_pages[pdf] = {page for page in range(1, max(len(old), len(new)) + 1)
+                                  if old[page - 1:page] != new[page - 1:page]}
+            remove_document(entry, namespace=namespace, pages=changed_pages[pdf])
+        else:
+            remove_document(entry, namespace=namespace)
+        del manifest["documents"][sha]
+    save_manifest(manifest, manifest_file)
+
+    def discard(pdf):
+        # A failed document is not in the manifest, yet its vectors may already be stored (they are
+        # written before its tables are loaded), so drop them to have the next run ingest it from
+        # scratch rather than on top of them
+        remove_document({"pdf": pdf, "doc_id": doc_ids[pdf]}, namespace=namespace)
+
+    def record(stats):
+        completed.append(stats)
+        manifest["documents"][hashes[stats["pdf"]]] = {
+            "pdf": stats["pdf"],
+            "doc_id": stats["doc_id"],
+            "page_hashes": stats["page_hashes"],
+            "tables": list(stats["tables"]),
+            "table_schemas": stats["tables"]
+        }
+        # Save as we go so an interrupted run resumes where it left off
+        save_manifest(manifest, manifest_file)
+
+    if workers <= 1:
+        for pdf in pdfs:
+            try:
+                record(ingest_pdf(pdf, scratch_root=scratch_root, namespace=namespace, vector_backend=vector_backend,
+                                  doc_id=doc_ids[pdf], copy_conninfo=copy_conninfo, pages=changed_pages.get(pdf)))
+            except Exception as e:
+                print(f"Error processing {pdf}: {e}")
+                failed.append(pdf)
+                discard(pdf)
+    else:
+        max_pending = max_pending or workers * 2
+        os.makedirs(scratch_root, exist_ok=True)
+        spool_files = {pdf: os.path.join(scratch_root, f"{doc_ids[pdf]}.vectors.jsonl") for pdf in pdfs}
+        # Create (or migrate) the dedup register up front so workers can open it read-only
+        ChunkDeduper(dedup_path(namespace)).close()
+        # Workers only parse, embed and load tables; the vectors they spool are
+        # written here, the one process that opens the namespace's stores
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            queue = iter(pdfs)
+            while True:
+                # Keep at most max_pending documents submitted so the queue stays bounded
+                for pdf in queue:
+                    pending[pool.submit(ingest_pdf, pdf, scratch_root, namespace=namespace,
+                                        vector_backend=vector_backend, doc_id=doc_ids[pdf],
+                                        copy_conninfo=copy_conninfo, pages=changed_pages.get(pdf),
+                                        spool_file=spool_files[pdf])] = pdf
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pdf = pending.pop(future)
+                    try:
+                        stats = future.result()
+                        stats.update(store_spooled(spool_files[pdf], namespace=namespace,
+                                                   vector_backend=vector_backend))
+                        record(stats)
+                    except Exception as e:
+                        print(f"Error processing {pdf}: {e}")
+                        failed.append(pdf)
+                        discard(pdf)
+                    finally:
+                        if os.path.exists(spool_files[pdf]):
+                            os.remove(spool_files[pdf])
+
+    shutil.rmtree(scratch_root, ignore_errors=True)
+
+    if vector_backend == "pq" and QuantizedIndex(os.path.join("text_embeddings", quantized_index_dir(namespace))).retrain():
+        print("Product quantization codebooks retrained on the grown index")
+
+    # Publish the schema of everything ingested so agents can read it instead of querying the database
+    if completed or removed or load_schema_catalog(catalog_file) is None:
+        # An inactive namespace's catalog is re-stamped when it is activated
+        generation = bump_generation() if live else current_generation()
+        catalog = {}
+        for entry in manifest["documents"].values():
+            catalog.update(entry.get("table_schemas", {}))
+        write_schema_catalog(catalog, generation, catalog_file)
+        print(f"Schema catalog updated to generation {generation} ({len(catalog)} tables)")
+
+        # Embed the tables now so questions can find the relevant ones without listing the schema
+        embedding_model = CachedEmbeddings(model="nomic-embed-text")
+        try:
+            embedded, dropped = TableIndex(table_index_path(namespace)).sync(catalog, embedding_model.embed_documents, generation)
+        finally:
+            embedding_model.close()
+        print(f"Table index: {embedded} tables embedded, {dropped} removed")
+
+    if activate and not live:
+        if failed:
+            print(f"Not activating namespace {namespace}: {len(failed)} documents failed")
+        else:
+            print(f"Namespace {namespace} is now active (generation {activate_namespace(namespace)})")
+
+    elapsed = time.perf_counter() - start
+    pages = sum(stats["pages"] for stats in completed)
     print("All PDFs processed.")
+    print(f"Documents: {len(completed)} ingested, {len(failed)} failed in {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"Throughput: {len(completed) / elapsed:.2f} docs/sec, {pages / elapsed:.2f} pages/sec")
+    duplicates = sum(stats["duplicates"] for stats in completed)
+    if duplicates:
+        print(f"Near-duplicate chunks collapsed into existing vectors: {duplicates}")
+    hits = sum(stats["cache_hits"] for stats in completed)
+    misses = sum(stats["cache_misses"] for stats in completed)
+    if hits + misses:
+        print(f"Embedding cache: {hits} hits, {misses} misses ({hits / (hits + misses):.0%} hit rate)")
+    described = sum(stats["images"]["described"] for stats in completed)
+    reused = sum(stats["images"]["reused"] for stats in completed)
+    skipped = sum(stats["images"]["skipped"] for stats in completed)
+    if described + reused + skipped:
+        print(f"Images: {described} described, {reused} reused from cache or duplicates, {skipped} skipped as too small")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Ingest PDFs into the vector store and database")
+    parser.add_argument("--input", default="./src/pdf_input", help="Directory containing the PDFs")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--max-pending", type=int, default=None, help="Maximum number of queued documents")
+    parser.add_argument("--force", action="store_true", help="Re-ingest every PDF, ignoring the manifest")
+    parser.add_argument("--namespace", default=None, help="Namespace to ingest into, defaults to the active one")
+    parser.add_argument("--activate", action="store_true", help="Swap the namespace in for queries when done")
+    parser.add_argument("--vector-backend", choices=["chroma", "int8", "pq"], default="chroma",
+                        help="Where vectors are stored: Chroma, or a quantized memory-mapped index")
+    parser.add_argument("--copy-conninfo", default=None,
+                        help='libpq connection string for loading tables with COPY, e.g. "host=localhost dbname=table_db user=admin password=admin"')
+    args = parser.parse_args()
+    main(pdf_input_directory=args.input, workers=args.workers, max_pending=args.max_pending, force=args.force,
+         namespace=args.namespace, activate=args.activate, vector_backend=args.vector_backend,
+         copy_conninfo=args.copy_conninfo)
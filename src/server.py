@@ -0,0 +1,167 @@
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), "src"))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import time
+import asyncio
+import argparse
+from collections import deque
+from aiohttp import web
+from agents.runtime import get_runtime
+from tools.answer_cache import normalize_question
+from tools.retrieval import get_retrieval_service
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+class QueryServer:
+    """
+    Answers questions over HTTP from one warm AgentRuntime.
+
+    At most max_questions questions run through the router and agents at
+    once; the rest wait in a queue. Ollama calls are not limited directly: a
+    question makes several in turn (routing, SQL, answer, and the agent's
+    steps if the router falls back to it), and with parallel set the context
+    and database agents generate at the same time, so more than max_questions
+    calls can be in flight. A question already being answered is not run again:
+    identical concurrent questions (after normalization) share one execution.
+    Cached answers are returned without waiting in the queue.
+
+    Args:
+        model (str): Model the runtime is built with
+        debug (bool): Print agent output and traces
+        parallel (bool): Gather context and database information concurrently
+        max_questions (int): Questions answered concurrently
+        latency_window (int): Number of recent requests the percentiles cover
+    """
+
+    def __init__(self, model="gemma3:27b", debug=False, parallel=False, max_questions=2, latency_window=1000):
+        self.model = model
+        self.debug = debug
+        self.parallel = parallel
+        self.max_questions = max_questions
+        self.runtime = None
+        self._semaphore = None
+        self._inflight = {}
+        self.waiting = 0
+        self.running = 0
+        self.stats = {"requests": 0, "coalesced": 0, "cache_hits": 0, "errors": 0}
+        self.latencies = deque(maxlen=latency_window)
+        self.started = time.time()
+
+    async def start(self, app=None):
+        # Build the agents and open the vector store before taking requests
+        self._semaphore = asyncio.Semaphore(self.max_questions)
+        self.runtime = await asyncio.to_thread(get_runtime, self.model, self.debug, self.parallel)
+        retrieval = get_retrieval_service()
+        # A quantized namespace is searched without Chroma; opening it would create an empty collection
+        if not retrieval.quantized_index.exists():
+            await asyncio.to_thread(retrieval._ensure_loaded)
+        print(f"Runtime ready in {self.runtime.startup_seconds:.2f}s, answering {self.max_questions} questions at a time")
+
+    async def _run(self, question):
+        if self.runtime.answer_cache is not None:
+            cached = await asyncio.to_thread(self.runtime.answer_cache.lookup, question)
+            if cached is not None:
+                self.stats["cache_hits"] += 1
+                return cached
+
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            # The cache was checked above, so a miss is not looked up and counted twice
+            return await asyncio.to_thread(self.runtime.answer, question, check_cache=False)
+        finally:
+            self.running -= 1
+            self._semaphore.release()
+
+    async def ask(self, question):
+        """
+        Returns:
+            tuple: (answer, whether it was shared with an identical request in flight)
+        """
+        self.stats["requests"] += 1
+        key = normalize_question(question)
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._run(question))
+            self._inflight[key] = task
+
+            def done(finished):
+                self._inflight.pop(key, None)
+                # Mark the error as seen in case every waiting client has gone away
+                if not finished.cancelled():
+                    finished.exception()
+            task.add_done_callback(done)
+        # Shield so one client disconnecting doesn't cancel the answer for the others
+        return await asyncio.shield(task), coalesced
+
+    def metrics(self):
+        latencies = list(self.latencies)
+        return {
+            "uptime_seconds": time.time() - self.started,
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "max_questions": self.max_questions,
+            "distinct_in_flight": len(self._inflight),
+            **self.stats,
+            "latency_p50_seconds": percentile(latencies, 50),
+            "latency_p95_seconds": percentile(latencies, 95),
+            "startup_seconds": self.runtime.startup_seconds if self.runtime else None
+        }
+
+    async def handle_ask(self, request):
+        try:
+            body = await request.json()
+        except Exception:
+            raise web.HTTPBadRequest(text="Expected a JSON body")
+        question = (body.get("question") or "").strip() if isinstance(body, dict) else ""
+        if not question:
+            raise web.HTTPBadRequest(text='Expected {"question": "..."}')
+
+        start = time.perf_counter()
+        try:
+            answer, coalesced = await self.ask(question)
+        except Exception as e:
+            self.stats["errors"] += 1
+            return web.json_response({"error": str(e)}, status=500)
+        elapsed = time.perf_counter() - start
+        self.latencies.append(elapsed)
+        return web.json_response({"answer": answer, "seconds": elapsed, "coalesced": coalesced})
+
+    async def handle_metrics(self, request):
+        return web.json_response(self.metrics())
+
+    async def handle_health(self, request):
+        return web.json_response({"ready": self.runtime is not None})
+
+    def app(self):
+        app = web.Application()
+        app.on_startup.append(self.start)
+        app.add_routes([
+            web.post("/ask", self.handle_ask),
+            web.get("/metrics", self.handle_metrics),
+            web.get("/health", self.handle_health)
+        ])
+        return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve questions over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-questions", type=int, default=2, help="Questions answered concurrently (each may make several Ollama calls)")
+    parser.add_argument("--parallel", action="store_true", help="Gather context and database information concurrently")
+    parser.add_argument("--debug", action="store_true")
+    args = parser.parse_args()
+    server = QueryServer(debug=args.debug, parallel=args.parallel, max_questions=args.max_questions)
+    web.run_app(server.app(), host=args.host, port=args.port)
@@ -0,0 +1,199 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from array import array
+import numpy as np
+from tools.catalog import STATE_DIR, current_generation
+from tools.lexical_index import tokenize, STOP_WORDS
+from ingestion.dedup import code_signature
+
+ANSWER_CACHE_PATH = os.path.join(STATE_DIR, "answer_cache.sqlite3")
+
+# Whole outputs that say the question wasn't answered: agent limits, tool
+# errors and a short "the information doesn't say" reply. Caching them would
+# keep returning a transient failure until the next ingestion. Answers that
+# merely contain such a phrase ("the warranty does not include...") are real
+# answers, so the pattern has to match the entire output
+REFUSAL = re.compile(
+    r"(agent stopped due to|query error|error listing tables)[\s\S]*"
+    r"|((i'?m )?sorry[,.!]?\s*(but\s*)?)?("
+    r"(the|this) (provided |given |available )?(information|context|documents?|database|data|text|evidence)"
+    r"( provided| given| above| below| available)? (does not|doesn't|do not|don't) (contain|include|mention|provide|say)"
+    r"|i (do not|don't) know"
+    r"|(i|we) (cannot|can't|can not|am unable to|are unable to|couldn't|could not) (answer|find|determine)"
+    r"|there (is|was) (not enough|no relevant|insufficient) information"
+    r")[^\n]{0,160}",
+    re.IGNORECASE
+)
+
+def normalize_question(question):
+    """
+    Lowercase, drop punctuation and collapse whitespace so trivially different
+    phrasings of the same question share a cache entry.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+def content_words(question):
+    """
+    The words of a question that carry its meaning, ignoring order and stop words.
+    """
+    return frozenset(token for token in tokenize(question) if token not in STOP_WORDS)
+
+def question_key(question):
+    """
+    What a near-duplicate question has to share exactly: its numbers and
+    codes and its content words. Only questions with the same key are
+    compared by embedding.
+    """
+    return code_signature(question), content_words(question)
+
+def is_refusal(answer):
+    """
+    Whether an output failed to answer the question rather than answering it.
+    """
+    return not answer or not answer.strip() or REFUSAL.fullmatch(answer.strip()) is not None
+
+class AnswerCache:
+    """
+    Persistent cache of final answers, keyed on the normalized question and the
+    ingestion generation. Questions that aren't an exact match can still hit
+    when their embedding is close enough to a cached question's and they ask
+    about the same things: the same numbers and codes (see
+    ingestion.dedup.code_signature) and the same words apart from stop words,
+    so "price of SKU-1234" never gets the answer for "SKU-1235"; a question
+    with no such candidate is a miss without being embedded. Entries from
+    older generations are dropped as soon as the corpus changes, and failed
+    answers (see is_refusal) are never stored.
+    
+    Args:
+        embed (callable): Turns a question into an embedding
+        path (str): SQLite file the answers are kept in
+        threshold (float): Cosine similarity a near-duplicate question needs
+    """
+
+    def __init__(self, embed, path=ANSWER_CACHE_PATH, threshold=0.95):
+        self.embed = embed
+        self.path = path
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._generation = None
+        self._answers = {}
+        self._questions = []
+        self._matrix = None
+        self._by_key = {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                question TEXT NOT NULL,
+                generation INTEGER NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (question, generation)
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _load(self, generation):
+        # Keep the current generation's entries in memory for similarity lookups
+        if self._generation == generation:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM answers WHERE generation != ?", (generation,))
+            rows = conn.execute("SELECT question, embedding, answer FROM answers WHERE generation = ?", (generation,)).fetchall()
+        conn.close()
+        self._answers = {}
+        self._questions = []
+        vectors = []
+        for question, blob, answer in rows:
+            self._answers[question] = answer
+            self._questions.append(question)
+            vectors.append(np.frombuffer(blob, dtype=np.float32))
+        self._matrix = self._normalized(vectors)
+        self._by_key = self._index_keys(self._questions)
+        self._generation = generation
+
+    @staticmethod
+    def _index_keys(questions):
+        by_key = {}
+        for row, question in enumerate(questions):
+            by_key.setdefault(question_key(question), []).append(row)
+        return by_key
+
+    @staticmethod
+    def _normalized(vectors):
+        if not len(vectors):
+            return None
+        matrix = np.vstack(vectors).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def lookup(self, question):
+        """
+        Returns:
+            str: The cached answer, or None on a miss
+        """
+        normalized = normalize_question(question)
+        generation = current_generation()
+        with self._lock:
+            self._load(generation)
+            if normalized in self._answers:
+                self.hits += 1
+                return self._answers[normalized]
+            # Embeddings of questions about different items can be close too, so only
+            # questions naming the same codes and content words are candidates
+            rows = self._by_key.get(question_key(normalized), [])
+            questions, matrix, answers = self._questions, self._matrix, self._answers
+
+        if rows:
+            vector = np.asarray(self.embed(question), dtype=np.float32)
+            scores = matrix[rows] @ (vector / (np.linalg.norm(vector) or 1))
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                with self._lock:
+                    self.hits += 1
+                return answers[questions[rows[best]]]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, question, answer):
+        """
+        Returns:
+            bool: Whether the answer was cached; failed answers are not
+        """
+        if is_refusal(answer):
+            return False
+        normalized = normalize_question(question)
+        generation = current_generation()
+        vector = self.embed(question)
+        with self._lock:
+            self._load(generation)
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO answers (question, generation, embedding, answer, created) VALUES (?, ?, ?, ?, ?)",
+                    (normalized, generation, array("f", vector).tobytes(), answer, time.time())
+                )
+            conn.close()
+            # Copies rather than in-place updates, so lookups outside the lock see a consistent set
+            vectors = [] if self._matrix is None else [row for question, row in zip(self._questions, self._matrix)
+                                                       if question != normalized]
+            questions = [question for question in self._questions if question != normalized]
+            self._answers = {**self._answers, normalized: answer}
+            self._questions = questions + [normalized]
+            self._matrix = self._normalized(vectors + [np.asarray(vector, dtype=np.float32)])
+            self._by_key = self._index_keys(self._questions)
+        return True
@@ -0,0 +1,157 @@
+import os
+import re
+import json
+from tools.lexical_index import LEXICAL_INDEX_FILE
+
+STATE_DIR = "./index_state"
+GENERATION_PATH = os.path.join(STATE_DIR, "generation.json")
+SCHEMA_CATALOG_PATH = os.path.join(STATE_DIR, "schema_catalog.json")
+ACTIVE_INDEX_PATH = os.path.join(STATE_DIR, "active_index.json")
+
+# The namespace used before namespacing existed: Chroma's default collection,
+# the public schema and the original state file names
+DEFAULT_NAMESPACE = "default"
+
+def _write_json(path, data):
+    # Write to a temp file first so readers never see a half-written file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+def current_generation(path=GENERATION_PATH):
+    """
+    Return the ingestion generation: a counter bumped every time ingestion or
+    clear.py changes the corpus. Anything derived from the corpus (schema
+    catalog, caches) is only valid for the generation it was built at.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["generation"]
+
+def bump_generation(path=GENERATION_PATH):
+    generation = current_generation(path) + 1
+    _write_json(path, {"generation": generation})
+    return generation
+
+def write_schema_catalog(tables, generation, path=SCHEMA_CATALOG_PATH):
+    """
+    Save the schema catalog for a generation.
+    
+    Args:
+        tables (dict): Table name mapped to its columns ({name: type}), row
+            count and originating source PDF, doc_id and page
+        generation (int): Generation the catalog describes
+        path (str): Where the catalog is kept
+    """
+    _write_json(path, {"generation": generation, "tables": tables})
+
+def load_schema_catalog(path=None):
+    """
+    Return the schema catalog of the active namespace, or None if there is
+    none or it was built for an older generation and can no longer be trusted.
+    """
+    path = path or schema_catalog_path(active_namespace())
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        catalog = json.load(f)
+    if catalog.get("generation") != current_generation():
+        return None
+    return catalog
+
+def format_schema_catalog(catalog, schema=None, details=False, order=None):
+    """
+    Render a catalog in the same shape as list_tables_and_columns output, plus
+    where each table was extracted from.
+    
+    Args:
+        catalog (dict): The catalog, or a subset of its tables
+        schema (str): Schema shown in table names, defaults to the active namespace's
+        details (bool): Also show the text around each table and its sample rows
+        order (list): Table names in the order to show them, alphabetical by default
+    """
+    schema = schema or schema_name(active_namespace())
+    output = []
+    for table_name in order or sorted(catalog["tables"]):
+        table = catalog["tables"][table_name]
+        output.append(f"\n📄 Table: {schema}.{table_name}")
+        if table.get("source"):
+            output.append(f"   From: {table['source']}, page {table.get('page')}")
+        if details and table.get("context"):
+            output.append(f"   About: {table['context']}")
+        for col_name, data_type in table["columns"].items():
+            output.append(f"   - {col_name} ({data_type})")
+        output.append(f"   → Row count: {table['rows']}")
+        if details and table.get("sample"):
+            output.append("   Sample rows:")
+            output.extend(f"     {' | '.join(row)}" for row in table["sample"])
+    return "\n".join(output) or "No tables found."
+
+
+def validate_namespace(namespace):
+    # Namespaces end up in collection, schema and file names
+    if not re.fullmatch(r"[a-z0-9_]{1,40}", namespace):
+        raise ValueError(f"Invalid namespace {namespace!r}: use 1-40 lowercase letters, digits or underscores")
+    return namespace
+
+def collection_name(namespace):
+    return "langchain" if namespace == DEFAULT_NAMESPACE else f"pdf_search_{namespace}"
+
+def schema_name(namespace):
+    return "public" if namespace == DEFAULT_NAMESPACE else f"ns_{namespace}"
+
+def lexical_index_file(namespace):
+    return LEXICAL_INDEX_FILE if namespace == DEFAULT_NAMESPACE else f"bm25_{namespace}.sqlite3"
+
+def quantized_index_dir(namespace):
+    return "quantized" if namespace == DEFAULT_NAMESPACE else f"quantized_{namespace}"
+
+def dedup_path(namespace):
+    name = "chunk_dedup.sqlite3" if namespace == DEFAULT_NAMESPACE else f"chunk_dedup_{namespace}.sqlite3"
+    return os.path.join(STATE_DIR, name)
+
+def table_index_path(namespace):
+    name = "table_index.sqlite3" if namespace == DEFAULT_NAMESPACE else f"table_index_{namespace}.sqlite3"
+    return os.path.join(STATE_DIR, name)
+
+def manifest_path(namespace):
+    name = "ingest_manifest.json" if namespace == DEFAULT_NAMESPACE else f"ingest_manifest_{namespace}.json"
+    return os.path.join(STATE_DIR, name)
+
+def schema_catalog_path(namespace):
+    return SCHEMA_CATALOG_PATH if namespace == DEFAULT_NAMESPACE else os.path.join(STATE_DIR, f"schema_catalog_{namespace}.json")
+
+def active_namespace(path=ACTIVE_INDEX_PATH):
+    """
+    Return the namespace queries are served from. Each namespace is its own
+    Chroma collection, PostgreSQL schema, BM25 file, manifest and schema
+    catalog, so an index can be built next to the live one and swapped in.
+    """
+    if not os.path.exists(path):
+        return DEFAULT_NAMESPACE
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["namespace"]
+
+def activate_namespace(namespace, path=ACTIVE_INDEX_PATH):
+    """
+    Point queries at another namespace in one atomic file replace.
+    
+    The generation is bumped so caches built from the old namespace are
+    dropped, and the new namespace's schema catalog is re-stamped with it.
+    
+    Returns:
+        int: The new generation
+    """
+    validate_namespace(namespace)
+    # Swap first and bump after, so nothing cached between the two outlives the swap
+    _write_json(path, {"namespace": namespace})
+    generation = bump_generation()
+    catalog_path = schema_catalog_path(namespace)
+    if os.path.exists(catalog_path):
+        with open(catalog_path, "r", encoding="utf-8") as f:
+            tables = json.load(f)["tables"]
+        write_schema_catalog(tables, generation, catalog_path)
+    return generation
@@ -0,0 +1,198 @@
+import re
+import math
+from typing import List, Dict
+
+# Close enough to the models' tokenizers for budgeting without loading one
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def _join_overlapping(first, second, min_overlap=20):
+    """
+    Join two chunks when the end of one repeats the start of the other, as
+    the text splitter's overlap does. Returns None if they don't overlap.
+    """
+    if second in first:
+        return first
+    probe = second[:min_overlap]
+    position = first.find(probe, max(0, len(first) - len(second) - min_overlap))
+    while position != -1:
+        if second.startswith(first[position:]):
+            return first + second[len(first) - position:]
+        position = first.find(probe, position + 1)
+    return None
+
+def merge_chunks(results: List[Dict]) -> List[Dict]:
+    """
+    Merge search results that overlap or touch on the same page into single
+    passages. Results are expected best first; a merged passage takes the
+    rank of its best chunk.
+
+    Chunks with a start_index are merged by character offset, older chunks
+    without one when the end of one repeats the start of the other.
+    """
+    passages = []
+    for rank, result in enumerate(results):
+        metadata = result.get("metadata") or {}
+        start = metadata.get("start_index")
+        passages.append({
+            "content": result["content"],
+            "metadata": metadata,
+            "rank": rank,
+            "start": start,
+            "end": None if start is None else start + len(result["content"]),
+            "chunks": 1,
+            "references": list(result.get("references", []))
+        })
+
+    groups = {}
+    for passage in passages:
+        metadata = passage["metadata"]
+        if metadata.get("kind", "text") != "text":
+            key = ("passage", passage["rank"])
+        else:
+            key = (metadata.get("doc_id") or metadata.get("source"), metadata.get("page"))
+        groups.setdefault(key, []).append(passage)
+
+    merged = []
+    for group in groups.values():
+        if all(p["start"] is not None for p in group):
+            group.sort(key=lambda p: p["start"])
+            current = group[0]
+            for passage in group[1:]:
+                if passage["start"] <= current["end"] + 1:
+                    overlap = current["end"] - passage["start"]
+                    if passage["end"] > current["end"]:
+                        current["content"] += passage["content"][max(0, overlap):]
+                        current["end"] = passage["end"]
+                    current["rank"] = min(current["rank"], passage["rank"])
+                    current["chunks"] += passage["chunks"]
+                    current["references"] += passage["references"]
+                else:
+                    merged.append(current)
+                    current = passage
+            merged.append(current)
+            continue
+
+        # No offsets: keep joining pairs until nothing else overlaps
+        remaining = list(group)
+        while remaining:
+            current = remaining.pop(0)
+            joined = True
+            while joined:
+                joined = False
+                for passage in remaining:
+                    text = _join_overlapping(current["content"], passage["content"]) or \
+                        _join_overlapping(passage["content"], current["content"])
+                    if text is not None:
+                        current["content"] = text
+                        current["rank"] = min(current["rank"], passage["rank"])
+                        current["chunks"] += passage["chunks"]
+                        current["references"] += passage["references"]
+                        remaining.remove(passage)
+                        joined = True
+                        break
+            merged.append(current)
+
+    merged.sort(key=lambda p: p["rank"])
+    return merged
+
+def truncate_to_budget(text, token_budget):
+    """
+    Cut text to about token_budget tokens at a line or word boundary.
+    """
+    limit = token_budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind("\n", 0, limit)
+    if cut < limit // 2:
+        cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip() + " ..."
+
+def describe_origin(metadata):
+    origin = metadata.get("source") or metadata.get("doc_id") or "unknown"
+    if metadata.get("page") is not None:
+        origin += f", page {metadata['page']}"
+    return origin
+
+def format_passage(passage, max_references=3):
+    metadata = passage["metadata"]
+    origin = describe_origin(metadata)
+    if metadata.get("kind") == "image":
+        origin += ", image"
+    if metadata.get("heading"):
+        origin += f", {metadata['heading']}"
+    # Near-duplicates collapsed into this chunk at ingestion
+    references = list(dict.fromkeys(describe_origin(ref) for ref in passage.get("references", [])))
+    if references:
+        origin += "; also in " + "; ".join(references[:max_references])
+        if len(references) > max_references:
+            origin += f" and {len(references) - max_references} more"
+    return f"[{origin}]\n{passage['content'].strip()}"
+
+def pack_context(results: List[Dict], token_budget=1500, duplicate_threshold=0.8) -> Dict:
+    """
+    Turn search results into one block of context that fits a token budget.
+
+    Overlapping and adjacent chunks from the same page are merged, passages
+    that are near-duplicates of a better ranked one (Jaccard similarity of
+    word 3-grams at or above duplicate_threshold) are dropped, and passages
+    are added best first until the budget is used up. A passage that doesn't
+    fit is cut down only if nothing has been packed yet.
+
+    Args:
+        results (list): Search results, best first, as returned by similarity_search
+        token_budget (int): Approximate number of tokens the context may use
+        duplicate_threshold (float): Similarity above which a passage counts as a duplicate
+
+    Returns:
+        dict: The packed text, its estimated tokens and how many passages
+            were packed, merged, dropped as duplicates or left out for space
+    """
+    passages = merge_chunks(results)
+    kept = []
+    kept_shingles = []
+    duplicates = 0
+    for passage in passages:
+        passage_shingles = shingles(passage["content"])
+        if any(jaccard(passage_shingles, other) >= duplicate_threshold for other in kept_shingles):
+            duplicates += 1
+            continue
+        kept.append(passage)
+        kept_shingles.append(passage_shingles)
+
+    packed = []
+    tokens = 0
+    left_out = 0
+    for passage in kept:
+        text = format_passage(passage)
+        cost = estimate_tokens(text) + 1
+        if tokens + cost > token_budget:
+            if not packed:
+                text = truncate_to_budget(text, token_budget)
+                packed.append(text)
+                tokens += estimate_tokens(text)
+            else:
+                left_out += 1
+            continue
+        packed.append(text)
+        tokens += cost
+
+    return {
+        "text": "\n\n".join(packed),
+        "tokens": tokens,
+        "passages": len(packed),
+        "merged": len(results) - len(passages),
+        "duplicates": duplicates,
+        "left_out": left_out
+    }
@@ -0,0 +1,92 @@
+import os
+import queue
+import threading
+from contextlib import contextmanager
+import pyodbc
+
+def connection_string(
+    db_server: str = "localhost",
+    db_database: str = "table_db",
+    db_user: str = "admin",
+    db_password: str = "admin",
+    db_port: int = 5432,
+    driver: str = "PostgreSQL",
+    fetch_size: int = 100
+) -> str:
+    # psqlODBC buffers a whole result set on execute unless UseDeclareFetch is
+    # on; with it, rows are read through a cursor fetch_size at a time
+    return (
+        f"DRIVER={{{driver}}};"
+        f"SERVER={db_server};"
+        f"DATABASE={db_database};"
+        f"UID={db_user};"
+        f"PWD={db_password};"
+        f"PORT={db_port};"
+        f"UseDeclareFetch=1;"
+        f"Fetch={fetch_size};"
+    )
+
+class ConnectionPool:
+    """
+    Bounded pool of pyodbc connections for one connection string.
+    
+    At most max_size connections exist at once; callers beyond that wait up to
+    timeout seconds for one to be handed back. Connections are rolled back
+    before they return to the pool, and dropped if that fails.
+    
+    Args:
+        conn_str (str): ODBC connection string
+        max_size (int): Maximum number of open connections
+        timeout (float): Seconds to wait for a free connection
+    """
+
+    def __init__(self, conn_str, max_size=8, timeout=30):
+        self.conn_str = conn_str
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection free after {self.timeout}s")
+        conn = None
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = pyodbc.connect(self.conn_str)
+            yield conn
+        finally:
+            if conn is not None:
+                self._release(conn)
+            self._slots.release()
+
+    def _release(self, conn):
+        try:
+            # Never hand an open transaction to the next caller
+            conn.rollback()
+        except pyodbc.Error:
+            try:
+                conn.close()
+            except pyodbc.Error:
+                pass
+            return
+        self._idle.put(conn)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(conn_str, max_size=8) -> ConnectionPool:
+    """
+    Return the process-wide pool for a connection string, creating it on first use.
+    
+    Pools are kept per process id: a forked ingestion worker inherits its
+    parent's pools, and taking the parent's idle connections would have
+    several processes talking over one socket.
+    """
+    key = (os.getpid(), conn_str)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(conn_str, max_size=max_size)
+        return _pools[key]
@@ -0,0 +1,263 @@
+import os
+import re
+import json
+import math
+import sqlite3
+from collections import Counter
+from typing import List, Dict, Optional
+
+LEXICAL_INDEX_FILE = "bm25.sqlite3"
+
+# Keeps product codes, SKUs and part numbers like "AB-1234/X" together as one token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+
+# Words that carry no meaning on their own and appear in nearly every chunk;
+# left out of queries so they don't drag whole-corpus postings into scoring
+STOP_WORDS = frozenset("""
+a an and are as at be been but by can could did do does for from had has have how i if in into is it its
+me my no not of on or our should so than that the their them then there these they this those to was we
+were what when where which who whom why will with would you your about any all also me show tell find give list
+""".split())
+
+def tokenize(text):
+    """
+    Lowercase word tokens. Compound codes are indexed both whole and by their
+    parts, so "SKU-1234" matches queries for "sku-1234", "sku 1234" or "1234".
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[-_./]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+def filter_doc_ids(metadata_filter):
+    """
+    The doc_ids a Chroma-style filter requires, or None if it doesn't pin the
+    document down (no doc_id condition, or one under $or / $ne).
+    """
+    for key, condition in (metadata_filter or {}).items():
+        if key == "doc_id":
+            if isinstance(condition, dict):
+                if "$eq" in condition:
+                    return [condition["$eq"]]
+                if "$in" in condition:
+                    return list(condition["$in"])
+            else:
+                return [condition]
+        elif key == "$and":
+            for sub in condition:
+                doc_ids = filter_doc_ids(sub)
+                if doc_ids is not None:
+                    return doc_ids
+    return None
+
+def matches_filter(metadata, metadata_filter):
+    """
+    Evaluate a Chroma-style where filter (equality, $eq, $ne, $in, $nin, $gt,
+    $gte, $lt, $lte, $and, $or) against a chunk's metadata.
+    """
+    if not metadata_filter:
+        return True
+    for key, condition in metadata_filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for op, expected in condition.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if op == "$gt" and not value > expected:
+                        return False
+                    if op == "$gte" and not value >= expected:
+                        return False
+                    if op == "$lt" and not value < expected:
+                        return False
+                    if op == "$lte" and not value <= expected:
+                        return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+class LexicalIndex:
+    """
+    BM25 inverted index over the same chunks as the vector store, kept in a
+    SQLite file inside the Chroma persist directory.
+    
+    Scoring and top-k selection run in SQLite, and query words that are stop
+    words or appear in more than max_df of the chunks are skipped, so a search
+    only touches the postings of its selective terms.
+    
+    Args:
+        persist_directory (str): Chroma persist directory the index lives in
+        file_name (str): Index file name, one per namespace
+        k1 (float): BM25 term frequency saturation
+        b (float): BM25 length normalization
+        max_df (float): Fraction of chunks above which a query term is too common to score
+    """
+
+    def __init__(self, persist_directory="./text_embeddings", file_name=LEXICAL_INDEX_FILE, k1=1.2, b=0.75, max_df=0.5):
+        self.path = os.path.join(persist_directory, file_name)
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                doc_id TEXT,
+                length INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        conn.execute("CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS postings_term ON postings (term)")
+        conn.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id)")
+        return conn
+
+    def add(self, ids, texts, metadatas):
+        conn = self._connect()
+        try:
+            with conn:
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    counts = Counter(tokenize(text))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO chunks (id, doc_id, length, content, metadata) VALUES (?, ?, ?, ?, ?)",
+                        (chunk_id, metadata.get("doc_id"), sum(counts.values()), text, json.dumps(metadata))
+                    )
+                    conn.executemany(
+                        "INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                        [(term, chunk_id, tf) for term, tf in counts.items()]
+                    )
+        finally:
+            conn.close()
+
+    def update_metadata(self, ids, metadatas):
+        if not self.exists():
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "UPDATE chunks SET doc_id = ?, metadata = ? WHERE id = ?",
+                    [(metadata.get("doc_id"), json.dumps(metadata), chunk_id) for chunk_id, metadata in zip(ids, metadatas)]
+                )
+        finally:
+            conn.close()
+
+    def delete_document(self, doc_id, pages=None):
+        """
+        Delete a document's chunks, or with pages only those from these page numbers.
+        """
+        if not self.exists():
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                if pages is None:
+                    conn.execute("DELETE FROM postings WHERE chunk_id IN (SELECT id FROM chunks WHERE doc_id = ?)", (doc_id,))
+                    conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                else:
+                    ids = [(chunk_id,) for chunk_id, metadata in conn.execute(
+                        "SELECT id, metadata FROM chunks WHERE doc_id = ?", (doc_id,)
+                    ).fetchall() if json.loads(metadata).get("page") in pages]
+                    conn.executemany("DELETE FROM postings WHERE chunk_id = ?", ids)
+                    conn.executemany("DELETE FROM chunks WHERE id = ?", ids)
+        finally:
+            conn.close()
+
+    def search(self, query: str, k: int = 5, metadata_filter: Optional[Dict] = None) -> List[Dict]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        # A query of nothing but stop words still searches for them
+        terms = [term for term in terms if term not in STOP_WORDS] or terms
+        if not terms or not self.exists():
+            return []
+        conn = self._connect()
+        try:
+            total, avg_length = conn.execute("SELECT COUNT(*), AVG(length) FROM chunks").fetchone()
+            if not total:
+                return []
+            placeholders = ", ".join(["?"] * len(terms))
+            doc_freq = dict(conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+            ).fetchall())
+            if not doc_freq:
+                return []
+            selective = {term: df for term, df in doc_freq.items() if df <= self.max_df * total}
+            # Keep the rarest term when every one is common, so there is something to rank by
+            doc_freq = selective or dict([min(doc_freq.items(), key=lambda item: item[1])])
+            idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+            # BM25 summed per chunk in SQL; idf comes in as a VALUES table
+            values = ", ".join(["(?, ?)"] * len(idf))
+            sql = f"""
+                WITH q(term, idf) AS (VALUES {values})
+                SELECT p.chunk_id, SUM(q.idf * p.tf * ? / (p.tf + ? * (1 - ? + ? * c.length / ?))) AS score
+                FROM postings p JOIN q ON q.term = p.term JOIN chunks c ON c.id = p.chunk_id
+            """
+            params = [value for item in idf.items() for value in item] + [self.k1 + 1, self.k1, self.b, self.b, avg_length or 1]
+            doc_ids = filter_doc_ids(metadata_filter)
+            if doc_ids is not None:
+                sql += f" WHERE c.doc_id IN ({', '.join(['?'] * len(doc_ids))})"
+                params += doc_ids
+            sql += " GROUP BY p.chunk_id ORDER BY score DESC LIMIT ? OFFSET ?"
+
+            results = []
+            # Other filter conditions are checked on the ranked chunks, a page at a time
+            page = k if not metadata_filter else k * 4
+            offset = 0
+            while len(results) < k:
+                ranked = conn.execute(sql, params + [page, offset]).fetchall()
+                if not ranked:
+                    break
+                ids = [chunk_id for chunk_id, _ in ranked]
+                rows = dict((chunk_id, (content, metadata)) for chunk_id, content, metadata in conn.execute(
+                    f"SELECT id, content, metadata FROM chunks WHERE id IN ({', '.join(['?'] * len(ids))})", ids
+                ))
+                for chunk_id, score in ranked:
+                    content, metadata = rows[chunk_id]
+                    metadata = json.loads(metadata)
+                    if not matches_filter(metadata, metadata_filter):
+                        continue
+                    results.append({"content": content, "metadata": metadata, "score": score})
+                    if len(results) >= k:
+                        break
+                offset += page
+            return results
+        finally:
+            conn.close()
+
+def reciprocal_rank_fusion(rankings, k: int = 5, constant: int = 60) -> List[Dict]:
+    """
+    Merge several ranked result lists: each result scores the sum of
+    1 / (constant + rank) over the lists it appears in. Results are matched
+    by content, and the fused score replaces the per-list score.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            entry = fused.setdefault(result["content"], {**result, "score": 0.0})
+            entry["score"] += 1.0 / (constant + rank)
+    return sorted(fused.values(), key=lambda r: r["score"], reverse=True)[:k]
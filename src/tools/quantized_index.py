@@ -0,0 +1,409 @@
+import os
+import json
+import sqlite3
+import threading
+from typing import List, Dict, Optional
+import numpy as np
+from tools.lexical_index import matches_filter
+
+HEADER_FILE = "index.json"
+CODES_FILE = "codes.bin"
+SCALES_FILE = "scales.f32"
+VECTORS_FILE = "vectors.f32"
+CODEBOOKS_FILE = "codebooks.npy"
+META_FILE = "meta.sqlite3"
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def quantize_int8(vectors):
+    """
+    Symmetric per-vector int8 quantization: each vector is scaled so its
+    largest component maps to 127.
+
+    Returns:
+        tuple: (int8 codes, float32 scale per vector)
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def _nearest(data, centers, block=65536):
+    # Squared L2 to every center, a block of rows at a time to bound memory
+    center_norms = (centers ** 2).sum(axis=1)
+    assignments = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), block):
+        rows = data[start:start + block]
+        distances = center_norms[None, :] - 2 * rows @ centers.T
+        assignments[start:start + block] = distances.argmin(axis=1)
+    return assignments
+
+def train_codebooks(vectors, subspaces, centroids=256, iterations=12, seed=0):
+    """
+    Train product quantization codebooks with k-means in each subspace.
+
+    Returns:
+        np.ndarray: (subspaces, centroids, dim // subspaces) float32 codebooks
+    """
+    rng = np.random.default_rng(seed)
+    count, dim = vectors.shape
+    width = dim // subspaces
+    centroids = min(centroids, count)
+    codebooks = np.empty((subspaces, centroids, width), dtype=np.float32)
+    for m in range(subspaces):
+        data = vectors[:, m * width:(m + 1) * width]
+        centers = data[rng.choice(count, centroids, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = _nearest(data, centers)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, assignments, data)
+            counts = np.bincount(assignments, minlength=centroids)
+            filled = counts > 0
+            centers[filled] = sums[filled] / counts[filled, None]
+        codebooks[m] = centers
+    return codebooks
+
+def encode_pq(vectors, codebooks):
+    subspaces, _, width = codebooks.shape
+    codes = np.empty((len(vectors), subspaces), dtype=np.uint8)
+    for m in range(subspaces):
+        codes[:, m] = _nearest(vectors[:, m * width:(m + 1) * width], codebooks[m])
+    return codes
+
+class QuantizedIndex:
+    """
+    Compact vector index kept as flat files in a directory: quantized codes
+    (int8, or product quantization with one byte per subspace) for scoring,
+    the full float32 vectors for an exact re-rank of the top candidates, and
+    chunk text and metadata in SQLite. The arrays are memory-mapped, so
+    opening the index costs milliseconds and only the pages a search touches
+    are read.
+
+    Vectors are normalized on the way in and scored by inner product (cosine
+    similarity); results report the squared L2 distance between the unit
+    vectors, 2 - 2 * cosine, so scores mean the same as Chroma's.
+
+    Writes are appends and not safe from several processes at once;
+    pdf_parser only writes from the parent process (see store_spooled), and
+    the header is replaced last so readers only ever see complete rows.
+
+    Args:
+        directory (str): Where the index files are kept
+        quantization (str): "int8" or "pq", used when the index is created
+        pq_width (int): Dimensions per PQ subspace
+        block_size (int): Rows scored per vectorized step
+    """
+
+    def __init__(self, directory, quantization="int8", pq_width=8, block_size=65536):
+        if quantization not in ("int8", "pq"):
+            raise ValueError(f"Unknown quantization {quantization!r}, expected 'int8' or 'pq'")
+        self.directory = directory
+        self.quantization = quantization
+        self.pq_width = pq_width
+        self.block_size = block_size
+        self._state = None
+        self._state_key = None
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def exists(self):
+        return os.path.exists(self._path(HEADER_FILE))
+
+    def _read_header(self):
+        with open(self._path(HEADER_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_header(self, header):
+        tmp_path = self._path(f"{HEADER_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self._path(HEADER_FILE))
+
+    def _connect(self):
+        os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(self._path(META_FILE), timeout=60)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                id TEXT,
+                doc_id TEXT,
+                content TEXT,
+                metadata TEXT,
+                deleted INTEGER DEFAULT 0
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id)")
+        return conn
+
+    def _load(self):
+        """
+        Map the arrays for the current header, reopening them only when the
+        header has changed since the last search.
+        """
+        if not self.exists():
+            return None
+        stat = os.stat(self._path(HEADER_FILE))
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self._state_key == key:
+                return self._state
+            header = self._read_header()
+            count, dim = header["count"], header["dim"]
+            if count == 0:
+                state = None
+            else:
+                state = {
+                    "header": header,
+                    "codes": np.memmap(self._path(CODES_FILE), dtype=np.int8 if header["quantization"] == "int8" else np.uint8,
+                                       mode="r", shape=(count, header["code_width"])),
+                    "vectors": np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, dim)),
+                    "scales": None,
+                    "codebooks": None
+                }
+                if header["quantization"] == "int8":
+                    state["scales"] = np.memmap(self._path(SCALES_FILE), dtype=np.float32, mode="r", shape=(count,))
+                else:
+                    state["codebooks"] = np.load(self._path(CODEBOOKS_FILE))
+                conn = self._connect()
+                try:
+                    deleted = [row for (row,) in conn.execute("SELECT row FROM chunks WHERE deleted = 1")]
+                finally:
+                    conn.close()
+                state["deleted"] = np.array(deleted, dtype=np.int64)
+            self._state, self._state_key = state, key
+            return state
+
+    def add(self, ids, vectors, texts, metadatas):
+        vectors = normalize(vectors)
+        if not len(vectors):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if self.exists():
+            header = self._read_header()
+        else:
+            header = {"dim": vectors.shape[1], "count": 0, "quantization": self.quantization, "version": 0}
+            if self.quantization == "int8":
+                header["code_width"] = vectors.shape[1]
+            else:
+                width = self.pq_width if vectors.shape[1] % self.pq_width == 0 else 1
+                header["code_width"] = vectors.shape[1] // width
+        if vectors.shape[1] != header["dim"]:
+            raise ValueError(f"Expected {header['dim']}-dimensional vectors, got {vectors.shape[1]}")
+
+        if header["quantization"] == "int8":
+            codes, scales = quantize_int8(vectors)
+            with open(self._path(SCALES_FILE), "ab") as f:
+                f.write(scales.tobytes())
+        else:
+            if not os.path.exists(self._path(CODEBOOKS_FILE)):
+                # Trained on the first batch; retrain() refits them once the index has grown
+                np.save(self._path(CODEBOOKS_FILE), train_codebooks(vectors, header["code_width"]))
+                header["trained_on"] = len(vectors)
+            codes = encode_pq(vectors, np.load(self._path(CODEBOOKS_FILE)))
+        with open(self._path(CODES_FILE), "ab") as f:
+            f.write(codes.tobytes())
+        with open(self._path(VECTORS_FILE), "ab") as f:
+            f.write(vectors.tobytes())
+
+        start = header["count"]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO chunks (row, id, doc_id, content, metadata) VALUES (?, ?, ?, ?, ?)",
+                    [(start + i, chunk_id, metadata.get("doc_id"), text, json.dumps(metadata))
+                     for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas))]
+                )
+        finally:
+            conn.close()
+        header["count"] = start + len(vectors)
+        header["version"] += 1
+        self._write_header(header)
+
+    def retrain(self, sample_size=100000, seed=0):
+        """
+        Refit the PQ codebooks on a sample of the stored vectors and re-encode
+        every row. Only done when the index has at least doubled since the
+        codebooks were trained, so the cost stays proportional to what was added.
+
+        Returns:
+            bool: Whether the codebooks were retrained
+        """
+        if not self.exists():
+            return False
+        header = self._read_header()
+        if header["quantization"] != "pq" or header["count"] < 2 * header.get("trained_on", 0):
+            return False
+        vectors = np.memmap(self._path(VECTORS_FILE), dtype=np.float32, mode="r", shape=(header["count"], header["dim"]))
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(header["count"], min(sample_size, header["count"]), replace=False))]
+        codebooks = train_codebooks(np.asarray(sample), header["code_width"], seed=seed)
+
+        # Write new files next to the old ones and swap them in, so searches keep using the old ones until then
+        tmp_codes = self._path(f"{CODES_FILE}.tmp")
+        with open(tmp_codes, "wb") as f:
+            for start in range(0, header["count"], self.block_size):
+                f.write(encode_pq(np.asarray(vectors[start:start + self.block_size]), codebooks).tobytes())
+        tmp_codebooks = self._path("codebooks.tmp.npy")
+        np.save(tmp_codebooks, codebooks)
+        os.replace(tmp_codebooks, self._path(CODEBOOKS_FILE))
+        os.replace(tmp_codes, self._path(CODES_FILE))
+        header["trained_on"] = header["count"]
+        header["version"] += 1
+        self._write_header(header)
+        return True
+
+    def update_metadata(self, ids, metadatas):
+        if not self.exists():
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "UPDATE chunks SET doc_id = ?, metadata = ? WHERE id = ?",
+                    [(metadata.get("doc_id"), json.dumps(metadata), chunk_id) for chunk_id, metadata in zip(ids, metadatas)]
+                )
+        finally:
+            conn.close()
+
+    def delete_document(self, doc_id, pages=None):
+        """
+        Tombstone a document's rows, or with pages only those from these page
+        numbers; they are skipped by searches and their space is reclaimed
+        when the namespace is rebuilt.
+        """
+        if not self.exists():
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                if pages is None:
+                    conn.execute("UPDATE chunks SET deleted = 1 WHERE doc_id = ?", (doc_id,))
+                else:
+                    conn.executemany("UPDATE chunks SET deleted = 1 WHERE row = ?", [
+                        (row,) for row, metadata in conn.execute(
+                            "SELECT row, metadata FROM chunks WHERE doc_id = ? AND deleted = 0", (doc_id,)
+                        ).fetchall() if json.loads(metadata).get("page") in pages
+                    ])
+        finally:
+            conn.close()
+        header = self._read_header()
+        header["version"] += 1
+        self._write_header(header)
+
+    def count(self):
+        return self._read_header()["count"] if self.exists() else 0
+
+    def _approximate_top(self, state, query, candidates):
+        header = state["header"]
+        codes = state["codes"]
+        if header["quantization"] == "pq":
+            codebooks = state["codebooks"]
+            subspaces, _, width = codebooks.shape
+            # Inner product of each query subvector with every centroid, looked up per code
+            table = np.einsum("mkd,md->mk", codebooks, query.reshape(subspaces, width))
+            columns = np.arange(subspaces)[None, :]
+
+        best_rows = []
+        best_scores = []
+        for start in range(0, len(codes), self.block_size):
+            block = np.asarray(codes[start:start + self.block_size])
+            if header["quantization"] == "int8":
+                scores = (block.astype(np.float32) @ query) * state["scales"][start:start + len(block)]
+            else:
+                scores = table[columns, block].sum(axis=1)
+            deleted = state["deleted"]
+            if len(deleted):
+                in_block = deleted[(deleted >= start) & (deleted < start + len(block))] - start
+                scores[in_block] = -np.inf
+            if len(scores) > candidates:
+                top = np.argpartition(-scores, candidates)[:candidates]
+            else:
+                top = np.arange(len(scores))
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+
+        rows = np.concatenate(best_rows)
+        scores = np.concatenate(best_scores)
+        keep = np.isfinite(scores)
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > candidates:
+            top = np.argpartition(-scores, candidates)[:candidates]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return rows[order], scores[order]
+
+    def search(self, vector, k: int = 5, metadata_filter: Optional[Dict] = None, rerank: bool = True,
+               candidates: Optional[int] = None) -> List[Dict]:
+        """
+        Return the k nearest chunks to a query vector.
+
+        Args:
+            vector (list): Query embedding
+            k (int): Number of results
+            metadata_filter (dict): Filter on chunk metadata, same syntax as Chroma's where
+            rerank (bool): Re-score the candidates with the full float32 vectors
+            candidates (int): Approximate candidates kept for the re-rank, by default
+                10 * k for int8 and 50 * k for the coarser PQ scores.
+                With a filter the search widens until k matches are found or the
+                whole index has been considered
+        """
+        state = self._load()
+        if state is None:
+            return []
+        query = normalize(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        total = state["header"]["count"]
+        if candidates is None:
+            candidates = max((10 if state["header"]["quantization"] == "int8" else 50) * k, 50)
+        candidates = min(total, candidates)
+
+        while True:
+            rows, scores = self._approximate_top(state, query, candidates)
+            if rerank and len(rows):
+                # Gather in file order so the reads from the mapped file are sequential
+                file_order = np.argsort(rows)
+                exact = np.asarray(state["vectors"][rows[file_order]]) @ query
+                scores = np.empty_like(exact)
+                scores[file_order] = exact
+                order = np.argsort(-scores)
+                rows, scores = rows[order], scores[order]
+
+            results = self._fetch(rows, scores, k, metadata_filter)
+            if len(results) >= k or candidates >= total or metadata_filter is None:
+                return results
+            candidates = min(total, candidates * 10)
+
+    def _fetch(self, rows, scores, k, metadata_filter):
+        if not len(rows):
+            return []
+        conn = self._connect()
+        try:
+            found = {}
+            row_list = [int(row) for row in rows]
+            for start in range(0, len(row_list), 500):
+                batch = row_list[start:start + 500]
+                placeholders = ", ".join(["?"] * len(batch))
+                for row, content, metadata in conn.execute(
+                    f"SELECT row, content, metadata FROM chunks WHERE deleted = 0 AND row IN ({placeholders})", batch
+                ):
+                    found[row] = (content, json.loads(metadata))
+        finally:
+            conn.close()
+
+        results = []
+        for row, score in zip(row_list, scores):
+            if row not in found:
+                continue
+            content, metadata = found[row]
+            if metadata_filter and not matches_filter(metadata, metadata_filter):
+                continue
+            results.append({"content": content, "metadata": metadata, "score": float(2 - 2 * score)})
+            if len(results) >= k:
+                break
+        return results
@@ -0,0 +1,206 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional
+from langchain_chroma import Chroma
+from langchain_ollama import OllamaEmbeddings
+from tools.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from tools.quantized_index import QuantizedIndex
+from tools.catalog import active_namespace, collection_name, lexical_index_file, quantized_index_dir, dedup_path
+from ingestion.dedup import ChunkDeduper
+from tools.tracing import span
+
+# Each list fused by a hybrid search goes this many times deeper than k so
+# fusion has overlap to work with
+HYBRID_DEPTH = 4
+
+class RetrievalService:
+    """
+    Long-lived handle on the vector store. The embedding client and the Chroma
+    collection are created on first use and then shared by every search, and
+    recent query embeddings are kept in a small LRU cache, so a search only
+    pays for the nearest-neighbour lookup.
+    
+    Searches follow the active namespace (see tools.catalog): when another
+    index is swapped in, the next search reopens the collection and BM25
+    index it points at. Namespaces ingested with a quantized vector backend
+    are searched through their QuantizedIndex instead of Chroma. The
+    namespace's dedup register is opened once too, and reopened only when
+    the file is replaced.
+    
+    Args:
+        persist_directory (str): Chroma persist directory
+        model (str): Ollama embedding model name
+        query_cache_size (int): Number of query embeddings kept in memory
+    """
+
+    def __init__(self, persist_directory="./text_embeddings", model="nomic-embed-text", query_cache_size=256):
+        self.persist_directory = persist_directory
+        self.model = model
+        self.query_cache_size = query_cache_size
+        self._embedding_model = None
+        self._db = None
+        self._query_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._namespace = None
+        self.lexical_index = None
+        self.quantized_index = None
+        self._deduper = None
+        self._deduper_file = None
+        self._deduper_lock = threading.Lock()
+        self._check_namespace()
+
+    def _check_namespace(self):
+        namespace = active_namespace()
+        if namespace != self._namespace:
+            with self._lock:
+                if namespace != self._namespace:
+                    self.lexical_index = LexicalIndex(self.persist_directory, file_name=lexical_index_file(namespace))
+                    self.quantized_index = QuantizedIndex(os.path.join(self.persist_directory, quantized_index_dir(namespace)))
+                    self._db = None
+                    self._namespace = namespace
+        return namespace
+
+    def _open_deduper(self, namespace):
+        # Called with _deduper_lock held. The register is replaced by clear.py
+        # and by re-ingestion into a cleared namespace, so the open handle is
+        # checked against the file on disk
+        path = dedup_path(namespace)
+        try:
+            stat = os.stat(path)
+            current = (path, stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            current = None
+        if current != self._deduper_file:
+            if self._deduper is not None:
+                self._deduper.close()
+            self._deduper = ChunkDeduper(path, check_same_thread=False) if current is not None else None
+            self._deduper_file = current
+        return self._deduper
+
+    def _ensure_embedding_model(self):
+        if self._embedding_model is None:
+            with self._lock:
+                if self._embedding_model is None:
+                    self._embedding_model = OllamaEmbeddings(model=self.model)
+        return self._embedding_model
+
+    def _ensure_loaded(self):
+        self._check_namespace()
+        if self._db is None:
+            embedding_model = self._ensure_embedding_model()
+            with self._lock:
+                if self._db is None:
+                    self._db = Chroma(
+                        persist_directory=self.persist_directory,
+                        collection_name=collection_name(self._namespace),
+                        embedding_function=embedding_model
+                    )
+        return self._db
+
+    def embed_query(self, query: str) -> List[float]:
+        embedding_model = self._ensure_embedding_model()
+        with self._lock:
+            if query in self._query_cache:
+                self._query_cache.move_to_end(query)
+                return self._query_cache[query]
+
+        # Embed outside the lock so concurrent searches don't queue behind each other
+        with span(self.model, "embedding", texts=1, cache_hit=False):
+            vector = embedding_model.embed_query(query)
+        with self._lock:
+            self._query_cache[query] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embedding_model = self._ensure_embedding_model()
+        with span(self.model, "embedding", texts=len(texts)):
+            return embedding_model.embed_documents(texts)
+
+    def search(self, query: str, k: int = 5, metadata_filter: Optional[Dict] = None, mode: str = "vector",
+               vector_results: Optional[List[Dict]] = None) -> List[Dict]:
+        """
+        Search the store.
+        
+        Args:
+            query (str): Search text
+            k (int): Number of results
+            metadata_filter (dict): Chroma where filter on chunk metadata
+            mode (str): "vector" for dense search (score is a distance, lower
+                is closer), "lexical" for BM25 (score is BM25, higher is
+                better) or "hybrid" for both fused with reciprocal rank fusion
+                (score is the fused score, higher is better)
+            vector_results (list): Results of a vector search for the same
+                query and filter, k * HYBRID_DEPTH deep, used as the dense half
+                of a hybrid search instead of searching again
+        
+        A result standing in for near-duplicate chunks elsewhere in the corpus
+        lists their metadata under "references", and a search filtered to a
+        doc_id also matches a stored chunk through the metadata of the chunks
+        it stands for.
+        """
+        namespace = self._check_namespace()
+        with self._deduper_lock:
+            deduper = self._open_deduper(namespace)
+            if deduper is None:
+                return self._search(query, k, metadata_filter, mode, vector_results)
+            if metadata_filter:
+                collapsed = deduper.matching_chunks(metadata_filter)
+                if collapsed:
+                    metadata_filter = {"$or": [metadata_filter, {"chunk_id": {"$in": collapsed}}]}
+
+        results = self._search(query, k, metadata_filter, mode, vector_results)
+        chunk_ids = [r["metadata"].get("chunk_id") for r in results if r["metadata"].get("chunk_id")]
+        with self._deduper_lock:
+            deduper = self._open_deduper(namespace)
+            references = deduper.references(chunk_ids) if deduper is not None else {}
+        if references:
+            for result in results:
+                own = (result["metadata"].get("doc_id"), result["metadata"].get("page"))
+                others = [ref for ref in references.get(result["metadata"].get("chunk_id"), [])
+                          if (ref.get("doc_id"), ref.get("page")) != own]
+                if others:
+                    result["references"] = others
+        return results
+
+    def _search(self, query, k, metadata_filter, mode, vector_results=None):
+        if mode == "lexical":
+            return self.lexical_index.search(query, k=k, metadata_filter=metadata_filter)
+        if mode == "hybrid":
+            depth = k * HYBRID_DEPTH
+            if vector_results is None:
+                vector_results = self._search(query, depth if self.lexical_index.exists() else k, metadata_filter, "vector")
+            if not self.lexical_index.exists():
+                return vector_results[:k]
+            return reciprocal_rank_fusion([
+                vector_results,
+                self.lexical_index.search(query, k=depth, metadata_filter=metadata_filter)
+            ], k=k)
+
+        vector = self.embed_query(query)
+        # Opening Chroma for a quantized namespace would create an empty collection in it
+        if self.quantized_index.exists():
+            return self.quantized_index.search(vector, k=k, metadata_filter=metadata_filter)
+        results = self._ensure_loaded().similarity_search_by_vector_with_relevance_scores(
+            embedding=vector,
+            k=k,
+            filter=metadata_filter or None
+        )
+        return [
+            {"content": doc.page_content, "metadata": doc.metadata, "score": score}
+            for doc, score in results
+        ]
+
+_services = {}
+_services_lock = threading.Lock()
+
+def get_retrieval_service(persist_directory="./text_embeddings") -> RetrievalService:
+    """
+    Return the process-wide RetrievalService for a persist directory, creating it on first use.
+    """
+    with _services_lock:
+        if persist_directory not in _services:
+            _services[persist_directory] = RetrievalService(persist_directory=persist_directory)
+        return _services[persist_directory]
@@ -0,0 +1,151 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+def table_profile(table_name, table):
+    """
+    The text a table is embedded as: where it came from, the text around it
+    on the page, its columns and a few sample rows.
+    """
+    parts = [f"Table {table_name}"]
+    if table.get("source"):
+        parts.append(f"from {table['source']} page {table.get('page')}")
+    if table.get("context"):
+        parts.append(f"about {table['context']}")
+    parts.append(f"with columns {', '.join(table['columns'])}")
+    if table.get("sample"):
+        parts.append("sample rows " + "; ".join(", ".join(row) for row in table["sample"]))
+    return " ".join(parts)
+
+class TableIndex:
+    """
+    Embeddings of the tables in a namespace's schema catalog, so a question
+    can be matched to the few tables that may answer it instead of showing
+    the whole schema. Vectors are kept in a SQLite file and held in memory
+    as one matrix, so a lookup is a single matrix-vector product.
+
+    Args:
+        path (str): SQLite file the vectors are kept in
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._names = []
+        self._matrix = None
+        self._loaded_mtime = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("CREATE TABLE IF NOT EXISTS tables (name TEXT PRIMARY KEY, profile_hash TEXT NOT NULL, vector BLOB NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        return conn
+
+    def generation(self):
+        if not self.exists():
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def sync(self, tables, embed_documents, generation):
+        """
+        Bring the index in line with a schema catalog: tables whose profile
+        changed are re-embedded and tables no longer in the catalog removed.
+
+        Args:
+            tables (dict): The catalog's tables
+            embed_documents: Function embedding a list of texts
+            generation (int): Catalog generation the index now matches
+
+        Returns:
+            tuple: (tables embedded, tables removed)
+        """
+        profiles = {name: table_profile(name, table) for name, table in tables.items()}
+        hashes = {name: hashlib.sha256(profile.encode("utf-8")).hexdigest() for name, profile in profiles.items()}
+        with self._lock:
+            conn = self._connect()
+            try:
+                stored = dict(conn.execute("SELECT name, profile_hash FROM tables"))
+                changed = [name for name in sorted(profiles) if stored.get(name) != hashes[name]]
+                removed = [name for name in stored if name not in profiles]
+                vectors = embed_documents([profiles[name] for name in changed]) if changed else []
+                with conn:
+                    conn.executemany("DELETE FROM tables WHERE name = ?", [(name,) for name in removed])
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO tables (name, profile_hash, vector) VALUES (?, ?, ?)",
+                        [(name, hashes[name], np.asarray(vector, dtype=np.float32).tobytes())
+                         for name, vector in zip(changed, vectors)]
+                    )
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('generation', ?)", (generation,))
+            finally:
+                conn.close()
+        return len(changed), len(removed)
+
+    def _load(self):
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._loaded_mtime:
+            return
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT name, vector FROM tables ORDER BY name").fetchall()
+        finally:
+            conn.close()
+        self._names = [name for name, _ in rows]
+        if rows:
+            matrix = np.stack([np.frombuffer(vector, dtype=np.float32) for _, vector in rows])
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.where(norms == 0, 1, norms)
+        else:
+            self._matrix = None
+        self._loaded_mtime = mtime
+
+    def search(self, query_vector, k=5, names=None):
+        """
+        Rank tables by cosine similarity to a question's embedding.
+
+        Args:
+            query_vector (list): Embedding of the question
+            k (int): Number of tables returned
+            names (collection): Only rank these tables, e.g. those in the current catalog
+
+        Returns:
+            list: (score, table name) pairs, best first
+        """
+        if not self.exists():
+            return []
+        with self._lock:
+            self._load()
+            table_names, matrix = self._names, self._matrix
+        if matrix is None:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1))
+        ranked = []
+        for row in np.argsort(-scores):
+            if names is None or table_names[row] in names:
+                ranked.append((float(scores[row]), table_names[row]))
+                if len(ranked) == k:
+                    break
+        return ranked
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_table_index(path) -> TableIndex:
+    """
+    Return the process-wide TableIndex for a file, creating it on first use.
+    """
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = TableIndex(path)
+        return _indexes[path]
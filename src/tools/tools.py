@@ -1,65 +1,123 @@
-import pyodbc
-from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
 from typing import List, Dict, Optional
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tools.retrieval import get_retrieval_service
+from tools.db import connection_string, get_pool
+from tools.catalog import (current_generation, active_namespace, schema_name, load_schema_catalog,
+                           format_schema_catalog, table_index_path)
+from tools.table_index import get_table_index
+from tools.context_packer import pack_context
+from tools.tracing import traced, annotate
 
+@traced("db")
 def list_tables_and_columns(
     db_server: str = "localhost",
     db_database: str = "table_db",
     db_user: str = "admin",
     db_password: str = "admin",
     db_port: int = 5432,
-    driver: str = "PostgreSQL"
+    driver: str = "PostgreSQL",
+    exact_counts: bool = False,
+    schema: Optional[str] = None
 ) -> str:
+    """
+    Describe every table in the schema (by default the active namespace's)
+    with its columns and row count.
+    
+    Tables and columns come from a single catalog query and row counts are
+    the planner's pg_class.reltuples estimates unless exact_counts is set,
+    in which case all tables are counted in one extra UNION ALL query.
+    """
     try:
-        conn_str = (
-            f"DRIVER={{{driver}}};"
-            f"SERVER={db_server};"
-            f"DATABASE={db_database};"
-            f"UID={db_user};"
-            f"PWD={db_password};"
-            f"PORT={db_port};"
-        )
-
-        conn = pyodbc.connect(conn_str)
-        cursor = conn.cursor()
-
-        # Get all user tables in public schema
-        cursor.execute("""
-            SELECT table_name
-            FROM information_schema.tables
-            WHERE table_schema = 'public' AND table_type = 'BASE TABLE';
-        """)
-
-        tables = cursor.fetchall()
-        output = []
+        schema = schema or schema_name(active_namespace())
+        conn_str = connection_string(db_server, db_database, db_user, db_password, db_port, driver)
 
-        for (table_name,) in tables:
-            output.append(f"\n📄 Table: {table_name}")
+        with get_pool(conn_str).connection() as conn:
+            cursor = conn.cursor()
+
+            # All user tables in the schema with their columns, in one round-trip
+            cursor.execute("""
+                SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod), c.reltuples
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                JOIN pg_attribute a ON a.attrelid = c.oid
+                WHERE n.nspname = ? AND c.relkind IN ('r', 'p')
+                  AND a.attnum > 0 AND NOT a.attisdropped
+                ORDER BY c.relname, a.attnum;
+            """, schema)
 
-            # Get column names + types
-            cursor.execute(f"""
-                SELECT column_name, data_type
-                FROM information_schema.columns
-                WHERE table_name = '{table_name}' AND table_schema = 'public';
-            """)
-            columns = cursor.fetchall()
-            for col_name, data_type in columns:
+            tables = {}
+            for table_name, col_name, data_type, reltuples in cursor.fetchall():
+                table = tables.setdefault(table_name, {"columns": [], "estimate": reltuples})
+                table["columns"].append((col_name, data_type))
+
+            counts = {}
+            if exact_counts and tables:
+                count_sql = " UNION ALL ".join(
+                    f"SELECT '{name}', COUNT(*) FROM \"{schema}\".\"{name}\"" for name in tables
+                )
+                cursor.execute(count_sql)
+                counts = dict(cursor.fetchall())
+            cursor.close()
+
+        output = []
+        for table_name, table in tables.items():
+            output.append(f"\n📄 Table: {table_name}")
+            for col_name, data_type in table["columns"]:
                 output.append(f"   - {col_name} ({data_type})")
 
             # Row count
-            cursor.execute(f'SELECT COUNT(*) FROM public."{table_name}";')
-            row_count = cursor.fetchone()[0]
-            output.append(f"   → Row count: {row_count}")
+            if table_name in counts:
+                output.append(f"   → Row count: {counts[table_name]}")
+            elif table["estimate"] is not None and table["estimate"] >= 0:
+                output.append(f"   → Row count: ~{int(table['estimate'])} (estimate)")
+            else:
+                output.append("   → Row count: unknown (not analyzed yet)")
 
-        cursor.close()
-        conn.close()
         return "\n".join(output) or "No tables found."
 
     except Exception as e:
         return f"Error listing tables and columns: {e}"
 
 
+# Results of read-only queries for the current ingestion generation
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+QUERY_CACHE_SIZE = 256
+
+WRITE_KEYWORDS = re.compile(r"\b(insert|update|delete|drop|alter|create|truncate|grant|revoke|copy|vacuum|call)\b", re.IGNORECASE)
+
+def is_read_only(query: str) -> bool:
+    statement = query.strip().rstrip(";")
+    return (
+        re.match(r"^(select|with|show|explain)\b", statement, re.IGNORECASE) is not None
+        and ";" not in statement
+        and not WRITE_KEYWORDS.search(statement)
+    )
+
+def count_rows(conn, query: str) -> Optional[int]:
+    """
+    Count the rows a read-only SELECT returns, under the transaction's
+    statement timeout. Returns None when the query can't be counted safely
+    or the count fails or times out.
+    """
+    statement = query.strip().rstrip(";")
+    if not is_read_only(statement) or not re.match(r"^(select|with)\b", statement, re.IGNORECASE):
+        return None
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM ({statement}) q")
+        return int(cursor.fetchone()[0])
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+
+@traced("db")
 def query_db(
     query: str,
     db_server: str = "localhost",
@@ -67,75 +125,166 @@ def query_db(
     db_user: str = "admin",
     db_password: str = "admin",
     db_port: int = 5432,
-    driver: str = "PostgreSQL"
+    driver: str = "PostgreSQL",
+    max_rows: int = 200,
+    max_bytes: int = 16000,
+    fetch_size: int = 100,
+    timeout_seconds: int = 30,
+    use_cache: bool = True
 ) -> str:
+    """
+    Run a query and return its rows as text, one row per line.
+    
+    Rows are fetched in batches of fetch_size and only the first max_rows, up
+    to max_bytes of text, are returned; fetching stops there, so a large
+    result is never read in full, and a note with the total row count (from a
+    COUNT(*) under the same timeout) is appended so the agent knows to
+    narrow the query. Statements are cancelled after timeout_seconds. Results of
+    read-only queries are cached until the next ingestion generation.
+    Unqualified table names resolve in the active namespace's schema.
+    """
     try:
         query = query.strip()
+        conn_str = connection_string(db_server, db_database, db_user, db_password, db_port, driver, fetch_size)
+        # The same SQL against another database or as another user is another result
+        cache_key = (current_generation(), conn_str, query, max_rows, max_bytes)
+        cacheable = use_cache and is_read_only(query)
+        if cacheable:
+            with _query_cache_lock:
+                if cache_key in _query_cache:
+                    _query_cache.move_to_end(cache_key)
+                    annotate(cache_hit=True)
+                    return _query_cache[cache_key]
 
-        # Construct PostgreSQL ODBC connection string
-        conn_str = (
-            f"DRIVER={{{driver}}};"
-            f"SERVER={db_server};"
-            f"DATABASE={db_database};"
-            f"UID={db_user};"
-            f"PWD={db_password};"
-            f"PORT={db_port};"
-        )
-
-        conn = pyodbc.connect(conn_str)
-        cursor = conn.cursor()
+        lines = []
+        size = 0
+        truncated = False
+        total = None
+        with get_pool(conn_str).connection() as conn:
+            cursor = conn.cursor()
+            # SET LOCAL only lasts for this transaction, which the pool rolls back on release
+            cursor.execute(f"SET LOCAL statement_timeout = {int(timeout_seconds * 1000)}")
+            cursor.execute(f'SET LOCAL search_path TO "{schema_name(active_namespace())}", public')
+            cursor.execute(query)
+            if cursor.description is not None:
+                while not truncated:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        line = ", ".join(str(cell) for cell in row)
+                        if len(lines) >= max_rows or size + len(line) > max_bytes:
+                            truncated = True
+                            break
+                        lines.append(line)
+                        size += len(line) + 1
+            cursor.close()
+            if truncated:
+                total = count_rows(conn, query)
 
-        cursor.execute(query)
-        results = cursor.fetchall()
+        annotate(cache_hit=False, returned_rows=len(lines), truncated=truncated, total_rows=total)
 
         # Format results as a string
-        formatted = "\n".join(
-            ", ".join(str(cell) for cell in row) for row in results
-        )
+        formatted = "\n".join(lines)
+        if truncated:
+            # Without a count, the row that didn't fit is all we know of the rest
+            of_total = total if total is not None else f"at least {len(lines) + 1}"
+            formatted += f"\n... showing {len(lines)} of {of_total} rows. Narrow the query (WHERE, LIMIT or aggregates) or count the rows with COUNT(*)."
+        formatted = formatted or "Query executed with no returned rows."
 
-        cursor.close()
-        conn.close()
-        return formatted or "Query executed with no returned rows."
+        if cacheable:
+            with _query_cache_lock:
+                _query_cache[cache_key] = formatted
+                while len(_query_cache) > QUERY_CACHE_SIZE:
+                    _query_cache.popitem(last=False)
+        return formatted
 
     except Exception as e:
         return f"Query error: {e}"
 
 
+def rank_tables(query: str, catalog: Dict, k: int = 5, persist_directory: str = "./text_embeddings") -> List:
+    """
+    Rank the catalog's tables against a question with the table index built
+    at ingestion. An index from an older generation is synced to the catalog
+    first, which only embeds tables that changed.
+    
+    Returns:
+        list: (cosine similarity, table name) pairs, best first
+    """
+    retrieval = get_retrieval_service(persist_directory)
+    index = get_table_index(table_index_path(active_namespace()))
+    if index.generation() != catalog["generation"]:
+        index.sync(catalog["tables"], retrieval.embed_documents, catalog["generation"])
+    return index.search(retrieval.embed_query(query), k=k, names=catalog["tables"])
+
+
+@traced("tool")
+def find_tables(query: str, k: int = 5, persist_directory: str = "./text_embeddings") -> str:
+    """
+    Find the k extracted tables most likely to answer a question and describe
+    them: columns, row count, the PDF page they came from, the text around
+    them and a few sample rows. Falls back to listing every table when no
+    schema catalog has been built for the current generation.
+    """
+    catalog = load_schema_catalog()
+    if catalog is None:
+        annotate(catalog=False)
+        return list_tables_and_columns()
+    ranked = rank_tables(query, catalog, k=k, persist_directory=persist_directory)
+    annotate(catalog=True, tables=len(catalog["tables"]), returned=len(ranked))
+    if not ranked:
+        return "No tables found."
+    order = [name for _, name in ranked]
+    return format_schema_catalog({"tables": {name: catalog["tables"][name] for name in order}}, details=True, order=order)
+
+
+@traced("tool")
 def similarity_search(
     query: str,
     persist_directory: str = "./text_embeddings",
     k: int = 5,
-    metadata_filter: Optional[Dict] = None
+    metadata_filter: Optional[Dict] = None,
+    mode: str = "hybrid"
 ) -> List[Dict]:
-    embedding_model = OllamaEmbeddings(model="nomic-embed-text")
-    db = Chroma(
-        persist_directory=persist_directory,
-        embedding_function=embedding_model
-    )
-    if metadata_filter:
-        results = db.similarity_search_with_score(
-            query=query,
-            k=k,
-            filter=metadata_filter
-        )
-    else:
-        results = db.similarity_search_with_score(
-            query=query,
-            k=k
-        )
-    formatted_results = []
-    for doc, score in results:
-        formatted_results.append({
-            "content": doc.page_content,
-            "metadata": doc.metadata,
-            "score": score
-        })
+    """
+    Search the vector store for the chunks closest to the query.
+    
+    Every chunk carries source (PDF file name), doc_id, page, bbox and kind
+    ("text" or "image") metadata, so metadata_filter can scope the search, e.g.
+    {"doc_id": "test1"} or {"$and": [{"doc_id": "test1"}, {"page": 3}]}.
+    The store and embedding client are shared across calls, see tools.retrieval.
     
-    return formatted_results
+    By default dense results are fused with a BM25 index over the same chunks
+    (mode="hybrid") so exact product codes and part numbers are found too;
+    mode can also be "vector" or "lexical".
+    """
+    return get_retrieval_service(persist_directory).search(query, k=k, metadata_filter=metadata_filter, mode=mode)
+
+
+@traced("tool")
+def retrieve_context(
+    query: str,
+    persist_directory: str = "./text_embeddings",
+    k: int = 10,
+    token_budget: int = 1500,
+    mode: str = "hybrid"
+) -> str:
+    """
+    Search the vector store and return the results packed into one block of
+    context: overlapping chunks from the same page are merged, near-duplicates
+    dropped and the best passages kept up to token_budget (approximate)
+    tokens, each labelled with the PDF and page it came from.
+    """
+    packed = pack_context(similarity_search(query, persist_directory=persist_directory, k=k, mode=mode),
+                          token_budget=token_budget)
+    annotate(context_tokens=packed["tokens"], passages=packed["passages"], merged=packed["merged"],
+             duplicates=packed["duplicates"], left_out=packed["left_out"])
+    return packed["text"] or "No relevant information found."
 
 
 if __name__ == "__main__":
     #list_tables_and_columns()
     #print(query_db("SELECT * FROM public.table_1;"))
     #print(similarity_search("eggs", k=1))
-    pass
\ No newline at end of file
+    pass
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+TRACE_PATH = os.path.join("./index_state", "traces.jsonl")
+# Past this size the trace file is rotated to traces.jsonl.1, replacing the previous one
+TRACE_MAX_BYTES = 50 * 1024 * 1024
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    def __init__(self, name, kind, parent=None, **attributes):
+        self.name = name
+        self.kind = kind
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.attributes = dict(attributes)
+        self.children = []
+        self.start = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        if parent is not None:
+            with _lock:
+                parent.children.append(self)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, amount=1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes
+        }
+
+    def walk(self, depth=0):
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+_lock = threading.Lock()
+_config = {"enabled": True, "path": TRACE_PATH, "max_bytes": TRACE_MAX_BYTES}
+
+def configure(enabled=True, path=TRACE_PATH, max_bytes=TRACE_MAX_BYTES):
+    """
+    Turn tracing on or off, choose the JSON lines file traces are appended to
+    and the size it is rotated at.
+    """
+    _config["enabled"] = enabled
+    _config["path"] = path
+    _config["max_bytes"] = max_bytes
+
+def current_span():
+    return _current_span.get()
+
+@contextmanager
+def span(name, kind="internal", **attributes):
+    """
+    Record a span around a block. Spans opened inside it (in this thread or
+    in tasks and threads started with a copy of the context) become its
+    children. When a root span of kind query ends its whole trace is
+    written out; calls made outside a question are timed but not kept.
+    
+    Args:
+        name (str): What is being timed, e.g. the tool or model name
+        kind (str): One of query, agent, tool, llm, embedding, db or internal
+        **attributes: Extra values recorded on the span
+    """
+    if not _config["enabled"]:
+        yield None
+        return
+    parent = _current_span.get()
+    current = Span(name, kind, parent=parent, **attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=str(e))
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+        if parent is None and current.kind == "query":
+            export(current)
+
+def traced(kind, name=None):
+    """
+    Decorator that records every call of a function as a span.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def annotate(**attributes):
+    """
+    Add attributes to the current span, if there is one.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+def export(root):
+    path = _config["path"]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _lock:
+        # Keep a long-running server from growing the file without bound
+        if os.path.exists(path) and os.path.getsize(path) >= _config["max_bytes"]:
+            os.replace(path, f"{path}.1")
+        with open(path, "a", encoding="utf-8") as f:
+            for _, item in root.walk():
+                f.write(json.dumps(item.to_dict(), default=str) + "\n")
+
+def format_trace(root, width=30):
+    """
+    Render a trace as an indented, flame-style breakdown: one line per span
+    with its duration, a bar scaled to the root's duration and its attributes.
+    """
+    total = root.duration or 1e-9
+    lines = []
+    for depth, item in root.walk():
+        duration = item.duration or 0.0
+        bar = "█" * max(1, round(width * duration / total))
+        attributes = " ".join(f"{k}={v}" for k, v in item.attributes.items())
+        lines.append(f"{'  ' * depth}{item.kind}:{item.name:<{max(1, 40 - 2 * depth)}} {duration * 1000:9.1f} ms {bar} {attributes}".rstrip())
+    return "\n".join(lines)
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that turns LLM calls into spans (with prompt
+    size and token counts) and counts agent steps and retries on the
+    enclosing span.
+    """
+
+    # Run in the caller's thread so spans see the caller's context
+    run_inline = True
+
+    def __init__(self):
+        self._spans = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        if not _config["enabled"]:
+            return
+        model = (serialized or {}).get("kwargs", {}).get("model", "llm")
+        self._spans[run_id] = Span(model, "llm", parent=_current_span.get(),
+                                   prompt_chars=sum(len(p) for p in prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        current = self._spans.pop(run_id, None)
+        if current is None:
+            return
+        current.finish()
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                # Ollama reports token counts in the generation info
+                if "prompt_eval_count" in info:
+                    current.add("prompt_tokens", info["prompt_eval_count"] or 0)
+                if "eval_count" in info:
+                    current.add("completion_tokens", info["eval_count"] or 0)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        current = self._spans.pop(run_id, None)
+        if current is not None:
+            current.set(error=str(error))
+            current.finish()
+
+    def on_agent_action(self, action, **kwargs):
+        current = _current_span.get()
+        if current is not None:
+            current.add("agent_steps")
+
+    def on_retry(self, retry_state, **kwargs):
+        current = _current_span.get()
+        if current is not None:
+            current.add("retries")
+
+tracing_handler = TracingCallbackHandler()
+
+def tracing_config():
+    """
+    LangChain run config that records LLM calls and agent steps as spans.
+    """
+    return {"callbacks": [tracing_handler]}